@@ -0,0 +1,336 @@
+import random
+from typing import Iterable, Optional, Tuple
+
+from backend.aftershock_generate import AftershockState, aftershock_step, _clamp01
+from backend.grid import Grid, as_grid, is_grid_like
+from backend.wire import encode_grid, response_format
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 NumPy 时逐 tick 调用 aftershock_step
+    np = None
+
+# 多 tick 快进的余震引擎（离线场景研究用）：一次调用推进 N 个 tick，随机数可由 seed 复现。
+# 模型与 aftershock_step 相同（寿命、生成间隔、扩张与成簇规模的参数一致），但 NumPy 版以数组运算实现：
+# - 到期：按 tick 分桶，每 tick 对当期桶内的格整体恢复；
+# - 扩张：从全部动态障碍中抽 tries 个，各自向空闲邻格扩张；
+# - 成簇：从种子随机渗流，每层由新到达格向四邻传播，
+#   邻格被 k 个新到达格指向时以 1-(1-bias)^k 的概率到达（与逐格 DFS 中每次压栈以 bias 概率发生一致），
+#   到达格中可激活的（空格或已是动态障碍）计入簇，凑满目标即停。
+# 两种实现的参数与每次生成的格数一致；逐层渗流得到的簇比逐格 DFS 更紧凑，扩张次数偏少，同一 seed 下逐格结果也不同。
+# 输出可选：final（只要最终栅格）、checkpoints（每 every 个 tick 一帧）、deltas（每 tick 的置 1 / 置 0 下标）。
+
+MAX_TICKS = 10000
+MAX_FRAMES = 1000
+OUTPUTS = ('final', 'checkpoints', 'deltas')
+
+
+def _life(base_life_ticks: int, u: float) -> int:
+    return int(base_life_ticks * (0.8 + 0.4 * u))
+
+
+class _NumpyEngine:
+    """
+    以带外圈的扁平数组保存栅格、动态标记、到期 tick 与原值（prev=1 的动态格到期后保持为障碍），
+    下标 (r+1)*(m+2)+c+1；外圈视为障碍且受保护，渗流与扩张不会越界。
+    到期用按 tick 分桶的时间轮：激活时把格放入 until 对应的桶，每 tick 只检查当期桶内的格。
+    """
+
+    def __init__(self, grid: Grid, state: AftershockState, seed, protect):
+        n, m = grid.shape
+        self.n, self.m = n, m
+        self.w = w = m + 2
+        size = (n + 2) * w
+        self.rng = np.random.default_rng(seed)
+        self.grid = np.ones(size, dtype=bool)
+        self._inner(self.grid)[:] = np.frombuffer(bytes(grid.data), dtype=np.uint8).reshape(n, m).astype(bool)
+        self.active = np.zeros(size, dtype=bool)
+        self.until = np.zeros(size, dtype=np.int64)
+        self.keep = np.zeros(size, dtype=bool)
+        self.protect = np.ones(size, dtype=bool)
+        self._inner(self.protect)[:] = False
+        for r, c in protect:
+            self.protect[(r + 1) * w + c + 1] = True
+        self.reached = self.protect.copy()  # 渗流的已到达标记（外圈预置为已到达），用后逐格清零
+        self._inner(self.reached)[:] = False
+        self.offsets = np.array([w, -w, 1, -1])
+        self.wheel = {}
+        self.log = None
+        self.tick = state.tick
+        self.last_spawn_tick = state.last_spawn_tick
+        act = state.active
+        if len(act):
+            r = np.frombuffer(act.r, dtype=np.int32).astype(np.int64)
+            c = np.frombuffer(act.c, dtype=np.int32).astype(np.int64)
+            ok = (r >= 0) & (r < n) & (c >= 0) & (c < m)
+            p = ((r + 1) * w + c + 1)[ok]
+            until = np.frombuffer(act.until, dtype=np.int32).astype(np.int64)[ok]
+            self.active[p] = True
+            self.until[p] = until
+            self.keep[p] = np.frombuffer(bytes(act.prev), dtype=np.uint8)[ok].astype(bool)
+            self.grid[p] = True
+            # 已过期的放入当前 tick 的桶
+            due = np.maximum(until, self.tick)
+            for u in np.unique(due).tolist():
+                self.wheel.setdefault(u, []).append(p[due == u])
+
+    def _inner(self, arr):
+        return arr.reshape(self.n + 2, self.w)[1:-1, 1:-1]
+
+    def _record(self, p):
+        if self.log is not None:
+            self.log.append((p, self.grid[p]))
+
+    def _activate(self, p, until: int):
+        """p 中的格成为动态障碍；已是动态障碍的只延长寿命、保留原值。"""
+        self._record(p)
+        u = np.where(self.active[p], np.maximum(self.until[p], until), until)
+        self.until[p] = u
+        self.active[p] = True
+        self.grid[p] = True
+        moved = p[u == until]
+        if moved.size:
+            # 寿命为 0 时 until 等于当前 tick，而当期的桶已在 step 开头取走，放入下一 tick 的桶
+            self.wheel.setdefault(max(until, self.tick + 1), []).append(moved)
+
+    def _expire(self, tick: int) -> int:
+        bucket = self.wheel.pop(tick, None)
+        if not bucket:
+            return 0
+        p = np.unique(np.concatenate(bucket))
+        # 桶中可能有已延长寿命或已恢复的过时项
+        p = p[self.active[p] & (self.until[p] <= tick)]
+        if p.size:
+            self._record(p)
+            self.active[p] = False
+            self.grid[p] = self.keep[p]
+            self.keep[p] = False
+        return int(p.size)
+
+    def _eligible(self, p):
+        # 空格或已是动态障碍，且不受保护
+        return (~self.grid[p] | self.active[p]) & ~self.protect[p]
+
+    def _region_grow(self, p0: int, target: int, until: int, bias: float) -> int:
+        """从 p0 随机渗流，逐层只处理新到达格的四邻，代价与簇的规模成正比。"""
+        rng = self.rng
+        reached = self.reached
+        accept_p = np.array([1.0 - (1.0 - bias) ** k for k in range(5)])
+        new = np.array([p0])
+        reached[p0] = True
+        seen = [new]
+        chosen = [new[self._eligible(new)]]
+        got = chosen[0].size
+        while got < target:
+            nb = (new[:, None] + self.offsets).ravel()
+            nb = nb[~reached[nb]]
+            if nb.size == 0:
+                break
+            cells, cnt = np.unique(nb, return_counts=True)
+            new = cells[rng.random(cells.size) < accept_p[cnt]]
+            if new.size == 0:
+                break
+            reached[new] = True
+            seen.append(new)
+            layer = new[self._eligible(new)]
+            if got + layer.size > target:
+                # 最后一层超出目标：随机保留所需数量
+                layer = rng.choice(layer, target - got, replace=False)
+            chosen.append(layer)
+            got += layer.size
+        for q in seen:
+            reached[q] = False
+        if got:
+            self._activate(np.concatenate(chosen), until)
+        return got
+
+    def step(self, interval_ticks: int, severity: float, base_life_ticks: int, stats: dict, want_delta: bool = False):
+        """推进一个 tick；want_delta 时返回 (置 1 下标, 置 0 下标)，下标为 r*m+c。"""
+        n, m, w = self.n, self.m, self.w
+        rng = self.rng
+        tick = self.tick
+        self.log = [] if want_delta else None
+        stats['expired'] += self._expire(tick)
+        if tick - self.last_spawn_tick >= interval_ticks:
+            live = np.flatnonzero(self.active)
+            if live.size:
+                tries = max(1, int(3 + 7 * severity))
+                grow_k = max(1, int(1 + 2 * severity))
+                g = self.grid; protect = self.protect
+                for p in rng.choice(live, min(tries, live.size), replace=False).tolist():
+                    left = grow_k
+                    for q in (p + w, p - w, p + 1, p - 1):
+                        if left <= 0:
+                            break
+                        if not g[q] and not protect[q]:
+                            self._activate(np.array([q]), tick + _life(base_life_ticks, rng.random()))
+                            stats['grown'] += 1
+                            left -= 1
+            target_area = max(1, int(severity * 0.003 * n * m))
+            clusters = max(1, int(1 + severity * 2))
+            per_cluster = max(1, target_area // clusters)
+            bias = 0.55 + 0.3 * severity
+            for _ in range(clusters):
+                sr = int(rng.integers(n)); sc = int(rng.integers(m))
+                life = _life(base_life_ticks, rng.random())
+                stats['spawned'] += self._region_grow((sr + 1) * w + sc + 1, per_cluster, tick + life, bias)
+            self.last_spawn_tick = tick
+        self.tick = tick + 1
+        if not want_delta:
+            return None
+        log, self.log = self.log, None
+        if not log:
+            return [], []
+        # 每格取首次写入前的值，与当前值比较
+        p, first = np.unique(np.concatenate([q for q, _ in log]), return_index=True)
+        old = np.concatenate([v for _, v in log])[first]
+        now = self.grid[p]
+        p = p[now != old]; now = now[now != old]
+        flat = (p // w - 1) * m + (p % w - 1)
+        return flat[now].tolist(), flat[~now].tolist()
+
+    def snapshot(self) -> Grid:
+        return Grid(self.n, self.m, bytearray(self._inner(self.grid).astype(np.uint8).tobytes()))
+
+    def state(self, interval_ticks: int) -> AftershockState:
+        st = AftershockState(self.m, self.tick, self.last_spawn_tick, interval_ticks)
+        p = np.flatnonzero(self.active)
+        rs = (p // self.w - 1).tolist(); cs = (p % self.w - 1).tolist()
+        for r, c, u, k in zip(rs, cs, self.until[p].tolist(), self.keep[p].tolist()):
+            st.active.add(r, c, u, k)
+        return st
+
+
+class _PythonEngine:
+    """无 NumPy 时的实现：逐 tick 调用 aftershock_step（同一 seed 可复现）。"""
+
+    def __init__(self, grid: Grid, state: AftershockState, seed, protect):
+        self.grid = grid.copy()
+        self.state_obj = state
+        self.rng = random.Random(seed)
+        self.protect = list(protect)
+        self.n, self.m = grid.shape
+        for i in range(len(state.active)):
+            self.grid.set(state.active.r[i], state.active.c[i], 1)
+
+    @property
+    def tick(self):
+        return self.state_obj.tick
+
+    def step(self, interval_ticks: int, severity: float, base_life_ticks: int, stats: dict, want_delta: bool = False):
+        touched = {}
+        res = aftershock_step(self.grid, interval_ticks, severity, self.state_obj, touched, self.rng)
+        for r, c in self.protect:
+            touched.setdefault((r, c), self.grid.get(r, c))
+            self.grid.set(r, c, 0)
+        self.grid.touch()
+        for key in ('expired', 'spawned', 'grown'):
+            stats[key] += res['stats'][key]
+        if not want_delta:
+            return None
+        # 只在本 tick 写过的格中求变化
+        g = self.grid; m = self.m
+        on = []; off = []
+        for (r, c), old in sorted(touched.items()):
+            v = g.get(r, c)
+            if v != old:
+                (on if v else off).append(r * m + c)
+        return on, off
+
+    def snapshot(self) -> Grid:
+        return self.grid.copy()
+
+    def state(self, interval_ticks: int) -> AftershockState:
+        return self.state_obj
+
+
+def advance(grid: Grid, ticks: int, interval_ticks, severity, seed=None, state=None,
+            protect: Iterable[Tuple[int, int]] = (), output: str = 'final', every: int = 1,
+            use_numpy: Optional[bool] = None) -> dict:
+    """
+    从 state 出发推进 ticks 个 tick，返回 { grid, state, tick, stats, engine, frames?, deltas? }：
+    - frames：[(tick, Grid)]，output 为 checkpoints 时每 every 个 tick（及最后一个 tick）一帧；
+    - deltas：[{tick, on, off}]，output 为 deltas 时每 tick 置 1 / 置 0 的扁平下标 r*m+c；
+    - protect 中的格（如起终点）不会被激活；use_numpy 为 None 时有 NumPy 即用。
+    """
+    if output not in OUTPUTS:
+        raise ValueError('invalid output')
+    severity = _clamp01(float(severity) if severity is not None else 0.0)
+    try:
+        interval_ticks = int(interval_ticks)
+    except Exception:
+        interval_ticks = 5
+    interval_ticks = max(1, interval_ticks)
+    base_life_ticks = int(interval_ticks * (1.5 + 1.0 * severity))
+    n, m = grid.shape
+    st = state if isinstance(state, AftershockState) else AftershockState.from_dict(state, n, m)
+    protect = [(r, c) for r, c in protect if 0 <= r < n and 0 <= c < m]
+    if use_numpy is None:
+        use_numpy = np is not None
+    eng = _NumpyEngine(grid, st, seed, protect) if use_numpy else _PythonEngine(grid, st, seed, protect)
+
+    stats = {'expired': 0, 'spawned': 0, 'grown': 0}
+    frames = []
+    deltas = []
+    for i in range(ticks):
+        delta = eng.step(interval_ticks, severity, base_life_ticks, stats, output == 'deltas')
+        if delta is not None:
+            on, off = delta
+            deltas.append({'tick': eng.tick, 'on': on, 'off': off})
+        elif output == 'checkpoints' and ((i + 1) % every == 0 or i + 1 == ticks):
+            frames.append((eng.tick, eng.snapshot()))
+    out = {
+        'grid': eng.snapshot(),
+        'state': eng.state(interval_ticks),
+        'tick': eng.tick,
+        'stats': stats,
+        'engine': 'numpy' if use_numpy else 'python'
+    }
+    if output == 'checkpoints':
+        out['frames'] = frames
+    elif output == 'deltas':
+        out['deltas'] = deltas
+    return out
+
+
+def advance_service(data):
+    """
+    /api/aftershock-advance：{ grid, ticks, intervalTicks, severity, seed, aftershockState, start, goal, output, every }。
+    帧按 gridFormat 编码（缺省 rle）；回传的 aftershockState 为紧凑形式，可直接用于下一次快进或 dynamic-step。
+    """
+    grid = data.get('grid')
+    if not is_grid_like(grid):
+        raise ValueError('invalid grid')
+    grid = as_grid(grid)
+    try:
+        ticks = int(data['ticks'] if data.get('ticks') is not None else 1)
+        every = int(data['every'] if data.get('every') is not None else 1)
+        seed = data.get('seed')
+        seed = None if seed is None else int(seed)
+    except (TypeError, ValueError):
+        raise ValueError('invalid ticks/every/seed')
+    if not (1 <= ticks <= MAX_TICKS):
+        raise ValueError(f'ticks must be in 1..{MAX_TICKS}')
+    output = data.get('output') or 'final'
+    if output == 'checkpoints' and (every < 1 or ticks // every > MAX_FRAMES):
+        raise ValueError(f'every must keep frames <= {MAX_FRAMES}')
+    protect = []
+    for key in ('start', 'goal'):
+        p = data.get(key)
+        if isinstance(p, dict):
+            protect.append((int(p.get('r')), int(p.get('c'))))
+    res = advance(grid, ticks, data.get('intervalTicks'), data.get('severity'), seed,
+                  data.get('aftershockState'), protect, output, every)
+    fmt = response_format(data) or 'rle'
+    out = {
+        'grid': res['grid'],
+        'aftershockState': res['state'].to_dict(True),
+        'tick': res['tick'],
+        'stats': res['stats'],
+        'engine': res['engine']
+    }
+    if 'frames' in res:
+        out['frames'] = [{'tick': t, 'grid': encode_grid(g, fmt)} for t, g in res['frames']]
+    if 'deltas' in res:
+        out['deltas'] = res['deltas']
+    return out
@@ -1,44 +1,177 @@
+import base64
+import heapq
 import random
-from typing import Dict, Tuple
+import sys
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
 from backend.earthquake import neighbors
 
 def _clamp01(x):    # 约束在 [0,1]
     return 0.0 if x < 0.0 else (1.0 if x > 1.0 else x)
 
-def _rand_jitter(a, b):  # 在 [a,b] 范围内均匀扰动
-    return a + (b - a) * random.random()
+def _rand_jitter(a, b, rng=random):  # 在 [a,b] 范围内均匀扰动
+    return a + (b - a) * rng.random()
 
-# 激活单元格
-def _activate_cell(grid, r, c, until_tick, active_map):
+
+class ActiveCells:
+    """
+    动态障碍集合：
+    - r / c / until / prev 为稠密的并行数组，删除时与末尾交换，下标 0..len-1 始终有效；
+    - pos 为格键 r*m+c -> 数组下标；
+    - heap 为 (until, 格键) 的小根堆，延长寿命时压入新项、旧项出堆时发现 until 不符即丢弃（惰性删除），
+      因此每 tick 的到期处理只与实际到期（及过时）的项数成正比。
+    """
+
+    def __init__(self, m: int):
+        self.m = m
+        self.r = array('i')
+        self.c = array('i')
+        self.until = array('i')
+        self.prev = bytearray()
+        self.pos: Dict[int, int] = {}
+        self.heap = []
+
+    def __len__(self):
+        return len(self.r)
+
+    def __contains__(self, rc) -> bool:
+        return rc[0] * self.m + rc[1] in self.pos
+
+    def add(self, r: int, c: int, until: int, prev: int):
+        """加入或延长寿命（只延长不缩短）。"""
+        key = r * self.m + c
+        pos = self.pos
+        i = pos.get(key)
+        if i is not None:
+            if until > self.until[i]:
+                self.until[i] = until
+                heapq.heappush(self.heap, (until, key))
+            return
+        pos[key] = len(pos)
+        self.r.append(r); self.c.append(c); self.until.append(until); self.prev.append(1 if prev else 0)
+        heapq.heappush(self.heap, (until, key))
+
+    def expire(self, tick: int) -> Iterator[Tuple[int, int, int]]:
+        """弹出 until <= tick 的格，逐个产出 (r, c, prev)；删除时把末尾元素移入空位。"""
+        heap = self.heap; pos = self.pos; m = self.m
+        rs = self.r; cs = self.c; untils = self.until; prevs = self.prev
+        heappop = heapq.heappop
+        while heap and heap[0][0] <= tick:
+            until, key = heappop(heap)
+            i = pos.get(key)
+            if i is None or untils[i] != until:
+                continue  # 过时项：已到期或寿命已延长
+            r, c, prev = rs[i], cs[i], prevs[i]
+            del pos[key]
+            last = len(rs) - 1
+            if i != last:
+                rs[i] = lr = rs[last]; cs[i] = lc = cs[last]
+                untils[i] = untils[last]; prevs[i] = prevs[last]
+                pos[lr * m + lc] = i
+            rs.pop(); cs.pop(); untils.pop(); prevs.pop()
+            yield r, c, prev
+
+    def sample(self, k: int, rng=random):
+        """随机取 k 个动态障碍格 (r, c)，不枚举全体。"""
+        idx = rng.sample(range(len(self.r)), min(k, len(self.r)))
+        return [(self.r[i], self.c[i]) for i in idx]
+
+
+class AftershockState:
+    """余震状态：tick、上次生成时刻与动态障碍集合。服务端会话直接持有该对象，跨 tick 不做序列化。"""
+
+    def __init__(self, m: int, tick: int = 0, last_spawn_tick: int = -10**9, interval_ticks: int = 5):
+        self.tick = tick
+        self.last_spawn_tick = last_spawn_tick
+        self.interval_ticks = interval_ticks
+        self.active = ActiveCells(m)
+
+    @classmethod
+    def from_dict(cls, s: Optional[dict], n: int, m: int) -> 'AftershockState':
+        """
+        从客户端回传的状态恢复；兼容 active 列表与紧凑形式 activeB64。
+        坐标须落在 n×m 栅格内：activeB64 中越界视为非法状态（ValueError），active 列表中越界的记录跳过。
+        """
+        s = s or {}
+        last = s.get('lastSpawnTick')
+        st = cls(m, int(s.get('tick') or 0), -10**9 if last is None else int(last), int(s.get('intervalTicks') or 5))
+        act = st.active
+        if s.get('activeB64'):
+            try:
+                k = int(s.get('activeCount') or 0)
+                raw = base64.b64decode(s['activeB64'], validate=True)
+                cols = array('i')
+                cols.frombytes(raw[:12 * k])
+                if sys.byteorder == 'big':
+                    cols.byteswap()
+                prev = raw[12 * k:13 * k]
+            except Exception:
+                raise ValueError('invalid aftershock state')
+            if len(cols) != 3 * k or len(prev) != k:
+                raise ValueError('invalid aftershock state')
+            for i in range(k):
+                r, c = cols[i], cols[k + i]
+                if not (0 <= r < n and 0 <= c < m):
+                    raise ValueError('invalid aftershock state')
+                act.add(r, c, cols[2 * k + i], prev[i])
+            return st
+        for rec in s.get('active') or []:
+            try:
+                r = int(rec.get('r')); c = int(rec.get('c'))
+                until = int(rec.get('untilTick') if rec.get('untilTick') is not None else rec.get('until') or 0)
+                prev = int(rec.get('prev', 0))
+                if not (0 <= r < n and 0 <= c < m):
+                    continue
+                act.add(r, c, until, prev)
+            except Exception:
+                continue
+        return st
+
+    def to_dict(self, compact: bool = False) -> dict:
+        """
+        序列化为 JSON 对象。compact 时 activeB64 为 base64(r[k] + c[k] + until[k] 的小端 int32，再接 prev[k] 字节)，
+        否则为 active 列表 [{r, c, untilTick, prev}]。
+        """
+        out = {'tick': self.tick, 'lastSpawnTick': self.last_spawn_tick, 'intervalTicks': self.interval_ticks}
+        act = self.active
+        if compact:
+            cols = array('i', act.r)
+            cols.extend(act.c); cols.extend(act.until)
+            if sys.byteorder == 'big':
+                cols.byteswap()
+            out['activeCount'] = len(act)
+            out['activeB64'] = base64.b64encode(cols.tobytes() + bytes(act.prev)).decode('ascii')
+        else:
+            out['active'] = [{'r': act.r[i], 'c': act.c[i], 'untilTick': act.until[i], 'prev': act.prev[i]}
+                             for i in range(len(act))]
+        return out
+
+
+# 激活单元格（touched 非 None 时记录本 tick 首次写入前的原值，用于只对写过的格求变化）
+def _activate_cell(grid, r, c, until_tick, active, touched=None):
     n = len(grid)
     if r < 0 or r >= n or c < 0 or c >= n:
         return
-    key = (r,c)
     prev = grid[r][c]
-    if key in active_map:
-        if until_tick > active_map[key]['until']:
-            active_map[key]['until'] = until_tick
-        grid[r][c] = 1
-    else:
-        active_map[key] = {'r': r, 'c': c, 'until': until_tick, 'prev': int(prev)}
-        grid[r][c] = 1
-
-# 到期恢复
-def _expire_cells(grid, current_tick, active_map):
-    expired = []
-    for key, rec in active_map.items():
-        if rec['until'] <= current_tick:
-            expired.append(key)
-    for key in expired:
-        r, c = key
-        prev = active_map[key].get('prev', 0)
+    if touched is not None and (r,c) not in touched:
+        touched[(r,c)] = prev
+    # 已激活的格 prev 保持首次激活时的原值
+    active.add(r, c, until_tick, prev)
+    grid.set(r, c, 1)
+
+# 到期恢复：只处理堆顶到期的格
+def _expire_cells(grid, current_tick, active, touched=None):
+    expired = 0
+    for r, c, prev in active.expire(current_tick):
         if prev == 0:
-            grid[r][c] = 0
-        del active_map[key]
-    return len(expired)
+            if touched is not None and (r,c) not in touched:
+                touched[(r,c)] = grid[r][c]
+            grid.set(r, c, 0)
+        expired += 1
+    return expired
 
 # 区域生长
-def _region_grow(grid, seed_r, seed_c, target, until_tick, active_map, bias=0.6):
+def _region_grow(grid, seed_r, seed_c, target, until_tick, active, bias=0.6, touched=None, rng=random):
     n = len(grid)
     if seed_r < 0 or seed_r >= n or seed_c < 0 or seed_c >= n:
         return 0
@@ -50,16 +183,16 @@ def _region_grow(grid, seed_r, seed_c, target, until_tick, active_map, bias=0.6)
         if (r,c) in visited:
             continue
         visited.add((r,c))
-        if grid[r][c] == 0 or (r,c) in active_map:
-            _activate_cell(grid, r, c, until_tick, active_map)
+        if grid[r][c] == 0 or (r,c) in active:
+            _activate_cell(grid, r, c, until_tick, active, touched)
             added += 1
             target -= 1
         for nr, nc in neighbors(n, r, c):
-            if random.random() < bias:
+            if rng.random() < bias:
                 frontier.append((nr, nc))
     return added
 
-def aftershock_step(grid, interval_ticks, severity, state=None):
+def aftershock_step(grid, interval_ticks, severity, state=None, touched=None, rng=None):
     """
     逐步余震更新（纯 tick 驱动）：
     - 不做任何真实时间映射，所有时间单位均为 tick；
@@ -68,9 +201,13 @@ def aftershock_step(grid, interval_ticks, severity, state=None):
     - 达到生成时刻：
         * 让部分现有动态障碍向邻近扩张；
         * 生成若干新簇（规模与 n² 与 severity 成正比）。
-    - 返回 grid、state（含 active 列表）和统计。
-    """ 
+    - state 可为 AftershockState（原地推进）或客户端回传的 dict（见 AftershockState.from_dict）；
+    - touched（可选 dict）收集本 tick 写过的格 (r,c) -> 写入前的原值；
+    - rng（可选 random.Random）用于可复现的仿真，缺省为全局 random；
+    - 返回 grid、state（AftershockState，需要时用 to_dict 序列化）和统计。
+    """
     n = len(grid)
+    rng = rng or random
     severity = _clamp01(float(severity) if severity is not None else 0.0)
     try:
         interval_ticks = int(interval_ticks)
@@ -80,38 +217,25 @@ def aftershock_step(grid, interval_ticks, severity, state=None):
 
     base_life_ticks = int(interval_ticks * (1.5 + 1.0 * severity))
 
-    s = state or {}
-    tick = int(s.get('tick') or 0)
-    last_spawn_tick = int(s.get('lastSpawnTick') or -10**9)
-    active_list = s.get('active') or []
-    active_map: Dict[Tuple[int,int], Dict[str,int]] = {}
-    for rec in active_list:
-        try:
-            r = int(rec.get('r')); c = int(rec.get('c'))
-            until = int(rec.get('untilTick') if rec.get('untilTick') is not None else rec.get('until') or 0)
-            prev = int(rec.get('prev', 0))
-            active_map[(r,c)] = {'r': r, 'c': c, 'until': until, 'prev': prev}
-        except Exception:
-            continue
+    st = state if isinstance(state, AftershockState) else AftershockState.from_dict(state, n, len(grid[0]) if n else 0)
+    tick = st.tick
+    active = st.active
 
-    expired = _expire_cells(grid, tick, active_map) # 恢复到期（tick）
+    expired = _expire_cells(grid, tick, active, touched) # 恢复到期（tick）
     spawned = 0 # 新增
     grown = 0   # 扩张
 
-    if tick - last_spawn_tick >= interval_ticks:
-        if active_map:
+    if tick - st.last_spawn_tick >= interval_ticks:
+        if len(active):
             tries = max(1, int(3 + 7 * severity))
-            keys = list(active_map.keys())
-            random.shuffle(keys)
-            keys = keys[:min(len(keys), tries)]
-            for (r,c) in keys:
+            for (r,c) in active.sample(tries, rng):
                 grow_k = max(1, int(1 + 2 * severity))
                 for nr, nc in neighbors(n, r, c):
                     if grow_k <= 0:
                         break
                     if grid[nr][nc] == 0:
-                        life = int(base_life_ticks * _rand_jitter(0.8, 1.2))
-                        _activate_cell(grid, nr, nc, tick + life, active_map)
+                        life = int(base_life_ticks * _rand_jitter(0.8, 1.2, rng))
+                        _activate_cell(grid, nr, nc, tick + life, active, touched)
                         grown += 1
                         grow_k -= 1
 
@@ -119,23 +243,17 @@ def aftershock_step(grid, interval_ticks, severity, state=None):
         clusters = max(1, int(1 + severity * 2))
         per_cluster = max(1, target_area // clusters)
         for _ in range(clusters):
-            sr = random.randrange(n); sc = random.randrange(n)
-            life = int(base_life_ticks * _rand_jitter(0.8, 1.2))
-            spawned += _region_grow(grid, sr, sc, per_cluster, tick + life, active_map, bias=0.55 + 0.3*severity)
-        last_spawn_tick = tick
+            sr = rng.randrange(n); sc = rng.randrange(n)
+            life = int(base_life_ticks * _rand_jitter(0.8, 1.2, rng))
+            spawned += _region_grow(grid, sr, sc, per_cluster, tick + life, active, bias=0.55 + 0.3*severity, touched=touched, rng=rng)
+        st.last_spawn_tick = tick
 
     # tick 前进一格
-    tick += 1
-
-    new_state = {
-        'tick': tick,
-        'lastSpawnTick': last_spawn_tick,
-        'intervalTicks': interval_ticks,
-        'active': [ {'r': rec['r'], 'c': rec['c'], 'untilTick': rec['until'], 'prev': rec.get('prev',0)} for rec in active_map.values() ]
-    }
+    st.tick = tick + 1
+    st.interval_ticks = interval_ticks
 
     return {
         'grid': grid,
-        'state': new_state,
+        'state': st,
         'stats': {'expired': expired, 'spawned': spawned, 'grown': grown}
     }
\ No newline at end of file
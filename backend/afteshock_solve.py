@@ -1,102 +1,282 @@
-from typing import List, Tuple
-from backend.aftershock_generate import aftershock_step
-from backend.pathfinder import a_star_jps, _compute_safety_cost
-    
+import math
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+from backend.aftershock_generate import aftershock_step, _clamp01
+from backend.grid import Grid, as_grid, is_grid_like
+from backend.jump_graph import JumpPointGraph, take_cached, put_cached
+from backend.dstar_lite import DStarLite
+from backend.costmap import parse_safety_params
+from backend.lru import LRUCache
+from backend.metrics import stage
+from backend.pathformat import parse_path_format, encode_points
+
+
+def _pt(p):
+    if isinstance(p, dict):
+        return int(p.get('r')), int(p.get('c'))
+    return int(p[0]), int(p[1])
+
+
+def _parse_planner(planner):
+    # 规划模式：'dstar' 为 D* Lite 增量重规划（默认），'full' 为每 tick 全图 A* 重算
+    planner = planner or 'dstar'
+    if planner not in ('dstar', 'full'):
+        raise ValueError('invalid planner')
+    return planner
+
+
+MAX_INTERVAL_TICKS = 10000
+
+
+def _parse_interval(interval_ticks):
+    # 生成/扩张间隔（tick）：缺省 5，约束在 1..MAX_INTERVAL_TICKS
+    try:
+        v = int(5 if interval_ticks is None else interval_ticks)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('invalid intervalTicks')
+    return max(1, min(MAX_INTERVAL_TICKS, v))
+
+
+def _parse_severity(severity):
+    # 烈度：缺省 0，约束在 [0, 1]
+    try:
+        v = float(0.0 if severity is None else severity)
+    except (TypeError, ValueError):
+        raise ValueError('invalid severity')
+    if not math.isfinite(v):
+        raise ValueError('invalid severity')
+    return _clamp01(v)
+
+
+def _apply_aftershock(grid: Grid, interval_ticks, severity, after_state, start, goal):
+    """原地推进一个 tick，返回 (新 state, changed)；changed 只在本 tick 写过的格中求得，无需整图比较。"""
+    touched: Dict[Tuple[int, int], int] = {}
+    ares = aftershock_step(grid, interval_ticks, severity, after_state, touched)
+    # 保证起点/终点不被坍塌
+    for r, c in (start, goal):
+        touched.setdefault((r, c), grid.get(r, c))
+        grid.set(r, c, 0)
+    grid.touch()
+    changed = sorted(k for k, old in touched.items() if grid.get(k[0], k[1]) != old)
+    return ares['state'], changed
+
+
+def _replan(cached, grid_now: Grid, changed, agent, goal, planner, radius, alpha, before: Optional[Grid] = None):
+    """
+    复用上一 tick 的跳点图（只按 changed 局部修补）与 D* Lite 状态，返回 (keep, path_nodes)。
+    before 为 None 表示调用方保证 cached 与上一 tick 栅格一致（服务端会话），否则逐字节核对。
+    """
+    graph = cached.graph if isinstance(cached, DStarLite) else cached
+    if (isinstance(graph, JumpPointGraph) and (before is None or graph.matches(before))
+            and (graph.radius, graph.alpha) == (radius, alpha)):
+        touched = graph.update(changed, grid_now)
+    else:
+        graph = JumpPointGraph(grid_now, radius, alpha)
+        touched = None
+    if planner == 'full':
+        path_nodes, _ = graph.plan(agent, goal)
+        return graph, path_nodes
+    # D* Lite 的 g/rhs 跨 tick 保留；图重建或终点变化时从头开始
+    if isinstance(cached, DStarLite) and touched is not None and cached.goal_rc == tuple(goal):
+        keep = cached
+        keep.move_to(agent)
+        keep.notify_changed(touched)
+    else:
+        keep = DStarLite(graph, agent, goal)
+    path_nodes, _ = keep.plan()
+    return keep, path_nodes
+
+
+def _advance(path_nodes, agent, goal):
+    """沿规划路径前进一步，返回 (agent_next, done, reason)。"""
+    if path_nodes is None:
+        return {'r': agent[0], 'c': agent[1]}, False, 'no path'
+    # 下一步为路径的第二个节点（如果存在）
+    if len(path_nodes) >= 2:
+        nr, nc = path_nodes[1]
+    else:
+        nr, nc = agent
+    return {'r': nr, 'c': nc}, (nr, nc) == tuple(goal), None
+
+
+def path_diff(old: List[Tuple[int, int]], new: List[Tuple[int, int]]) -> dict:
+    """
+    路径增量：new = old[skip:skip+keep] + insert + old[len(old)-tail:]。
+    代理沿路径前进时 skip 为新起点在旧路径中的位置，重规划只替换中间一段，首尾大多可复用。
+    """
+    pos = {p: i for i, p in enumerate(old)}
+    skip = pos.get(new[0], len(old)) if new else len(old)
+    keep = 0
+    while skip + keep < len(old) and keep < len(new) and old[skip + keep] == new[keep]:
+        keep += 1
+    tail = 0
+    lim = min(len(old) - skip - keep, len(new) - keep)
+    while tail < lim and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    insert = [{'r': r, 'c': c} for (r, c) in new[keep:len(new) - tail]]
+    return {'skip': skip, 'keep': keep, 'insert': insert, 'tail': tail}
+
+
+def dynamic_step_key(data, shape) -> str:
+    """
+    跨 tick 不变的运行键：有 sessionId 时即为 sessionId，否则由栅格尺寸、终点与安全参数组成
+    （栅格每 tick 都会变化，其哈希不能用来把同一次仿真的相邻 tick 交给同一进程）。
+    """
+    sid = data.get('sessionId')
+    if sid is not None:
+        return str(sid)
+    radius, alpha = parse_safety_params(data.get('safeRadius'), data.get('safeWeight'))
+    gr, gc = _pt(data.get('goal'))
+    return f'dyn:{shape[0]}x{shape[1]}:{gr},{gc}:{radius}:{alpha}'
+
+
 def dynamic_step_service(data):
     grid = data.get('grid')
     start = data.get('start')
     goal = data.get('goal')
     agent = data.get('agent') or start
-    interval_ticks = data.get('intervalTicks')
-    severity = data.get('severity')
+    interval_ticks = _parse_interval(data.get('intervalTicks'))
+    severity = _parse_severity(data.get('severity'))
     after_state = data.get('aftershockState')
+    # 回传状态的形式：收到紧凑形式（或 stateFormat 为 compact）时按紧凑形式返回
+    compact_state = data.get('stateFormat') == 'compact' or (isinstance(after_state, dict) and 'activeB64' in after_state)
+    planner = _parse_planner(data.get('planner'))
+    safe_radius, safe_weight = parse_safety_params(data.get('safeRadius'), data.get('safeWeight'))
+    path_format = parse_path_format(data.get('pathFormat'))
 
-    if not isinstance(grid, list) or not grid or not isinstance(grid[0], list):
+    if not is_grid_like(grid):
         raise ValueError('invalid grid')
 
-    n = len(grid); m = len(grid[0])
-
-    def _pt(p):
-        if isinstance(p, dict):
-            return int(p.get('r')), int(p.get('c'))
-        return int(p[0]), int(p[1])
+    # 归一化为 0/1（仅一次），并复制一份用于计算变化
+    with stage('normalize'):
+        norm = as_grid(grid)
+        if norm is grid:
+            norm = norm.copy()
+        before = norm.copy()
+    n, m = norm.shape
 
     sr, sc = _pt(start); gr, gc = _pt(goal); ar, ac = _pt(agent)
     if not (0<=sr<n and 0<=sc<m and 0<=gr<n and 0<=gc<m and 0<=ar<n and 0<=ac<m):
         raise ValueError('points out of range')
 
-    # 归一化为 0/1，并复制一份用于计算变化
-    norm = [[1 if int(x) != 0 else 0 for x in row] for row in grid]
-    before = [row[:] for row in norm]
+    # 1) 余震步进（tick-only）；变化单元格供后端规划器做增量或全图重算判断
+    grid_now = norm
+    with stage('aftershock'):
+        after_state_out, changed = _apply_aftershock(grid_now, interval_ticks, severity, after_state, (sr,sc), (gr,gc))
 
-    # 1) 余震步进（tick-only）
-    ares = aftershock_step(norm, interval_ticks, severity, after_state)
-    grid_now = ares['grid']
-    after_state_out = ares['state']
+    # 2) 规划/重规划：复用上一 tick 的跳点图，只按 changed 局部修补；
+    #    缓存键为 (运行键, 栅格哈希)，下一 tick 回传本 tick 的栅格时命中，同尺寸的并发仿真互不干扰
+    run = dynamic_step_key(data, (n, m))
+    cached = take_cached((run, before.digest))
+    with stage('search'):
+        keep, path_nodes = _replan(cached, grid_now, changed, (ar,ac), (gr,gc), planner, safe_radius, safe_weight, before)
+    put_cached((run, grid_now.digest), keep)
 
-    # 保证起点/终点不被坍塌
-    grid_now[sr][sc] = 0
-    grid_now[gr][gc] = 0
-
-    # 变化单元格（供后端规划器使用，做增量或全图重算判断）
-    changed: List[Tuple[int,int]] = []
-    for r in range(n):
-        br = before[r]; cr = grid_now[r]
-        for c in range(m):
-            if br[c] != cr[c]:
-                changed.append((r,c))
-
-    # 2) 规划/重规划（使用 A* 全图重算，每步调用以保证行为简单）
-    costs = _compute_safety_cost(grid_now)
-    # a_star_jps 返回 (triplets, cost) 或 (None, None)
-    res = a_star_jps(grid_now, (ar,ac), (gr,gc), costs=costs)
-    if isinstance(res, tuple) and len(res) == 2:
-        trips, trip_cost = res
-    else:
-        trips = res
-        trip_cost = None
-
-    path_nodes: List[Tuple[int,int]] = []
-    if trips is None:
-        path = []
-        agent_next = {'r': ar, 'c': ac}
-        done = False
-        reason = 'no path'
+    agent_next, done, reason = _advance(path_nodes, (ar,ac), (gr,gc))
+    if path_format == 'triplets':
+        path = [ {'r': r, 'c': c} for (r,c) in (path_nodes or []) ]  # 缺省沿用逐格 {r, c} 列表
     else:
-        # 从 triplets 还原节点路径（triplets 长度 = 节点数 - 1）
-        dir_map = {1: (0,1), 2: (1,0), 3: (0,-1), 4: (-1,0)}
-        # trips 是 List[Tuple[r,c,d]]，第一个元素包含起点坐标
-        if len(trips) == 0:
-            # 起点即终点的特殊情况
-            path_nodes = [(ar, ac)]
-        else:
-            cur_r, cur_c = int(trips[0][0]), int(trips[0][1])
-            path_nodes = [(cur_r, cur_c)]
-            for (_, _, d) in trips:
-                delta = dir_map.get(int(d))
-                if not delta:
-                    break
-                cur_r += delta[0]; cur_c += delta[1]
-                path_nodes.append((cur_r, cur_c))
-
-        path = [ {'r': r, 'c': c} for (r,c) in path_nodes ]
-        # 下一步为路径的第二个节点（如果存在）
-        if len(path_nodes) >= 2:
-            ns = path_nodes[1]
-            agent_next = {'r': ns[0], 'c': ns[1]}
-            reason = None
-        else:
-            agent_next = {'r': ar, 'c': ac}
-            reason = None
-        done = (agent_next['r'] == gr and agent_next['c'] == gc)
+        path = encode_points(path_nodes or [], path_format)
 
     return {
-        'grid': grid_now,
-        'aftershockState': after_state_out,
+        'grid': grid_now,  # Grid：由 serve 按客户端选择的格式输出（二维列表或紧凑编码）
+        'aftershockState': after_state_out.to_dict(compact_state),
         'path': path,
         'agent': agent_next,
         'start': { 'r': sr, 'c': sc },
         'goal':  { 'r': gr, 'c': gc },
         'done': done,
-        'reason': reason
-    }
\ No newline at end of file
+        'reason': reason,
+        'planner': planner
+    }
+
+
+# 服务端余震会话：栅格、余震状态、代理位置与规划器都留在服务端，
+# 每个 tick 客户端只发送 sessionId，响应只含变化格、代理新位置与路径增量。
+
+class AftershockSession:
+    """一个余震仿真会话；lock 保证同一会话的 tick 串行执行。"""
+
+    def __init__(self, grid: Grid, start, goal, agent, interval_ticks, severity, planner, radius, alpha):
+        self.grid = grid
+        self.start = start
+        self.goal = goal
+        self.agent = agent
+        self.interval_ticks = interval_ticks
+        self.severity = severity
+        self.planner = planner
+        self.radius = radius
+        self.alpha = alpha
+        self.state = None
+        self.keep = None
+        self.path: List[Tuple[int, int]] = []
+        self.lock = threading.Lock()
+
+    def step(self, interval_ticks=None, severity=None, planner=None) -> dict:
+        # 滑动条等参数可在每个 tick 覆盖；先全部校验，非法时不改动会话
+        interval_ticks = self.interval_ticks if interval_ticks is None else _parse_interval(interval_ticks)
+        severity = self.severity if severity is None else _parse_severity(severity)
+        planner = self.planner if planner is None else _parse_planner(planner)
+        self.interval_ticks, self.severity, self.planner = interval_ticks, severity, planner
+        self.state, changed = _apply_aftershock(self.grid, self.interval_ticks, self.severity, self.state,
+                                                self.start, self.goal)
+        self.keep, path_nodes = _replan(self.keep, self.grid, changed, self.agent, self.goal,
+                                        self.planner, self.radius, self.alpha)
+        agent_next, done, reason = _advance(path_nodes, self.agent, self.goal)
+        new_path = list(path_nodes or [])
+        diff = path_diff(self.path, new_path)
+        self.path = new_path
+        self.agent = (agent_next['r'], agent_next['c'])
+        grid = self.grid
+        return {
+            'tick': self.state.tick,
+            'changed': [{'r': r, 'c': c, 'val': grid.get(r, c)} for (r, c) in changed],
+            'agent': agent_next,
+            'pathDiff': diff,
+            'done': done,
+            'reason': reason,
+            'planner': self.planner
+        }
+
+
+_sessions = LRUCache(maxsize=16)
+
+
+def create_session_service(data):
+    """创建会话：{ grid, start, goal, agent, intervalTicks, severity, planner, safeRadius, safeWeight } -> { sessionId, shape }。"""
+    grid = data.get('grid')
+    if not is_grid_like(grid):
+        raise ValueError('invalid grid')
+    planner = _parse_planner(data.get('planner'))
+    interval_ticks = _parse_interval(data.get('intervalTicks'))
+    severity = _parse_severity(data.get('severity'))
+    safe_radius, safe_weight = parse_safety_params(data.get('safeRadius'), data.get('safeWeight'))
+    norm = as_grid(grid)
+    if norm is grid:
+        norm = norm.copy()
+    n, m = norm.shape
+    try:
+        start = _pt(data.get('start')); goal = _pt(data.get('goal'))
+        agent = _pt(data.get('agent') or data.get('start'))
+    except (TypeError, ValueError):
+        raise ValueError('invalid points')
+    if not all(0 <= r < n and 0 <= c < m for r, c in (start, goal, agent)):
+        raise ValueError('points out of range')
+    sess = AftershockSession(norm, start, goal, agent, interval_ticks, severity, planner, safe_radius, safe_weight)
+    sid = uuid.uuid4().hex
+    _sessions.put(sid, sess)
+    return {'sessionId': sid, 'shape': [n, m]}
+
+
+def session_step_service(data):
+    """会话推进一个 tick；会话不存在（过期或被淘汰）时返回 None，由客户端重新创建。"""
+    sess = _sessions.get(data.get('sessionId'))
+    if sess is None:
+        return None
+    with sess.lock:
+        return sess.step(data.get('intervalTicks'), data.get('severity'), data.get('planner'))
+
+
+def close_session_service(data) -> bool:
+    return _sessions.pop(data.get('sessionId')) is not None
@@ -0,0 +1,178 @@
+import asyncio
+import io
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+# asyncio 前端：连接由事件循环管理（不再每连接一个线程），请求仍交给原有的 Handler 处理，路由与行为不变。
+# - 请求头与请求体由事件循环读完（请求体超过 max_body 返回 413），再在线程池中以内存缓冲驱动 Handler；
+# - 求解类路径（solver_paths）最多 max_jobs 个同时执行，另有 max_queue 个排队，队列满时立即返回
+#   503 并带 Retry-After（按近期平均求解耗时估算）；其余请求在独立的线程池中处理，不受求解排队影响；
+# - 响应统一改写为 HTTP/1.1 并补 Content-Length，支持 keep-alive，空闲超过 keepalive_timeout 秒断开；
+# - 求解请求的排队等待时间写入 Handler 的 queue_seconds，由 Handler 计入该请求的阶段耗时。
+
+_REASONS = {400: 'Bad Request', 408: 'Request Timeout', 411: 'Length Required', 413: 'Payload Too Large',
+            431: 'Request Header Fields Too Large', 503: 'Service Unavailable'}
+
+
+def _buffered_handler(handler_cls):
+    """以内存缓冲代替套接字的 Handler 子类：构造时处理 request（(原始请求, 排队秒数)）中的一个完整请求，响应留在 wfile。"""
+    class BufferedHandler(handler_cls):
+        def setup(self):
+            raw, self.queue_seconds = self.request
+            self.rfile = io.BytesIO(raw)
+            self.wfile = io.BytesIO()
+
+        def handle(self):
+            self.handle_one_request()
+
+        def finish(self):
+            pass
+
+    return BufferedHandler
+
+
+def _frame(raw: bytes, keep_alive: bool) -> bytes:
+    """把 Handler 写出的 HTTP/1.0 响应改写为 HTTP/1.1：替换 Connection，缺少 Content-Length 时按正文补上。"""
+    head, sep, body = raw.partition(b'\r\n\r\n')
+    if not sep:
+        return raw
+    lines = head.split(b'\r\n')
+    status = lines[0].split(b' ', 1)
+    out = [b'HTTP/1.1 ' + (status[1] if len(status) > 1 else b'500 Internal Server Error')]
+    has_length = False
+    for line in lines[1:]:
+        name = line.split(b':', 1)[0].strip().lower()
+        if name == b'connection':
+            continue
+        if name == b'content-length':
+            has_length = True
+        out.append(line)
+    if not has_length:
+        out.append(b'Content-Length: %d' % len(body))
+    out.append(b'Connection: keep-alive' if keep_alive else b'Connection: close')
+    return b'\r\n'.join(out) + b'\r\n\r\n' + body
+
+
+def _error(code: int, keep_alive: bool = False, headers=()) -> bytes:
+    body = b'{"ok": false, "error": "%s"}' % _REASONS[code].lower().encode('ascii')
+    lines = [b'HTTP/1.1 %d %s' % (code, _REASONS[code].encode('ascii')),
+             b'Content-Type: application/json; charset=utf-8',
+             b'Access-Control-Allow-Origin: *',
+             b'Content-Length: %d' % len(body)]
+    lines += [b'%s: %s' % (k.encode('ascii'), str(v).encode('ascii')) for k, v in headers]
+    lines.append(b'Connection: keep-alive' if keep_alive else b'Connection: close')
+    return b'\r\n'.join(lines) + b'\r\n\r\n' + body
+
+
+class AsyncHTTPServer:
+    def __init__(self, handler_cls, solver_paths: Iterable[str] = (), max_jobs: int = 4, max_queue: int = 16,
+                 max_body: int = 64 * 1024 * 1024, keepalive_timeout: float = 15.0, io_threads: int = 8):
+        self.handler_cls = _buffered_handler(handler_cls)
+        self.solver_paths = frozenset(solver_paths)
+        self.max_jobs = max(1, int(max_jobs))
+        self.max_queue = max(0, int(max_queue))
+        self.max_body = max_body
+        self.keepalive_timeout = keepalive_timeout
+        self._solver_threads = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix='solver')
+        self._io_threads = ThreadPoolExecutor(max_workers=max(1, int(io_threads)), thread_name_prefix='http')
+        self._jobs: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._job_seconds = 1.0  # 求解耗时的指数滑动平均，用于 Retry-After
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._job_seconds * (self._waiting + 1) / self.max_jobs))
+
+    def _run(self, raw: bytes, peer, waited: float = 0.0) -> bytes:
+        h = self.handler_cls((raw, waited), peer, self)
+        return h.wfile.getvalue()
+
+    async def _dispatch(self, path: str, raw: bytes, peer, keep_alive: bool) -> bytes:
+        loop = asyncio.get_running_loop()
+        if path not in self.solver_paths:
+            return _frame(await loop.run_in_executor(self._io_threads, self._run, raw, peer), keep_alive)
+        if self._jobs.locked() and self._waiting >= self.max_queue:
+            return _error(503, keep_alive, [('Retry-After', self._retry_after())])
+        self._waiting += 1
+        queued = time.monotonic()
+        try:
+            await self._jobs.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            t0 = time.monotonic()
+            out = await loop.run_in_executor(self._solver_threads, self._run, raw, peer, t0 - queued)
+            self._job_seconds = 0.8 * self._job_seconds + 0.2 * (time.monotonic() - t0)
+        finally:
+            self._jobs.release()
+        return _frame(out, keep_alive)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername') or ('', 0)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keepalive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    return
+                except asyncio.LimitOverrunError:
+                    writer.write(_error(431))
+                    return
+                lines = head.decode('latin-1').split('\r\n')
+                parts = lines[0].split()
+                if len(parts) != 3:
+                    writer.write(_error(400))
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        k, v = line.split(':', 1)
+                        headers[k.strip().lower()] = v.strip()
+                conn = headers.get('connection', '').lower()
+                keep_alive = conn != 'close' if parts[2] == 'HTTP/1.1' else conn == 'keep-alive'
+                if 'chunked' in headers.get('transfer-encoding', '').lower():
+                    writer.write(_error(411))
+                    return
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    writer.write(_error(400))
+                    return
+                if length < 0:
+                    writer.write(_error(400))
+                    return
+                if length > self.max_body:
+                    writer.write(_error(413))
+                    return
+                try:
+                    body = await asyncio.wait_for(reader.readexactly(length), self.keepalive_timeout) if length else b''
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    writer.write(_error(408))
+                    return
+                path = parts[1].split('?', 1)[0]
+                writer.write(await self._dispatch(path, head + body, peer, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+            except (ConnectionError, OSError):
+                pass
+
+    async def serve(self, host: str, port: int):
+        self._jobs = asyncio.Semaphore(self.max_jobs)
+        server = await asyncio.start_server(self._serve_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def serve_forever(self, host: str, port: int):
+        try:
+            asyncio.run(self.serve(host, port))
+        finally:
+            self._solver_threads.shutdown(wait=False)
+            self._io_threads.shutdown(wait=False)
\ No newline at end of file
@@ -0,0 +1,303 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.grid import Grid, as_grid
+from backend.earthquake import simulate_collapse_grid
+from backend.costmap import safety_field, safety_costs, SAFE_RADIUS, SAFE_WEIGHT
+from backend.pathfinder import (dijkstra, a_star, jump_point_search, bidirectional, dijkstra_weighted,
+                                a_star_weighted, a_star_jps)
+from backend import extended_neighbors, hpa
+from backend.extended_neighbors import extended_astar, lazy_theta_star
+from backend.hpa import get_hpa
+from backend.aftershock_generate import aftershock_step
+
+# 基准测试：python -m backend.benchmark [--sizes 50,200 --scenarios collapse,maze --output bench.json]
+# - 场景（同一 seed 生成的地图完全相同）：collapse（simulate_collapse）、open（约 5% 随机障碍）、
+#   maze（迷宫，通道宽 1）、test（TEST/*.json 样例，存在时才加入，不随 sizes 变化）；
+# - 起点为离左上角最近的空格，终点为与起点连通、离右下角最近的格（各求解器使用同一对起终点）；
+# - 每项先清空按栅格缓存的派生数据（连线受阻表、HPA 抽象图），计时 repeat 次（不开 tracemalloc，
+#   报告首次即冷启动的 firstSeconds 与最好的 seconds），再清空缓存后单独跑一次 tracemalloc 取峰值内存 peakBytes
+#   （tracemalloc 会使纯 Python 搜索慢一个数量级，只需耗时时可用 --no-memory 跳过，peakBytes 为 null）；
+# - 路径代价与同一代价模型下的参照（dijkstra / dijkstra_weighted）比较，agree 为是否一致，costRatio 为比值
+#   （hpa 为近似最优，比值略大于 1 属正常；extended / lazytheta 代价模型不同，无参照）。
+# 输出 JSON：{ meta: {...}, results: [...] }；--compare 旧结果.json 时按 (scenario, size, solver) 打印耗时比。
+
+DEFAULT_SIZES = (50, 200, 500, 1000, 2000)
+SCENARIOS = ('collapse', 'open', 'maze', 'test')
+AFTERSHOCK_TICKS = 20
+
+Point = Tuple[int, int]
+
+
+def open_field(n: int, seed: int, density: float = 0.05) -> Grid:
+    rng = random.Random(seed)
+    data = bytearray(1 if rng.random() < density else 0 for _ in range(n * n))
+    return Grid(n, n, data)
+
+
+def maze(n: int, seed: int) -> Grid:
+    """深度优先回溯迷宫：奇数坐标为房间，打通相邻房间之间的墙。"""
+    rng = random.Random(seed)
+    data = bytearray(b'\x01') * (n * n)
+    if n < 3:
+        return Grid(n, n, bytearray(n * n))
+    data[n + 1] = 0
+    stack = [(1, 1)]
+    while stack:
+        r, c = stack[-1]
+        nbrs = [(r + dr, c + dc, dr, dc) for dr, dc in ((0, 2), (2, 0), (0, -2), (-2, 0))
+                if 0 < r + dr < n - 1 and 0 < c + dc < n - 1 and data[(r + dr) * n + c + dc]]
+        if not nbrs:
+            stack.pop()
+            continue
+        nr, nc, dr, dc = rng.choice(nbrs)
+        data[(r + dr // 2) * n + c + dc // 2] = 0
+        data[nr * n + nc] = 0
+        stack.append((nr, nc))
+    return Grid(n, n, data)
+
+
+def load_samples(root: str) -> List[Tuple[str, Grid]]:
+    """TEST/*.json：文件内容为二维数组，或含 grid 字段的对象。"""
+    out = []
+    for path in sorted(glob.glob(os.path.join(root, 'TEST', '*.json'))):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                obj = json.load(f)
+            out.append((os.path.basename(path), as_grid(obj.get('grid') if isinstance(obj, dict) else obj)))
+        except (OSError, ValueError, AttributeError):
+            continue
+    return out
+
+
+def endpoints(grid: Grid) -> Optional[Tuple[Point, Point]]:
+    """起点取离左上角最近的空格；BFS 其连通块，终点取块内离右下角最近的格。"""
+    n, m = grid.shape
+    s = grid.data.find(b'\x00')
+    if s < 0:
+        return None
+    w = m + 2
+    mask = bytearray(grid.padded_mask())
+    sr, sc = divmod(s, m)
+    src = (sr + 1) * w + sc + 1
+    mask[src] = 1
+    queue = deque([src])
+    best = src
+    best_key = sr + sc
+    while queue:
+        u = queue.popleft()
+        r, c = divmod(u, w)
+        if r + c > best_key:
+            best, best_key = u, r + c
+        for v in (u + 1, u + w, u - 1, u - w):
+            if not mask[v]:
+                mask[v] = 1
+                queue.append(v)
+    er, ec = divmod(best, w)
+    return (sr, sc), (er - 1, ec - 1)
+
+
+def scenarios(names, sizes, seed: int, root: str):
+    for name in names:
+        if name == 'test':
+            for fname, grid in load_samples(root):
+                yield f'test:{fname}', grid.n, grid
+            continue
+        for n in sizes:
+            if name == 'collapse':
+                yield name, n, simulate_collapse_grid(n, None, seed)
+            elif name == 'open':
+                yield name, n, open_field(n, seed)
+            elif name == 'maze':
+                yield name, n, maze(n, seed)
+
+
+# 求解器：名称 -> (调用函数 (grid, s, e, costs, stats) -> (triplets, cost), 参照求解器名)
+SOLVERS: Dict[str, Tuple[Callable, Optional[str]]] = {
+    'dijkstra': (lambda g, s, e, costs, st: dijkstra(g, s, e, stats=st), None),
+    'a_star': (lambda g, s, e, costs, st: a_star(g, s, e, stats=st), 'dijkstra'),
+    'jump_point_search': (lambda g, s, e, costs, st: jump_point_search(g, s, e, stats=st), 'dijkstra'),
+    'bidijkstra': (lambda g, s, e, costs, st: bidirectional(g, s, e, heuristic=False, stats=st), 'dijkstra'),
+    'biastar': (lambda g, s, e, costs, st: bidirectional(g, s, e, heuristic=True, stats=st), 'dijkstra'),
+    'hpa': (lambda g, s, e, costs, st: get_hpa(g, 16, None, None).path(s, e), 'dijkstra'),
+    'dijkstra_weighted': (lambda g, s, e, costs, st: dijkstra_weighted(g, costs, s, e, stats=st), None),
+    'a_star_weighted': (lambda g, s, e, costs, st: a_star_weighted(g, costs, s, e, stats=st), 'dijkstra_weighted'),
+    'a_star_jps': (lambda g, s, e, costs, st: a_star_jps(g, s, e, costs, stats=st), 'dijkstra_weighted'),
+    'biastar_weighted': (lambda g, s, e, costs, st: bidirectional(g, s, e, costs=costs, stats=st), 'dijkstra_weighted'),
+    'extended_astar': (lambda g, s, e, costs, st: extended_astar(g, s, e, stats=st), None),
+    'lazy_theta_star': (lambda g, s, e, costs, st: lazy_theta_star(g, s, e, stats=st), None),
+}
+TASKS = tuple(SOLVERS) + ('safety_cost', 'aftershock_step')
+
+
+def _reset_caches():
+    extended_neighbors._blocked_cache.clear()
+    hpa._cache.clear()
+
+
+def _measure(fn: Callable[[], Any], repeat: int, memory: bool = True) -> Dict[str, Any]:
+    """计时 repeat 次，再在 tracemalloc 下跑一次取峰值（memory 为 False 时跳过）；返回最后一次计时运行的结果。"""
+    _reset_caches()
+    times = []
+    result = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    peak = None
+    if memory:
+        _reset_caches()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {'seconds': min(times), 'firstSeconds': times[0], 'peakBytes': peak, 'result': result}
+
+
+def _aftershock_run(grid: Grid, seed: int):
+    def run():
+        g = grid.copy()
+        rng = random.Random(seed)
+        state = None
+        for _ in range(AFTERSHOCK_TICKS):
+            state = aftershock_step(g, 3, 0.5, state, rng=rng)['state']
+        return len(state.active)
+    return run
+
+
+def run_suite(names, sizes, tasks, seed: int = 1, repeat: int = 1, root: str = '.', memory: bool = True,
+              log: Optional[Callable[[str], None]] = None) -> List[Dict[str, Any]]:
+    results = []
+    for scenario, n, grid in scenarios(names, sizes, seed, root):
+        ends = endpoints(grid)
+        if ends is None:
+            continue
+        s, e = ends
+        costs = safety_costs(grid, SAFE_RADIUS, SAFE_WEIGHT) if any(t.endswith('weighted') or t == 'a_star_jps' for t in tasks) else None
+        base = {'scenario': scenario, 'size': n, 'shape': [grid.n, grid.m], 'seed': seed,
+                'start': list(s), 'end': list(e), 'obstacleRatio': round(grid.data.count(1) / len(grid.data), 4)}
+        ref_cost: Dict[str, Optional[float]] = {}
+        for task in tasks:
+            row = dict(base, solver=task)
+            if task == 'safety_cost':
+                m = _measure(lambda: safety_field(grid, SAFE_RADIUS, SAFE_WEIGHT), repeat, memory)
+                m.pop('result')
+                row.update(m)
+            elif task == 'aftershock_step':
+                m = _measure(_aftershock_run(grid, seed), repeat, memory)
+                row['activeCells'] = m.pop('result')
+                row['ticks'] = AFTERSHOCK_TICKS
+                row.update(m)
+            else:
+                fn, ref = SOLVERS[task]
+                stats: Dict[str, Any] = {}
+                m = _measure(lambda: fn(grid, s, e, costs, stats), repeat, memory)
+                trips, cost = m.pop('result')
+                row.update(m)
+                row['expanded'] = stats.get('expanded')
+                row['cost'] = cost
+                row['steps'] = None if trips is None else len(trips)
+                ref_cost[task] = cost
+                if ref is not None:
+                    if ref not in ref_cost:
+                        ref_cost[ref] = SOLVERS[ref][0](grid, s, e, costs, {})[1]
+                    rc = ref_cost[ref]
+                    row['agree'] = (cost is None and rc is None) or (
+                        cost is not None and rc is not None and abs(cost - rc) <= 1e-6 * max(1.0, rc))
+                    row['costRatio'] = None if not (cost and rc) else round(cost / rc, 6)
+            results.append(row)
+            if log is not None:
+                peak = '' if row['peakBytes'] is None else f"  peak {row['peakBytes'] / 1e6:.1f}MB"
+                log(f"{scenario:>12} {n:>5} {task:<18} {row['seconds']:.4f}s{peak}"
+                    + ('' if row.get('agree', True) else '  COST MISMATCH'))
+    return results
+
+
+def _git_commit(root: str) -> Optional[str]:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """按 (scenario, size, solver) 对齐两次结果，给出耗时比（新 / 旧，小于 1 为变快）。"""
+    index = {(r['scenario'], r['size'], r['solver']): r for r in old.get('results', [])}
+    lines = []
+    for r in new.get('results', []):
+        o = index.get((r['scenario'], r['size'], r['solver']))
+        if o is None or not o.get('seconds'):
+            continue
+        lines.append(f"{r['scenario']:>12} {r['size']:>5} {r['solver']:<18} {o['seconds']:.4f}s -> {r['seconds']:.4f}s"
+                     f"  x{r['seconds'] / o['seconds']:.2f}")
+    return lines
+
+
+def main(argv=None):
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    ap = argparse.ArgumentParser(prog='python -m backend.benchmark', description='寻路 / 代价场 / 余震步进基准测试')
+    ap.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='地图边长，逗号分隔（默认 50,200,500,1000,2000）')
+    ap.add_argument('--scenarios', default=','.join(SCENARIOS), help='collapse,open,maze,test')
+    ap.add_argument('--solvers', default=','.join(TASKS), help='要运行的求解器 / 任务，逗号分隔')
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--repeat', type=int, default=1, help='每项计时次数（报告最好成绩）')
+    ap.add_argument('--no-memory', action='store_true', help='不测峰值内存（tracemalloc 很慢）')
+    ap.add_argument('--output', default=None, help='结果 JSON 路径（缺省输出到标准输出）')
+    ap.add_argument('--compare', default=None, help='与之前的结果 JSON 对比耗时')
+    args = ap.parse_args(argv)
+
+    try:
+        sizes = [int(x) for x in args.sizes.split(',') if x.strip()]
+    except ValueError:
+        ap.error('invalid --sizes')
+    names = [x.strip() for x in args.scenarios.split(',') if x.strip()]
+    tasks = [x.strip() for x in args.solvers.split(',') if x.strip()]
+    for x in names:
+        if x not in SCENARIOS:
+            ap.error(f'unknown scenario: {x}')
+    for x in tasks:
+        if x not in TASKS:
+            ap.error(f'unknown solver: {x}')
+
+    log = lambda line: print(line, file=sys.stderr, flush=True)
+    results = run_suite(names, sizes, tasks, seed=args.seed, repeat=args.repeat, root=root,
+                        memory=not args.no_memory, log=log)
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    report = {
+        'meta': {'commit': _git_commit(root), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'python': platform.python_version(), 'platform': platform.platform(), 'numpy': numpy_version,
+                 'seed': args.seed, 'repeat': args.repeat, 'sizes': sizes, 'scenarios': names,
+                 'memory': not args.no_memory},
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            for line in compare(json.load(f), report):
+                log(line)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,205 @@
+from array import array
+from typing import List, Tuple
+
+from backend.grid import Grid
+from backend.lru import LRUCache
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 NumPy 时使用纯 Python 的分层 BFS
+    np = None
+
+# 安全代价场：
+# 距最近障碍的四连通距离 d（穿过空格的多源 BFS 距离，等价于到最近障碍的曼哈顿距离），
+# 进入空格的代价 = 1 + alpha * max(0, (radius - d) / max(1, radius))，障碍为 INF。
+# 只有 d < radius 时才有惩罚，因此距离截断在 cap = max(radius, 1) 即可。
+
+INF = float('inf')
+
+SAFE_RADIUS = 3    # 安全半径
+SAFE_WEIGHT = 1.25 # 安全权重
+MAX_SAFE_RADIUS = 64
+MAX_SAFE_WEIGHT = 100.0
+
+
+def parse_safety_params(radius=None, weight=None) -> Tuple[int, float]:
+    """解析 safeRadius / safeWeight（缺省为默认值），越界或非法时抛出 ValueError。"""
+    try:
+        r = SAFE_RADIUS if radius is None else int(radius)
+    except (TypeError, ValueError):
+        raise ValueError('invalid safeRadius')
+    try:
+        a = SAFE_WEIGHT if weight is None else float(weight)
+    except (TypeError, ValueError):
+        raise ValueError('invalid safeWeight')
+    if not (0 <= r <= MAX_SAFE_RADIUS):
+        raise ValueError('invalid safeRadius')
+    if not (0.0 <= a <= MAX_SAFE_WEIGHT):
+        raise ValueError('invalid safeWeight')
+    return r, a
+
+
+def _cost_table(radius: int, alpha: float) -> List[float]:
+    cap = max(radius, 1)
+    table = [INF]
+    for d in range(1, cap + 1):
+        penalty = max(0.0, (radius - float(d)) / max(1.0, float(radius)))
+        table.append(1.0 + alpha * penalty)
+    return table
+
+
+def _obstacles(grid: Grid) -> List[int]:
+    """障碍格的带外圈扁平下标（bytearray.find 逐个定位，不逐格遍历）。"""
+    w = grid.m + 2
+    data = grid.data
+    m = grid.m
+    out = []
+    i = data.find(1)
+    while i >= 0:
+        r, c = divmod(i, m)
+        out.append((r + 1) * w + c + 1)
+        i = data.find(1, i + 1)
+    return out
+
+
+def safety_field(grid: Grid, radius: int = SAFE_RADIUS, alpha: float = SAFE_WEIGHT) -> Tuple[bytearray, array]:
+    """
+    计算带外圈的截断距离场与代价场：
+    - dist: bytearray，障碍为 0，d >= cap 的格记为 cap；
+    - costs: array('d')，与 Grid.padded_mask() 同布局，障碍与外圈为 INF。
+    """
+    if np is not None:
+        return _safety_field_np(grid, radius, alpha)
+    n, m = grid.shape
+    w = m + 2
+    cap = max(radius, 1)
+    mask = grid.padded_mask()
+    dist = bytearray([cap]) * len(mask)
+    frontier = _obstacles(grid)
+    for u in frontier:
+        dist[u] = 0
+    # 只需展开 cap-1 层，之后的格惩罚为 0
+    for k in range(1, cap):
+        nxt = []
+        for u in frontier:
+            for v in (u + 1, u + w, u - 1, u - w):
+                if not mask[v] and dist[v] == cap:
+                    dist[v] = k
+                    nxt.append(v)
+        frontier = nxt
+        if not frontier:
+            break
+    table = _cost_table(radius, alpha)
+    costs = array('d', map(table.__getitem__, dist))
+    _seal_border(costs, n, m)
+    return dist, costs
+
+
+def _safety_field_np(grid: Grid, radius: int, alpha: float) -> Tuple[bytearray, array]:
+    """NumPy 版：障碍掩码做 cap-1 次四邻域膨胀，得到截断的曼哈顿距离变换。"""
+    n, m = grid.shape
+    cap = max(radius, 1)
+    obst = np.frombuffer(grid.data, dtype=np.uint8).reshape(n, m).astype(bool)
+    dist = np.full((n + 2, m + 2), cap, dtype=np.uint8)
+    inner = dist[1:-1, 1:-1]
+    inner[obst] = 0
+    free = ~obst
+    front = obst
+    for k in range(1, cap):
+        grown = np.zeros_like(front)
+        grown[1:, :] |= front[:-1, :]
+        grown[:-1, :] |= front[1:, :]
+        grown[:, 1:] |= front[:, :-1]
+        grown[:, :-1] |= front[:, 1:]
+        front = grown & free & (inner == cap)
+        if not front.any():
+            break
+        inner[front] = k
+    table = np.asarray(_cost_table(radius, alpha), dtype=np.float64)
+    cost_np = table[dist]
+    cost_np[0, :] = INF; cost_np[-1, :] = INF
+    cost_np[:, 0] = INF; cost_np[:, -1] = INF
+    costs = array('d')
+    costs.frombytes(cost_np.tobytes())
+    return bytearray(dist.tobytes()), costs
+
+
+def _seal_border(costs: array, n: int, m: int):
+    w = m + 2
+    for c in range(w):
+        costs[c] = INF
+        costs[(n + 1) * w + c] = INF
+    for r in range(1, n + 1):
+        costs[r * w] = INF
+        costs[r * w + m + 1] = INF
+
+
+def _diamond(cap: int) -> List[Tuple[int, int, int]]:
+    """曼哈顿距离 1..cap-1 的偏移，按距离升序。"""
+    out = []
+    for d in range(1, cap):
+        for dr in range(-d, d + 1):
+            k = d - abs(dr)
+            out.append((dr, k, d))
+            if k:
+                out.append((dr, -k, d))
+    return out
+
+
+def repair_safety_field(grid: Grid, dist: bytearray, costs: array, changed: List[Tuple[int, int]],
+                        radius: int = SAFE_RADIUS, alpha: float = SAFE_WEIGHT) -> List[int]:
+    """
+    grid 已更新（含 changed 中的格）后，只重算 changed 周围 cap-1 范围内的距离与代价。
+    返回代价发生变化的带外圈下标列表。
+    """
+    if not changed:
+        return []
+    n, m = grid.shape
+    w = m + 2
+    cap = max(radius, 1)
+    mask = grid.padded_mask()
+    table = _cost_table(radius, alpha)
+    offsets = _diamond(cap)
+    affected = set()
+    for r, c in changed:
+        affected.add((r, c))
+        for dr, dc, _ in offsets:
+            rr = r + dr; cc = c + dc
+            if 0 <= rr < n and 0 <= cc < m:
+                affected.add((rr, cc))
+    touched = []
+    for r, c in affected:
+        u = (r + 1) * w + c + 1
+        if mask[u]:
+            d = 0
+        else:
+            d = cap
+            for dr, dc, k in offsets:
+                rr = r + dr; cc = c + dc
+                if 0 <= rr < n and 0 <= cc < m and mask[(rr + 1) * w + cc + 1]:
+                    d = k
+                    break
+        if d != dist[u] or costs[u] != table[d]:
+            dist[u] = d
+            costs[u] = table[d]
+            touched.append(u)
+    return touched
+
+
+
+# 只读代价场缓存：键为 (栅格哈希, 半径, 权重)；返回的数组由多个请求共享，调用方不得原地修改
+_cost_cache = LRUCache(maxsize=16, maxbytes=256 * 1024 * 1024, sizeof=lambda a: a.itemsize * len(a))
+
+
+def safety_costs(grid: Grid, radius: int = SAFE_RADIUS, alpha: float = SAFE_WEIGHT) -> array:
+    """带缓存的安全代价场（与 Grid.padded_mask() 同布局的 array('d')）。"""
+    key = (grid.digest, radius, alpha)
+    costs = _cost_cache.get(key)
+    if costs is None:
+        _, costs = safety_field(grid, radius, alpha)
+        _cost_cache.put(key, costs)
+    return costs
+
+
+def cost_cache_stats() -> dict:
+    return _cost_cache.stats()
@@ -0,0 +1,187 @@
+import heapq
+from array import array
+from typing import List, Tuple, Optional
+
+from backend.jump_graph import JumpPointGraph
+
+# D* Lite（Koenig & Likhachev），以目标为根、代理移动：
+# - g/rhs 以带外圈的扁平 array('d') 保存，跨 tick 保留；
+# - 边 u->v 的代价为进入 v 的安全代价（graph.costs[v]），u 或 v 不可走时为 INF；
+# - 每个 tick 只对代价发生变化的格及其四邻调用 update_vertex，再增量地 compute_shortest_path。
+
+INF = float('inf')
+# 键的第一分量由不同顺序的浮点加法得到（入队时 gm + h + km，起点键 ms + km），相等的键可能相差一个 ulp；
+# 比较键时差值在 EPS 以内的第一分量视为相等，再比较第二分量
+EPS = 1e-9
+
+
+class DStarLite:
+    """在 JumpPointGraph 上的增量规划器。"""
+
+    def __init__(self, graph: JumpPointGraph, start, goal):
+        self.graph = graph
+        n, m = graph.shape
+        self.w = w = m + 2
+        size = (n + 2) * w
+        self.g = array('d', [INF]) * size
+        self.rhs = array('d', [INF]) * size
+        self.goal_rc = (goal[0], goal[1])
+        self.goal = (goal[0] + 1) * w + goal[1] + 1
+        self.start = (start[0] + 1) * w + start[1] + 1
+        self.last = self.start
+        self.km = 0.0
+        self.heap: List[Tuple[float, float, int]] = []
+        self.open = {}
+        self.expanded = 0
+        self.rhs[self.goal] = 0.0
+        self._push(self.goal)
+
+    def _h(self, a: int, b: int) -> int:
+        ar, ac = divmod(a, self.w)
+        br, bc = divmod(b, self.w)
+        return abs(ar - br) + abs(ac - bc)
+
+    def _key(self, u: int) -> Tuple[float, float]:
+        gm = min(self.g[u], self.rhs[u])
+        return (gm + self._h(self.start, u) + self.km, gm)
+
+    def _push(self, u: int):
+        k = self._key(u)
+        self.open[u] = k
+        heapq.heappush(self.heap, (k[0], k[1], u))
+
+    def _update_vertex(self, u: int):
+        costs = self.graph.costs
+        if u != self.goal:
+            best = INF
+            if costs[u] != INF:
+                g = self.g
+                w = self.w
+                for v in (u + 1, u + w, u - 1, u - w):
+                    cv = costs[v]
+                    if cv != INF:
+                        t = cv + g[v]
+                        if t < best:
+                            best = t
+            self.rhs[u] = best
+        self.open.pop(u, None)
+        if self.g[u] != self.rhs[u]:
+            self._push(u)
+
+    def _compact(self):
+        # 惰性删除会留下过期条目，堆明显大于 open 表时重建
+        if len(self.heap) > 4 * len(self.open) + 1024:
+            self.heap = [(k[0], k[1], u) for u, k in self.open.items()]
+            heapq.heapify(self.heap)
+
+    def compute_shortest_path(self):
+        # 热循环：键计算与 update_vertex 以局部变量内联，避免属性查找与方法调用
+        heap = self.heap; open_ = self.open
+        g = self.g; rhs = self.rhs; costs = self.graph.costs
+        heappop = heapq.heappop; heappush = heapq.heappush
+        w = self.w
+        s = self.start; goal = self.goal; km = self.km
+        sr, sc = divmod(s, w)
+
+        def update(u):
+            if u != goal:
+                best = INF
+                if costs[u] != INF:
+                    for v in (u + 1, u + w, u - 1, u - w):
+                        cv = costs[v]
+                        if cv != INF:
+                            t = cv + g[v]
+                            if t < best:
+                                best = t
+                rhs[u] = best
+            else:
+                best = rhs[u]
+            gu = g[u]
+            if gu != best:
+                gm = gu if gu < best else best
+                ur, uc = divmod(u, w)
+                k = (gm + abs(ur - sr) + abs(uc - sc) + km, gm)
+                open_[u] = k
+                heappush(heap, (k[0], k[1], u))
+            else:
+                open_.pop(u, None)
+
+        expanded = 0
+        while heap:
+            k1, k2, u = heap[0]
+            if open_.get(u) != (k1, k2):
+                heappop(heap)
+                continue
+            gs = g[s]; rs = rhs[s]
+            ms = gs if gs < rs else rs
+            ks1 = ms + km
+            # 队首键不小于起点键且起点一致时停止
+            if gs == rs and not (k1 < ks1 - EPS or (k1 <= ks1 + EPS and k2 < ms - EPS)):
+                break
+            heappop(heap)
+            gu = g[u]; ru = rhs[u]
+            gm = gu if gu < ru else ru
+            ur, uc = divmod(u, w)
+            k_new = (gm + abs(ur - sr) + abs(uc - sc) + km, gm)
+            if k1 < k_new[0] - EPS or (k1 <= k_new[0] + EPS and k2 < gm - EPS):
+                open_[u] = k_new
+                heappush(heap, (k_new[0], k_new[1], u))
+                continue
+            del open_[u]
+            expanded += 1
+            if gu > ru:
+                g[u] = ru
+            else:
+                g[u] = INF
+                update(u)
+            update(u + 1); update(u + w); update(u - 1); update(u - w)
+        self.expanded += expanded
+        self._compact()
+
+    def move_to(self, agent):
+        """代理移动后更新起点与 km。"""
+        s = (agent[0] + 1) * self.w + agent[1] + 1
+        if s != self.start:
+            self.km += self._h(self.last, s)
+            self.last = s
+            self.start = s
+
+    def notify_changed(self, touched: List[int]):
+        """touched 为代价发生变化的带外圈下标：其自身与四邻的出边代价随之改变。"""
+        w = self.w
+        seen = set()
+        for v in touched:
+            for u in (v, v + 1, v + w, v - 1, v - w):
+                if u not in seen:
+                    seen.add(u)
+                    self._update_vertex(u)
+
+    def plan(self):
+        """返回 (points, cost)；沿 argmin(c + g) 从代理走到目标，不可达返回 (None, None)。"""
+        costs = self.graph.costs
+        if costs[self.start] == INF:
+            # 代理所在格已坍塌：不展开（队列保留，下一 tick 继续）
+            return None, None
+        self.compute_shortest_path()
+        g = self.g
+        w = self.w
+        s = self.start
+        if g[s] == INF:
+            return None, None
+        cells = [s]
+        limit = len(g)
+        while s != self.goal and len(cells) <= limit:
+            best = INF; nxt = -1
+            for v in (s + 1, s + w, s - 1, s - w):
+                cv = costs[v]
+                if cv != INF and cv + g[v] < best:
+                    best = cv + g[v]; nxt = v
+            if nxt < 0:
+                return None, None
+            s = nxt
+            cells.append(s)
+        points = []
+        for u in cells:
+            r, c = divmod(u, w)
+            points.append((r - 1, c - 1))
+        return points, g[self.start]
@@ -1,5 +1,12 @@
 import random
-from typing import List
+from typing import List, Optional
+
+from backend.grid import Grid
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 NumPy 时使用逐格的纯 Python 生成器
+    np = None
 # - 结构化障碍：墙体/廊道/房间块的成片坍塌
 # - 碎片化障碍：掉落碎块、堆积
 # - 可控参数：强度、连通性、碎片比例、走廊保持概率
@@ -8,6 +15,11 @@ from typing import List
 # 2) 在房间内部以连通簇方式坍塌（区域生长）；
 # 3) 沿“承重线/墙体线”增加成带状坍塌；
 # 4) 随机碎片撒落，形成非规则形状；
+# 各生成器可传入 rng（random.Random）以便按 seed 复现；
+# 安装 NumPy 时 simulate_collapse_grid 以数组运算完成墙带、碎片与走廊清理（逐格独立的伯努利抽样，分布不变），
+# 成片坍塌的区域生长规模只有 seeds*target、与 n² 无关，仍按原 DFS 在扁平缓冲区上逐格进行，保持簇的形状分布。
+
+MAX_COLLAPSE_SIZE = 4000
 
 class CollapseParams:
     def __init__(
@@ -26,6 +38,26 @@ class CollapseParams:
 
 DEFAULT_PARAMS = CollapseParams()
 
+_PARAM_KEYS = (('intensity', 'intensity'), ('corridorKeep', 'corridor_keep'), ('clusterBias', 'cluster_bias'),
+               ('debrisRatio', 'debris_ratio'), ('wallBelt', 'wall_belt'))
+
+def parse_collapse_params(obj) -> CollapseParams:
+    """请求中的 params（驼峰键，缺省取默认值）-> CollapseParams；非数值时抛出 ValueError。"""
+    if obj is None:
+        return DEFAULT_PARAMS
+    if not isinstance(obj, dict):
+        raise ValueError('invalid params')
+    kw = {}
+    for key, name in _PARAM_KEYS:
+        v = obj.get(key)
+        if v is None:
+            continue
+        try:
+            kw[name] = float(v)
+        except (TypeError, ValueError):
+            raise ValueError(f'invalid {key}')
+    return CollapseParams(**kw)
+
 def gen_room_layout(n, room_size: int = 10):
     """初始化"""
     g = [[0 for _ in range(n)] for _ in range(n)]
@@ -43,24 +75,28 @@ def neighbors(n: int, r: int, c: int):
         if 0 <= nr < n and 0 <= nc < n:
             yield nr, nc
 
-def apply_corridor_keep(grid: List[List[int]], keep_prob: float):
+def apply_corridor_keep(grid: List[List[int]], keep_prob: float, rng=random):
     """提高走廊通行概率：对规则网格线（假定为走廊线）做稀疏清理。"""
     n = len(grid)
     for i in range(n):
         for j in range(n):
             if i % 10 == 0 or j % 10 == 0:
-                if random.random() < keep_prob:
+                if rng.random() < keep_prob:
                     grid[i][j] = 0
 
-def cluster_collapse(grid: List[List[int]], params: CollapseParams = DEFAULT_PARAMS):
-    """成片坍塌：随机挑若干种子做区域生长，形成大块障碍。"""
-    n = len(grid)
+def _cluster_sizes(n: int, params: CollapseParams):
     seeds = max(1, int(params.intensity * 10))
     area_scale = int((n / 40) ** 0.5)
     base_target = params.intensity * (n // 3)
     scaled_target = int(max(3, min(n * n * 0.25, base_target * max(1.0, area_scale))))
+    return seeds, scaled_target
+
+def cluster_collapse(grid: List[List[int]], params: CollapseParams = DEFAULT_PARAMS, rng=random):
+    """成片坍塌：随机挑若干种子做区域生长，形成大块障碍。"""
+    n = len(grid)
+    seeds, scaled_target = _cluster_sizes(n, params)
     for _ in range(seeds):
-        r = random.randrange(n); c = random.randrange(n)
+        r = rng.randrange(n); c = rng.randrange(n)
         target = scaled_target
         frontier = [(r,c)]
         visited = set()
@@ -71,10 +107,10 @@ def cluster_collapse(grid: List[List[int]], params: CollapseParams = DEFAULT_PAR
             grid[cr][cc] = 1
             target -= 1
             for nr, nc in neighbors(n, cr, cc):
-                if random.random() < (0.5 + 0.5*params.cluster_bias):
+                if rng.random() < (0.5 + 0.5*params.cluster_bias):
                     frontier.append((nr,nc))
 
-def wall_belt_collapse(grid: List[List[int]], params: CollapseParams = DEFAULT_PARAMS):
+def wall_belt_collapse(grid: List[List[int]], params: CollapseParams = DEFAULT_PARAMS, rng=random):
     """沿墙/承重线进行带状坍塌：靠近边界或模拟承重墙线条。"""
     n = len(grid)
     # 四周墙体附近
@@ -82,41 +118,119 @@ def wall_belt_collapse(grid: List[List[int]], params: CollapseParams = DEFAULT_P
     for r in range(n):
         for c in range(n):
             near_wall = (r < belt) or (r >= n-belt) or (c < belt) or (c >= n-belt)
-            if near_wall and random.random() < params.wall_belt*0.5:
+            if near_wall and rng.random() < params.wall_belt*0.5:
                 grid[r][c] = 1
     # 模拟承重墙：每隔 ~room_size 列/行加一条带状坍塌
     room = 10
     for i in range(room, n, room):
         for c in range(n):
-            if random.random() < params.wall_belt*0.25:
+            if rng.random() < params.wall_belt*0.25:
                 grid[i][c] = 1
     for j in range(room, n, room):
         for r in range(n):
-            if random.random() < params.wall_belt*0.25:
+            if rng.random() < params.wall_belt*0.25:
                 grid[r][j] = 1
 
-def scatter_debris(grid: List[List[int]], params: CollapseParams = DEFAULT_PARAMS):
+def scatter_debris(grid: List[List[int]], params: CollapseParams = DEFAULT_PARAMS, rng=random):
     """碎片化障碍：在通路上随机撒落碎片，形成不规则干扰。"""
     n = len(grid)
     total = n*n
     cnt = int(total * params.debris_ratio)
     for _ in range(cnt):
-        r = random.randrange(n); c = random.randrange(n)
+        r = rng.randrange(n); c = rng.randrange(n)
         if grid[r][c] == 0:
             grid[r][c] = 1
             # 以小概率再扩散一点点
-            if random.random() < 0.3:
+            if rng.random() < 0.3:
                 for nr, nc in neighbors(n, r, c):
-                    if random.random() < 0.2:
+                    if rng.random() < 0.2:
                         grid[nr][nc] = 1
 
-def simulate_collapse(n: int) -> List[List[int]]:
-    """生成 n×n 室内坍塌栅格（1=障碍，0=通路）。"""
+def _cluster_collapse_flat(data: bytearray, n: int, params: CollapseParams, rng: random.Random):
+    """与 cluster_collapse 相同的 DFS 区域生长，直接写扁平缓冲区（下标 r*n+c）。"""
+    seeds, scaled_target = _cluster_sizes(n, params)
+    p = 0.5 + 0.5*params.cluster_bias
+    rand = rng.random
+    for _ in range(seeds):
+        target = scaled_target
+        frontier = [rng.randrange(n) * n + rng.randrange(n)]
+        visited = set()
+        while frontier and target>0:
+            v = frontier.pop()
+            if v in visited: continue
+            visited.add(v)
+            data[v] = 1
+            target -= 1
+            r, c = divmod(v, n)
+            # 邻格顺序与 neighbors 一致：下、上、右、左
+            if r + 1 < n and rand() < p: frontier.append(v + n)
+            if r > 0 and rand() < p: frontier.append(v - n)
+            if c + 1 < n and rand() < p: frontier.append(v + 1)
+            if c > 0 and rand() < p: frontier.append(v - 1)
+
+def _simulate_collapse_np(n: int, params: CollapseParams, seed) -> Grid:
+    rng = np.random.default_rng(seed)
+    # 1) 成片坍塌（房间布局全为通路）
+    data = bytearray(n * n)
+    _cluster_collapse_flat(data, n, params, random.Random(int(rng.integers(2**63))))
+    g = np.frombuffer(data, dtype=np.uint8).reshape(n, n).astype(bool)
+    # 2) 墙带：四周 belt 宽的区域与每隔 10 行/列的承重线，逐格独立抽样
+    belt = max(1, n//20)
+    near = np.zeros((n, n), dtype=bool)
+    near[:belt, :] = True; near[n-belt:, :] = True
+    near[:, :belt] = True; near[:, n-belt:] = True
+    g |= near & (rng.random((n, n)) < params.wall_belt*0.5)
+    lines = np.arange(10, n, 10)
+    if lines.size:
+        g[lines, :] |= rng.random((lines.size, n)) < params.wall_belt*0.25
+        g[:, lines] |= rng.random((n, lines.size)) < params.wall_belt*0.25
+    # 3) 碎片：一次抽出全部落点，只有落在（撒落前的）空格上、且是该格首次命中的才生效，
+    #    生效的以 0.3 的概率向各邻格以 0.2 的概率扩散
+    cnt = int(n * n * params.debris_ratio)
+    if cnt:
+        flat = g.ravel()
+        pos = rng.integers(n, size=cnt) * n + rng.integers(n, size=cnt)
+        pos = np.unique(pos)
+        pos = pos[~flat[pos]]
+        spread = pos[rng.random(pos.size) < 0.3]
+        flat[pos] = True
+        r, c = np.divmod(spread, n)
+        for dr, dc in ((1,0),(-1,0),(0,1),(0,-1)):
+            nr = r + dr; nc = c + dc
+            ok = (nr >= 0) & (nr < n) & (nc >= 0) & (nc < n) & (rng.random(spread.size) < 0.2)
+            g[nr[ok], nc[ok]] = True
+    # 4) 走廊清理：行号或列号为 10 的倍数的格以 corridor_keep 的概率置为通路
+    corridor = np.zeros((n, n), dtype=bool)
+    corridor[::10, :] = True; corridor[:, ::10] = True
+    g[corridor & (rng.random((n, n)) < params.corridor_keep)] = False
+    return Grid(n, n, bytearray(g.astype(np.uint8).tobytes()))
+
+def simulate_collapse_grid(n: int, params: Optional[CollapseParams] = None, seed=None) -> Grid:
+    """
+    生成 n×n 室内坍塌栅格（Grid，1=障碍）；seed 相同则结果相同。
+    seed 为 None 时随机性取自全局 random（NumPy 版的种子由 random.getrandbits 得到），
+    调用方用 random.seed() 固定序列时结果同样可复现。
+    """
+    params = params or DEFAULT_PARAMS
+    if np is not None:
+        return _simulate_collapse_np(n, params, random.getrandbits(64) if seed is None else seed)
+    rng = random if seed is None else random.Random(seed)
     grid = gen_room_layout(n)
-    # 步骤：成片坍塌 -> 墙带坍塌 -> 碎片 -> 走廊清理
-    params = DEFAULT_PARAMS
-    cluster_collapse(grid, params)
-    wall_belt_collapse(grid, params)
-    scatter_debris(grid, params)
-    apply_corridor_keep(grid, params.corridor_keep)
-    return grid
\ No newline at end of file
+    cluster_collapse(grid, params, rng)
+    wall_belt_collapse(grid, params, rng)
+    scatter_debris(grid, params, rng)
+    apply_corridor_keep(grid, params.corridor_keep, rng)
+    return Grid.from_rows(grid)
+
+def simulate_collapse_service(data) -> dict:
+    """/api/simulate-collapse：{ size, seed, params } -> { size, seed, grid }；未指定 seed 时随机取一个并返回，便于复现。"""
+    n = int(data.get('size'))
+    n = max(5, min(MAX_COLLAPSE_SIZE, n))
+    params = parse_collapse_params(data.get('params'))
+    seed = data.get('seed')
+    seed = random.randrange(2**32) if seed is None else int(seed)
+    return {'size': n, 'seed': seed, 'grid': simulate_collapse_grid(n, params, seed)}
+
+def simulate_collapse(n: int, params: Optional[CollapseParams] = None, seed=None) -> List[List[int]]:
+    """生成 n×n 室内坍塌栅格（1=障碍，0=通路）；seed 的含义同 simulate_collapse_grid。"""
+    return simulate_collapse_grid(n, params, seed).to_rows()
\ No newline at end of file
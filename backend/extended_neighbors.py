@@ -1,11 +1,16 @@
 import heapq
+import math
+from array import array
 from typing import List, Tuple, Optional, Dict, Any
+from backend.grid import Grid, as_grid, is_grid_like
+from backend.lru import LRUCache
+from backend.metrics import stage
+from backend.pathformat import parse_path_format, encode_points
 
 # Full 5x5 neighborhood (all offsets within [-2,2] excluding (0,0)) — 24 directions
 DIRS_24 = [(dr, dc) for dr in range(-2, 3) for dc in range(-2, 3) if not (dr == 0 and dc == 0)]
 
 DIR_CODE: Dict[Tuple[int,int], int] = {d: i+1 for i, d in enumerate(DIRS_24)}
-
 def path_to_triplets(path: List[Tuple[int,int]]):
     trips = []
     for k in range(len(path)-1):
@@ -15,164 +20,382 @@ def path_to_triplets(path: List[Tuple[int,int]]):
         trips.append((r,c,d))
     return trips
 
-def extended_astar(grid, start, end):
-    n = len(grid); m = len(grid[0]) if n>0 else 0
+def supercover_cells(r, c, nr, nc):
+    """
+    Amanatides & Woo 栅格遍历：按顺序列举从格心 (c+0.5, r+0.5) 到格心 (nc+0.5, nr+0.5)
+    的线段经过的所有格子 (row, col)（含起终格）。恰好穿过格点时先沿行方向步进。
+    """
+    x0 = c + 0.5; y0 = r + 0.5
+    x1 = nc + 0.5; y1 = nr + 0.5
+    dx = x1 - x0
+    dy = y1 - y0
+
+    # 当前格坐标（整数格索引）
+    ix = int(math.floor(x0))
+    iy = int(math.floor(y0))
+    tx = int(math.floor(x1))
+    ty = int(math.floor(y1))
+    cells = [(iy, ix)]
+    if (ix, iy) == (tx, ty):
+        return cells
+
+    # 计算步进和 tDelta
+    if dx == 0.0:
+        step_x = 0
+        t_delta_x = float('inf')
+    else:
+        step_x = 1 if dx > 0 else -1
+        t_delta_x = abs(1.0 / dx)
+
+    if dy == 0.0:
+        step_y = 0
+        t_delta_y = float('inf')
+    else:
+        step_y = 1 if dy > 0 else -1
+        t_delta_y = abs(1.0 / dy)
+
+    # 计算初始 tMax：到下一个垂直/水平网格线的参数化距离
+    if step_x != 0:
+        t_max_x = ((ix + 1) - x0) * t_delta_x if step_x > 0 else (x0 - ix) * t_delta_x
+    else:
+        t_max_x = float('inf')
+    if step_y != 0:
+        t_max_y = ((iy + 1) - y0) * t_delta_y if step_y > 0 else (y0 - iy) * t_delta_y
+    else:
+        t_max_y = float('inf')
+
+    # 沿着射线遍历格子，直到到达目标格
+    while not (ix == tx and iy == ty):
+        if t_max_x < t_max_y:
+            ix += step_x
+            t_max_x += t_delta_x
+        else:
+            iy += step_y
+            t_max_y += t_delta_y
+        cells.append((iy, ix))
+    return cells
+
+
+def is_line_clear(grid, r, c, nr, nc):
+    """
+    从 (r,c) 到 (nr,nc) 的连线（格中心到格中心）是否只经过空格：精确的 supercover 判定，
+    避免丢样本或角落穿越问题。起终点在网格外视为不可通行。
+    """
+    n = len(grid); m = len(grid[0]) if n > 0 else 0
+    if not (0 <= r < n and 0 <= c < m and 0 <= nr < n and 0 <= nc < m):
+        return False
+    # 经过的格都在起终格的包围盒内，无需再做越界判断
+    for y, x in supercover_cells(r, c, nr, nc):
+        if grid[y][x] != 0:
+            return False
+    return True
+
+
+# 24 个偏移各自经过的格子（相对起点，含起终格）与欧氏步长：与位置无关，模块加载时算一次
+LINE_CELLS: Dict[Tuple[int,int], List[Tuple[int,int]]] = {d: supercover_cells(0, 0, d[0], d[1]) for d in DIRS_24}
+STEP_COST: Dict[Tuple[int,int], float] = {d: math.sqrt(d[0]*d[0] + d[1]*d[1]) for d in DIRS_24}
+
+_PAD = 2  # 偏移最远为 2，四周加两圈障碍即可省去越界判断
+
+# 超过该格数不再预建 24 张受阻表（表本身约 24 倍栅格大小，构建时还有移位副本），改为逐次检查连线
+LINE_TABLE_MAX_CELLS = 1_000_000
+
+
+def _padded2(grid: Grid) -> Tuple[bytearray, int]:
+    """四周加两圈障碍的扁平掩码，返回 (mask, W)，下标 (r+2)*W + (c+2)。"""
+    n, m = grid.shape
+    W = m + 2 * _PAD
+    pad = bytearray(b'\x01') * ((n + 2 * _PAD) * W)
+    data = grid.data
+    for r in range(n):
+        lo = (r + _PAD) * W + _PAD
+        pad[lo:lo + m] = data[r * m:(r + 1) * m]
+    return pad, W
+
+
+def _line_blocked(grid: Grid) -> Tuple[List[bytes], int]:
+    """
+    逐偏移的“连线受阻”表：blocked[k][u] 非 0 表示从 u 沿 DIRS_24[k] 的连线经过障碍（含起终格）。
+    整张掩码看作一个大整数，经过的每个相对格对应一次按字节移位后按位或，C 层一次完成。
+    """
+    mask, W = _padded2(grid)
+    size = len(mask)
+    base = int.from_bytes(mask, 'little')
+    # 各移位副本最后一次被用到的方向，用完即释放，避免同时持有全部副本
+    last = {dr * W + dc: k for k, d in enumerate(DIRS_24) for dr, dc in LINE_CELLS[d]}
+    shifted: Dict[int, int] = {}
+    out = []
+    for k, d in enumerate(DIRS_24):
+        acc = 0
+        for dr, dc in LINE_CELLS[d]:
+            off = dr * W + dc
+            v = shifted.get(off)
+            if v is None:
+                # 结果第 u 字节 = mask[u + off]
+                v = base >> (8 * off) if off >= 0 else (base << (-8 * off))
+                shifted[off] = v
+            acc |= v
+        for off in [off for off in shifted if last[off] == k]:
+            del shifted[off]
+        out.append((acc & ((1 << (8 * size)) - 1)).to_bytes(size, 'little'))
+    return out, W
+
+
+class _LineCheck:
+    """大图时代替单个偏移的受阻表：bad[u] 现场检查连线经过的格（掩码带两圈障碍，无需越界判断）。"""
+
+    __slots__ = ('mask', 'offs')
+
+    def __init__(self, mask: bytearray, offs: List[int]):
+        self.mask = mask
+        self.offs = offs
+
+    def __len__(self):
+        return len(self.mask)
+
+    def __getitem__(self, u: int) -> int:
+        mask = self.mask
+        for off in self.offs:
+            if mask[u + off]:
+                return 1
+        return 0
+
+
+# 按栅格哈希缓存受阻表（只读）
+_blocked_cache = LRUCache(maxsize=8, maxbytes=256 * 1024 * 1024, sizeof=lambda v: sum(len(b) for b in v[0]))
+
+
+def line_blocked_tables(grid: Grid) -> Tuple[List[Any], int]:
+    """
+    返回 (blocked, W)，blocked[k][u] 的含义同 _line_blocked；
+    格数超过 LINE_TABLE_MAX_CELLS 时为逐次检查的 _LineCheck，只占一份带边掩码。
+    """
+    n, m = grid.shape
+    if n * m > LINE_TABLE_MAX_CELLS:
+        mask, W = _padded2(grid)
+        return [_LineCheck(mask, [dr * W + dc for dr, dc in LINE_CELLS[d]]) for d in DIRS_24], W
+    key = grid.digest
+    tables = _blocked_cache.get(key)
+    if tables is None:
+        tables = _line_blocked(grid)
+        _blocked_cache.put(key, tables)
+    return tables
+
+
+def extended_astar(grid, start, end, stats: Optional[dict] = None):
+    """24 邻域 A*（欧氏步长与启发）；stats（可选 dict）填入 expanded。"""
+    grid = as_grid(grid)
+    n, m = grid.shape
     sr, sc = start; er, ec = end
     if not (0<=sr<n and 0<=sc<m and 0<=er<n and 0<=ec<m):
         return None, None
     if grid[sr][sc]==1 or grid[er][ec]==1:
         return None, None
 
-    def free(r,c):
-        return 0<=r<n and 0<=c<m and grid[r][c]==0
-
-    # 检查从 (r,c) 到 (nr,nc) 连线（格中心到格中心）是否穿过任何障碍格
-    # 使用密采样近似 supercover：对线段做若干采样点并取所在格集合进行检查。
-    def is_line_clear(r, c, nr, nc):
-        # 使用 Amanatides & Woo 的栅格遍历（ray-grid traversal）精确列举
-        # 从格心 (c+0.5, r+0.5) 到目标格心 (nc+0.5, nr+0.5) 的线段所经过的所有格子。
-        # 返回 True 当且仅当经过的所有格子均为空（0）。这是一个精确的 supercover 判定，避免丢样本或角落穿越问题。
-        import math
-        x0 = c + 0.5; y0 = r + 0.5
-        x1 = nc + 0.5; y1 = nr + 0.5
-
-        # 起始/结束在网格外视为不可通行
-        if not (0 <= r < n and 0 <= c < m and 0 <= nr < n and 0 <= nc < m):
-            return False
+    # 邻居合法性（目标格可走且连线不穿过障碍）查表即可，不再逐条做射线遍历
+    blocked, W = line_blocked_tables(grid)
+    nbrs = [(blocked[k], dr * W + dc, STEP_COST[(dr, dc)]) for k, (dr, dc) in enumerate(DIRS_24)]
+    size = len(blocked[0])
+    s = (sr + _PAD) * W + sc + _PAD
+    t = (er + _PAD) * W + ec + _PAD
 
-        dx = x1 - x0
-        dy = y1 - y0
+    # 对于使用 Euclidean 长跳权重，启发式使用欧氏距离以保持可采纳性
+    sqrt = math.sqrt
+    INF = float('inf')
+    g = array('d', [INF]) * size
+    f = array('d', [INF]) * size
+    prev = array('i', [-1]) * size
 
-        # 当前格坐标（整数格索引）
-        ix = int(math.floor(x0))
-        iy = int(math.floor(y0))
-        tx = int(math.floor(x1))
-        ty = int(math.floor(y1))
+    g[s] = 0.0
+    f[s] = sqrt((sr-er)**2 + (sc-ec)**2)
+    pq = [(f[s], s)]
+    heappush = heapq.heappush; heappop = heapq.heappop
+    expanded = 0
 
-        # 检查起点所在格
-        if grid[iy][ix] != 0:
-            return False
+    while pq:
+        fv, u = heappop(pq)
+        if fv!=f[u]:
+            continue
+        if u==t:
+            break
+        expanded += 1
+        gu = g[u]
+        # 扩展 5x5 邻居（使用 Euclidean 长跳代价和 supercover 检查）
+        for bad, off, step_cost in nbrs:
+            if bad[u]:
+                continue
+            v = u + off
+            tg = gu + step_cost
+            if tg < g[v]:
+                g[v] = tg
+                vr, vc = divmod(v, W)
+                dy = vr - _PAD - er; dx = vc - _PAD - ec
+                fv = tg + sqrt(dy*dy + dx*dx)
+                f[v] = fv
+                prev[v] = u
+                heappush(pq, (fv, v))
+
+    if stats is not None:
+        stats['expanded'] = expanded
+    if g[t] == INF:
+        return None, None
 
-        # 如果起终格相同，已检查起点即可
-        if (ix, iy) == (tx, ty):
-            return True
+    # 重建节点路径：每一段 (nodes[i] -> nodes[i+1]) 对应一个方向码，前端会按方向码展开为单位步用于渲染
+    nodes = []
+    cur = t
+    while cur >= 0:
+        r, c = divmod(cur, W)
+        nodes.append((r - _PAD, c - _PAD))
+        cur = prev[cur]
+    nodes.reverse()
 
-        # 计算步进和 tDelta
-        if dx == 0.0:
-            step_x = 0
-            t_delta_x = float('inf')
-        else:
-            step_x = 1 if dx > 0 else -1
-            t_delta_x = abs(1.0 / dx)
+    return path_to_triplets(nodes), g[t]
 
-        if dy == 0.0:
-            step_y = 0
-            t_delta_y = float('inf')
-        else:
-            step_y = 1 if dy > 0 else -1
-            t_delta_y = abs(1.0 / dy)
-
-        # 计算初始 tMax：到下一个垂直/水平网格线的参数化距离
-        if step_x != 0:
-            if step_x > 0:
-                t_max_x = ( (ix + 1) - x0 ) * t_delta_x
-            else:
-                t_max_x = ( x0 - ix ) * t_delta_x
-        else:
-            t_max_x = float('inf')
 
-        if step_y != 0:
-            if step_y > 0:
-                t_max_y = ( (iy + 1) - y0 ) * t_delta_y
-            else:
-                t_max_y = ( y0 - iy ) * t_delta_y
-        else:
-            t_max_y = float('inf')
+# 8 邻域（Theta* 的展开邻居），对应 DIRS_24 中的下标
+_DIRS_8 = [(dr, dc) for dr, dc in DIRS_24 if max(abs(dr), abs(dc)) == 1]
 
-        # 沿着射线遍历格子，直到到达目标格
-        # 在每次移动后立即检查新的格子是否为空
-        while not (ix == tx and iy == ty):
-            if t_max_x < t_max_y:
-                ix += step_x
-                t_max_x += t_delta_x
-            else:
-                iy += step_y
-                t_max_y += t_delta_y
 
-            if not (0 <= iy < n and 0 <= ix < m):
-                return False
-            if grid[iy][ix] != 0:
-                return False
-
-        return True
+def lazy_theta_star(grid, start, end, stats: Optional[dict] = None):
+    """
+    Lazy Theta*（Nash, Koenig 等）：8 邻域展开，生成邻居时先假定其与当前节点的父节点直接可视
+    （g 取经父节点直连的欧氏距离），出堆时才做一次视线检查，不可视则退回到已关闭邻居中的最优父节点。
+    视线检查与 extended_astar 相同：5x5 范围内查连线受阻表，更远的用 is_line_clear（精确 supercover）。
+    返回 (waypoints, cost)，waypoints 为 [(r, c), ...] 拐点序列（含起终点）；不可达返回 (None, None)。
+    """
+    grid = as_grid(grid)
+    n, m = grid.shape
+    sr, sc = start; er, ec = end
+    if not (0<=sr<n and 0<=sc<m and 0<=er<n and 0<=ec<m):
+        return None, None
+    if grid[sr][sc]==1 or grid[er][ec]==1:
+        return None, None
 
-    # 对于使用 Euclidean 长跳权重，启发式使用欧氏距离以保持可采纳性
-    def h(r,c):
-        dx = r - er; dy = c - ec
-        import math
-        return math.sqrt(dx*dx + dy*dy)
+    blocked, W = line_blocked_tables(grid)
+    near = {dr * W + dc: blocked[k] for k, (dr, dc) in enumerate(DIRS_24)}
+    nbrs = [(near[dr * W + dc], dr * W + dc, STEP_COST[(dr, dc)]) for dr, dc in _DIRS_8]
+    steps = [(near[dr * W + dc], dr * W + dc, dr, dc) for dr, dc in _DIRS_8]
+    size = len(blocked[0])
+    s = (sr + _PAD) * W + sc + _PAD
+    t = (er + _PAD) * W + ec + _PAD
 
+    sqrt = math.sqrt
     INF = float('inf')
-    g = [[INF]*m for _ in range(n)]
-    f = [[INF]*m for _ in range(n)]
-    prev = [[None]*m for _ in range(n)]
-
-    g[sr][sc] = 0.0
-    f[sr][sc] = h(sr,sc)
-    pq = [(f[sr][sc], sr, sc)]
+    checks = 0
+
+    def rc(u):
+        r, c = divmod(u, W)
+        return r - _PAD, c - _PAD
+
+    def dist(a, b):
+        ar, ac = divmod(a, W); br, bc = divmod(b, W)
+        return sqrt((ar - br) ** 2 + (ac - bc) ** 2)
+
+    def los(a, b):
+        nonlocal checks
+        checks += 1
+        ar, ac = divmod(a, W); br, bc = divmod(b, W)
+        if abs(ar - br) <= 2 and abs(ac - bc) <= 2:
+            return not near[b - a][a]
+        return is_line_clear(grid, ar - _PAD, ac - _PAD, br - _PAD, bc - _PAD)
+
+    g = array('d', [INF]) * size
+    f = array('d', [INF]) * size
+    parent = array('i', [-1]) * size
+    closed = bytearray(size)
+
+    tr, tc = divmod(t, W)
+    g[s] = 0.0
+    parent[s] = s
+    f[s] = dist(s, t)
+    pq = [(f[s], 0.0, s)]
+    heappush = heapq.heappush; heappop = heapq.heappop
+    expanded = 0
+    found = False
 
     while pq:
-        fv, r, c = heapq.heappop(pq)
-        if fv!=f[r][c]:
+        fv, _, u = heappop(pq)
+        if closed[u] or fv != f[u]:
             continue
-        if (r,c)==(er,ec):
+        # SetVertex：父节点不可视时改用已关闭邻居中的最优者（生成 u 的节点一定在其中）
+        p = parent[u]
+        if p != u and not los(p, u):
+            best = INF; bp = -1
+            for bad, off, step_cost in nbrs:
+                v = u - off
+                if closed[v] and not near[off][v]:
+                    cand = g[v] + step_cost
+                    if cand < best:
+                        best = cand; bp = v
+            g[u] = best
+            parent[u] = bp
+        closed[u] = 1
+        expanded += 1
+        if u == t:
+            found = True
             break
-        # 扩展 5x5 邻居（使用 Euclidean 长跳代价和 supercover 检查）
-        for idx, (dr, dc) in enumerate(DIRS_24, start=1):
-            nr, nc = r+dr, c+dc
-            if not (0<=nr<n and 0<=nc<m):
+        pu = parent[u]
+        gp = g[pu]
+        ur, uc = divmod(u, W)
+        pr, pc = divmod(pu, W)
+        for bad, off, dr, dc in steps:
+            if bad[u]:
                 continue
-            if not free(nr,nc):
+            v = u + off
+            if closed[v]:
                 continue
-            # 使用 supercover 风格的线段检查，确保连线（格中心到格中心）不穿过任何障碍格
-            if not is_line_clear(r, c, nr, nc):
-                continue
-
-            # 使用 Euclidean 长跳代价
-            import math
-            step_cost = math.sqrt(dr*dr + dc*dc)
-            tg = g[r][c] + step_cost
-            if tg < g[nr][nc]:
-                g[nr][nc] = tg
-                f[nr][nc] = tg + h(nr,nc)
-                prev[nr][nc] = (r,c)
-                heapq.heappush(pq, (f[nr][nc], nr, nc))
-
-    if g[er][ec] == INF:
+            # 路径 2：假定 parent(u) 与 v 直接可视
+            vr = ur + dr; vc = uc + dc
+            tg = gp + sqrt((vr - pr) * (vr - pr) + (vc - pc) * (vc - pc))
+            if tg < g[v]:
+                g[v] = tg
+                parent[v] = pu
+                fv = tg + sqrt((vr - tr) * (vr - tr) + (vc - tc) * (vc - tc))
+                f[v] = fv
+                heappush(pq, (fv, -tg, v))
+
+    if stats is not None:
+        stats['expanded'] = expanded
+        stats['losChecks'] = checks
+    if not found:
         return None, None
 
-    # 重建节点路径
     nodes = []
-    cur = (er,ec)
-    while cur:
-        nodes.append(cur)
-        pr = prev[cur[0]][cur[1]]
-        cur = pr
+    cur = t
+    while True:
+        nodes.append(rc(cur))
+        if cur == s:
+            break
+        cur = parent[cur]
     nodes.reverse()
+    return nodes, g[t]
+
+
+# 求解结果缓存：键为 (栅格哈希, algo, 起点, 终点)，值为 (triplets, cost, waypoints)，无路径时为 (None, None, None)
+_result_cache = LRUCache(maxsize=256, maxbytes=64 * 1024 * 1024,
+                         sizeof=lambda v: 64 + 160 * len(v[0] or ()))
 
-    # 将节点序列直接转为 triplets：每一段 (nodes[i] -> nodes[i+1]) 对应一个方向码
-    unit_path = []
-    for i in range(len(nodes)-1):
-        r0,c0 = nodes[i]; r1,c1 = nodes[i+1]
-        if not unit_path:
-            unit_path.append((r0,c0))
-        # 直接将目标点加入，前端会按方向码展开为单位步用于渲染
-        unit_path.append((r1,c1))
 
-    if not unit_path:
-        unit_path = [(sr,sc)]
+def result_cache_stats() -> dict:
+    return _result_cache.stats()
 
-    return path_to_triplets(unit_path), g[er][ec]
+
+def _solve_cached(algo: str, grid: Grid, start, end):
+    key = (grid.digest, algo, start, end)
+    hit = _result_cache.get(key)
+    if hit is not None:
+        return hit
+    if algo == 'lazytheta':
+        with stage('search'):
+            nodes, cost = lazy_theta_star(grid, start, end)
+        trips = None if nodes is None else path_to_triplets(nodes)
+    else:
+        with stage('search'):
+            trips, cost = extended_astar(grid, start, end)
+        nodes = None if trips is None else [(r, c) for r, c, _ in trips] + [end]
+    hit = (trips, cost, nodes)
+    _result_cache.put(key, hit)
+    return hit
 
 
 def _parse_point(pt):
@@ -189,25 +412,44 @@ def _parse_point(pt):
     return None
 
 def handle_solve_extended(data):
+    """
+    algo 为 extended（默认，24 邻域 A*）或 lazytheta（Lazy Theta* 任意角）。
+    返回 { ok, triplets, cost, waypoints }：waypoints 为拐点坐标 [[r, c], ...]，前端可直接连线，
+    无需方向码表；任意角线段超出 5x5 范围时对应三元组的方向码为 0。
+    """
     try:
         grid = data.get('grid')
         start = _parse_point(data.get('start'))
         end = _parse_point(data.get('end'))
+        algo = data.get('algo') or 'extended'
+        try:
+            path_format = parse_path_format(data.get('pathFormat'))
+        except ValueError as e:
+            return {'ok': False, 'error': str(e)}
 
-        if not isinstance(grid, list) or not grid or not isinstance(grid[0], list):
+        if not is_grid_like(grid):
+            return {'ok': False, 'error': 'invalid grid'}
+        try:
+            with stage('normalize'):
+                norm = as_grid(grid)
+        except ValueError:
             return {'ok': False, 'error': 'invalid grid'}
-        n = len(grid); m = len(grid[0])
+        n, m = norm.shape
         if not start or not end:
             return {'ok': False, 'error': 'invalid start/end'}
         sr, sc = start; er, ec = end
         if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m):
             return {'ok': False, 'error': 'start/end out of range'}
 
-        # 归一化
-        norm = [[1 if int(x) != 0 else 0 for x in row] for row in grid]
-        trips, cost = extended_astar(norm, (sr,sc), (er,ec))
+        if algo not in ('extended', 'lazytheta'):
+            return {'ok': False, 'error': 'invalid algo'}
+        trips, cost, nodes = _solve_cached(algo, norm, (sr,sc), (er,ec))
         if trips is None:
             return {'ok': False, 'error': 'no path'}
-        return {'ok': True, 'triplets': trips, 'cost': cost}
+        if path_format != 'triplets':
+            # 紧凑格式：path 取代 triplets 与逐格的 waypoints
+            with stage('format'):
+                return {'ok': True, 'algo': algo, 'cost': cost, 'path': encode_points(nodes, path_format)}
+        return {'ok': True, 'algo': algo, 'triplets': trips, 'cost': cost, 'waypoints': nodes}
     except Exception as e:
         return {'ok': False, 'error': str(e)}
\ No newline at end of file
@@ -0,0 +1,161 @@
+import hashlib
+from typing import List, Tuple
+
+# 归一化查表：0 -> 0，其余 -> 1（bytes.translate 在 C 层完成整行转换）
+_NORM_TABLE = bytes([0] + [1] * 255)
+
+
+class Grid:
+    """
+    紧凑 0/1 栅格（1=障碍，0=通路）：
+    - 数据以行主序存放在一块扁平 bytearray 中，下标 idx = r * stride + c；
+    - grid[r] 返回该行的只读 memoryview，兼容旧代码的 grid[r][c] 读取；写入须用 set()，
+      以便同时清除 digest 与外圈掩码（各结果缓存、HPA 与跳点图缓存均以 digest 为键）；
+    - digest 为内容哈希（含形状），惰性计算；直接改写 data 后需调用 touch()；
+    - padded_mask() 为四周加一圈障碍的掩码，供扁平下标搜索省去越界判断。
+    """
+    __slots__ = ('n', 'm', 'stride', 'data', '_rows', '_digest', '_padded')
+
+    def __init__(self, n: int, m: int, data=None):
+        if n <= 0 or m <= 0:
+            raise ValueError('invalid grid')
+        self.n = n
+        self.m = m
+        self.stride = m
+        if data is None:
+            data = bytearray(n * m)
+        elif not isinstance(data, bytearray):
+            data = bytearray(data)
+        if len(data) != n * m:
+            raise ValueError('grid data size mismatch')
+        self.data = data
+        view = memoryview(data).toreadonly()
+        self._rows = [view[r * m:(r + 1) * m] for r in range(n)]
+        self._digest = None
+        self._padded = None
+
+    @classmethod
+    def from_rows(cls, rows) -> 'Grid':
+        """由二维列表归一化构建（非 0 即障碍），整行转换，不逐格创建 Python 对象；内容哈希在转换时顺带算出。"""
+        if isinstance(rows, Grid):
+            return rows
+        if not isinstance(rows, list) or not rows or not isinstance(rows[0], (list, tuple)):
+            raise ValueError('invalid grid')
+        n = len(rows); m = len(rows[0])
+        if m == 0:
+            raise ValueError('invalid grid')
+        data = bytearray()
+        h = hashlib.blake2b(digest_size=16)
+        h.update(b'%d,%d;' % (n, m))
+        for row in rows:
+            if not isinstance(row, (list, tuple)) or len(row) != m:
+                raise ValueError('invalid grid')
+            try:
+                line = bytes(row).translate(_NORM_TABLE)
+            except (TypeError, ValueError):
+                # 含浮点/负数/字符串等，退回逐格 int() 判定
+                line = bytes(1 if int(x) != 0 else 0 for x in row)
+            data += line
+            h.update(line)
+        g = cls(n, m, data)
+        g._digest = h.hexdigest()
+        return g
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.n, self.m
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(b'%d,%d;' % (self.n, self.m))
+            h.update(self.data)
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def touch(self):
+        """内容被原地修改后清除缓存的哈希与派生掩码。"""
+        self._digest = None
+        self._padded = None
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, r):
+        return self._rows[r]
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def idx(self, r: int, c: int) -> int:
+        return r * self.stride + c
+
+    def rc(self, i: int) -> Tuple[int, int]:
+        return divmod(i, self.stride)
+
+    def in_bounds(self, r: int, c: int) -> bool:
+        return 0 <= r < self.n and 0 <= c < self.m
+
+    def get(self, r: int, c: int) -> int:
+        return self.data[r * self.stride + c]
+
+    def set(self, r: int, c: int, v: int):
+        v = 1 if v else 0
+        self.data[r * self.stride + c] = v
+        self._digest = None
+        if self._padded is not None:
+            self._padded[(r + 1) * (self.m + 2) + c + 1] = v
+
+    def padded_mask(self) -> bytearray:
+        """(n+2)*(m+2) 的障碍掩码，外圈全为 1；下标 (r+1)*(m+2)+(c+1)。"""
+        if self._padded is None:
+            n, m = self.n, self.m
+            w = m + 2
+            pad = bytearray(b'\x01') * ((n + 2) * w)
+            data = self.data
+            for r in range(n):
+                lo = (r + 1) * w + 1
+                pad[lo:lo + m] = data[r * m:(r + 1) * m]
+            self._padded = pad
+        return self._padded
+
+    def __reduce__(self):
+        # 行视图（memoryview）不可序列化：只传形状与数据，派生缓存在接收方按需重建
+        return Grid, (self.n, self.m, self.data)
+
+    def copy(self) -> 'Grid':
+        g = Grid(self.n, self.m, bytearray(self.data))
+        g._digest = self._digest
+        return g
+
+    def diff(self, other: 'Grid') -> List[Tuple[int, int]]:
+        """与同形状栅格逐行比较，仅在内容不同的行内逐格查找。"""
+        if self.shape != other.shape:
+            raise ValueError('grid shape mismatch')
+        out: List[Tuple[int, int]] = []
+        m = self.m
+        a = self.data; b = other.data
+        for r in range(self.n):
+            lo = r * m; hi = lo + m
+            if a[lo:hi] != b[lo:hi]:
+                for c in range(m):
+                    if a[lo + c] != b[lo + c]:
+                        out.append((r, c))
+        return out
+
+    def to_rows(self) -> List[List[int]]:
+        m = self.m
+        data = self.data
+        return [list(data[r * m:(r + 1) * m]) for r in range(self.n)]
+
+
+def as_grid(obj) -> Grid:
+    """接收 Grid 或二维列表，统一为 Grid（二维列表仅在此归一化一次）。"""
+    if isinstance(obj, Grid):
+        return obj
+    return Grid.from_rows(obj)
+
+
+def is_grid_like(obj) -> bool:
+    return isinstance(obj, Grid) or (isinstance(obj, list) and bool(obj) and isinstance(obj[0], list))
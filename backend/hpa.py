@@ -0,0 +1,418 @@
+import heapq
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from backend.grid import Grid
+from backend.costmap import safety_field, repair_safety_field
+from backend.search import grid_search, one_to_many, cells_to_triplets
+from backend.lru import LRUCache
+
+# 分层寻路（HPA*，Botea 等）：
+# - 栅格按 cluster x cluster 切块；相邻块的公共边上，两侧都可走的连续段为一个入口，
+#   短段（< 6）在中点放一对过渡格，长段在两端各放一对；安全模式下端点紧贴障碍、代价最高，
+#   改为在短段（或长段的前后两半）中取两侧代价之和最小的一对；过渡边代价为进入对侧格的代价；
+# - 块内各入口格之间的距离在块的子栅格上求得（复用 search.one_to_many），
+#   在抽象搜索首次进入该块时才计算并缓存（大图上只为实际经过的块付出代价）；
+# - 查询时把起终点接入所在块的入口格，在抽象图上做 A*，再逐段在块内细化为格子路径；
+# - 局部修改后只重扫受影响块四周的边界，只让受影响块（以及入口集合变化的邻块）的块内距离失效。
+# 结果为近似最优：路径只能经过选定的过渡格。
+
+INF = float('inf')
+
+DEFAULT_CLUSTER = 16
+MIN_CLUSTER = 4
+MAX_CLUSTER = 256
+_LONG_ENTRANCE = 6  # 入口长度达到该值时在两端各放一对过渡格
+
+
+class HPAGraph:
+    """可增量修补的分层抽象图；costs 为 None 时为单位代价，否则由 (radius, alpha) 维护安全代价场。"""
+
+    def __init__(self, grid: Grid, cluster: int = DEFAULT_CLUSTER,
+                 radius: Optional[int] = None, alpha: Optional[float] = None):
+        self.grid = grid.copy()
+        self.n, self.m = grid.shape
+        self.cluster = cluster
+        self.radius = radius
+        self.alpha = alpha
+        self.dist = None
+        self.costs = None
+        if radius is not None:
+            self.dist, self.costs = safety_field(self.grid, radius, alpha)
+        self.rows = (self.n + cluster - 1) // cluster
+        self.cols = (self.m + cluster - 1) // cluster
+        nk = self.rows * self.cols
+        # 边界 -> [(a, b)]，a/b 为两侧过渡格的扁平下标 r*m+c；键 (k, 0) 为块 k 的东边界，(k, 1) 为南边界
+        self.borders: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        self.portals: List[List[int]] = [[] for _ in range(nk)]
+        self.intra: List[Optional[Dict[int, List[Tuple[int, float]]]]] = [None] * nk
+        self._subs: List[Optional[tuple]] = [None] * nk
+        self.built = 0  # 已计算块内距离的块数（统计用）
+        for k in range(nk):
+            self._scan_borders(k)
+        for k in range(nk):
+            self.portals[k] = self._collect_portals(k)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.n, self.m
+
+    @property
+    def digest(self) -> str:
+        return self.grid.digest
+
+    # ------------------------------------------------------------------ 块与边界
+
+    def cluster_of(self, i: int) -> int:
+        r, c = divmod(i, self.m)
+        return (r // self.cluster) * self.cols + c // self.cluster
+
+    def _bounds(self, k: int) -> Tuple[int, int, int, int]:
+        cr, cc = divmod(k, self.cols)
+        r0 = cr * self.cluster; c0 = cc * self.cluster
+        return r0, min(r0 + self.cluster, self.n), c0, min(c0 + self.cluster, self.m)
+
+    def _scan_borders(self, k: int):
+        """重新计算块 k 的东、南边界上的过渡格对。"""
+        data = self.grid.data
+        m = self.m
+        r0, r1, c0, c1 = self._bounds(k)
+        cr, cc = divmod(k, self.cols)
+        if cc + 1 < self.cols:
+            # 东边界：(r, c1-1) | (r, c1)
+            self.borders[(k, 0)] = self._entrances(
+                [(r * m + c1 - 1, r * m + c1) for r in range(r0, r1)], data)
+        if cr + 1 < self.rows:
+            # 南边界：(r1-1, c) | (r1, c)
+            self.borders[(k, 1)] = self._entrances(
+                [((r1 - 1) * m + c, r1 * m + c) for c in range(c0, c1)], data)
+
+    def _entrances(self, pairs: List[Tuple[int, int]], data) -> List[Tuple[int, int]]:
+        out = []
+        run: List[Tuple[int, int]] = []
+        cheapest = lambda seg: min(seg, key=lambda ab: self._cost(ab[0]) + self._cost(ab[1]))
+        for a, b in pairs + [(-1, -1)]:
+            if a >= 0 and not data[a] and not data[b]:
+                run.append((a, b))
+                continue
+            if run:
+                if self.costs is None:
+                    if len(run) < _LONG_ENTRANCE:
+                        out.append(run[len(run) // 2])
+                    else:
+                        out.append(run[0])
+                        out.append(run[-1])
+                elif len(run) < _LONG_ENTRANCE:
+                    out.append(cheapest(run))
+                else:
+                    half = len(run) // 2
+                    out.append(cheapest(run[:half]))
+                    out.append(cheapest(run[half:]))
+                run = []
+        return out
+
+    def _neighbour_borders(self, k: int) -> List[Tuple[int, int]]:
+        """块 k 四周的边界键（东、南属于自身，西、北属于邻块）。"""
+        cr, cc = divmod(k, self.cols)
+        keys = []
+        if cc + 1 < self.cols:
+            keys.append((k, 0))
+        if cr + 1 < self.rows:
+            keys.append((k, 1))
+        if cc > 0:
+            keys.append((k - 1, 0))
+        if cr > 0:
+            keys.append((k - self.cols, 1))
+        return keys
+
+    def _collect_portals(self, k: int) -> List[int]:
+        seen = set()
+        out = []
+        for key in self._neighbour_borders(k):
+            for a, b in self.borders.get(key, ()):
+                u = a if key[0] == k else b
+                if u not in seen:
+                    seen.add(u)
+                    out.append(u)
+        return out
+
+    def _inter(self, u: int) -> List[Tuple[int, float]]:
+        """过渡格 u 跨边界的出边。"""
+        k = self.cluster_of(u)
+        out = []
+        for key in self._neighbour_borders(k):
+            for a, b in self.borders.get(key, ()):
+                if a == u:
+                    out.append((b, self._cost(b)))
+                elif b == u:
+                    out.append((a, self._cost(a)))
+        return out
+
+    def _cost(self, i: int) -> float:
+        if self.costs is None:
+            return 1.0
+        r, c = divmod(i, self.m)
+        return self.costs[(r + 1) * (self.m + 2) + c + 1]
+
+    # ------------------------------------------------------------------ 块内搜索
+
+    def _extract(self, r0: int, r1: int, c0: int, c1: int):
+        """矩形窗口的子栅格与（安全模式下）带外圈的子代价场：(grid, costs, r0, c0)。"""
+        m = self.m
+        data = self.grid.data
+        h = r1 - r0; cw = c1 - c0
+        g = Grid(h, cw, b''.join(data[r * m + c0:r * m + c1] for r in range(r0, r1)))
+        costs = None
+        if self.costs is not None:
+            W = m + 2; lw = cw + 2
+            costs = array('d', [INF]) * ((h + 2) * lw)
+            for lr in range(h):
+                lo = (r0 + lr + 1) * W + c0 + 1
+                costs[(lr + 1) * lw + 1:(lr + 1) * lw + 1 + cw] = self.costs[lo:lo + cw]
+        return g, costs, r0, c0
+
+    def _sub(self, k: int):
+        """块 k 的子栅格，按需构建并缓存。"""
+        sub = self._subs[k]
+        if sub is None:
+            sub = self._subs[k] = self._extract(*self._bounds(k))
+        return sub
+
+    def _local(self, k: int, i: int) -> Tuple[int, int]:
+        _, _, r0, c0 = self._sub(k)
+        r, c = divmod(i, self.m)
+        return r - r0, c - c0
+
+    def _to_global(self, k: int, cells: List[int]) -> List[int]:
+        return self._unmap(self._sub(k), cells)
+
+    def _unmap(self, sub, cells: List[int]) -> List[int]:
+        g, _, r0, c0 = sub
+        lw = g.m + 2
+        m = self.m
+        out = []
+        for u in cells:
+            lr, lc = divmod(u, lw)
+            out.append((r0 + lr - 1) * m + c0 + lc - 1)
+        return out
+
+    def _from(self, k: int, src: int, targets: List[int]):
+        """块内从 src 到各 targets 的 (cells, cost)。"""
+        g, costs, _, _ = self._sub(k)
+        return one_to_many(g, self._local(k, src), [self._local(k, t) for t in targets], costs=costs)
+
+    def _intra(self, k: int) -> Dict[int, List[Tuple[int, float]]]:
+        """块 k 内入口格两两之间的距离；反向距离由 d(q->p) = d(p->q) + c(p) - c(q) 得到。"""
+        edges = self.intra[k]
+        if edges is None:
+            ps = self.portals[k]
+            edges = {u: [] for u in ps}
+            for i, p in enumerate(ps):
+                rest = ps[i + 1:]
+                if not rest:
+                    break
+                for q, (cells, d) in zip(rest, self._from(k, p, rest)):
+                    if cells is None:
+                        continue
+                    edges[p].append((q, d))
+                    edges[q].append((p, d + self._cost(p) - self._cost(q)))
+            self.intra[k] = edges
+            self.built += 1
+        return edges
+
+    # ------------------------------------------------------------------ 增量修补
+
+    def update(self, changed: List[Tuple[int, int]], grid_now: Grid) -> int:
+        """应用 changed 中的格，返回块内距离被作废的块数。"""
+        if not changed:
+            return 0
+        g = self.grid
+        for r, c in changed:
+            g.set(r, c, grid_now.get(r, c))
+        cells = set(changed)
+        if self.costs is not None:
+            # 安全代价的变化会扩散到 radius 范围内（可能跨块）
+            W = self.m + 2
+            for u in repair_safety_field(g, self.dist, self.costs, changed, self.radius, self.alpha):
+                r, c = divmod(u, W)
+                cells.add((r - 1, c - 1))
+        C = self.cluster
+        dirty = {(r // C) * self.cols + c // C for r, c in cells}
+        keys = set()
+        for k in dirty:
+            keys.update(self._neighbour_borders(k))
+        for k, _ in keys:
+            self._scan_borders(k)
+        # 边界改动会改变两侧块的入口集合
+        around = set(dirty)
+        for k, side in keys:
+            around.add(k)
+            around.add(k + 1 if side == 0 else k + self.cols)
+        stale = 0
+        for k in around:
+            ps = self._collect_portals(k)
+            if k in dirty or ps != self.portals[k]:
+                self.portals[k] = ps
+                self.intra[k] = None
+                if k in dirty:
+                    self._subs[k] = None
+                stale += 1
+        return stale
+
+    # ------------------------------------------------------------------ 查询
+
+    def plan(self, start, goal, stats: Optional[dict] = None):
+        """返回 (cells, cost)，cells 为 r*m+c 扁平下标序列；不可达返回 (None, None)。"""
+        n, m = self.n, self.m
+        sr, sc = start; gr, gc = goal
+        if not (0 <= sr < n and 0 <= sc < m and 0 <= gr < n and 0 <= gc < m):
+            return None, None
+        data = self.grid.data
+        s = sr * m + sc; t = gr * m + gc
+        if data[s] or data[t]:
+            return None, None
+        if s == t:
+            return [s], 0.0
+        sk = self.cluster_of(s); gk = self.cluster_of(t)
+
+        # 起点 -> 所在块入口；入口 -> 终点由 终点 -> 入口 的路径反转得到
+        src = {}
+        for p, (cells, d) in zip(self.portals[sk], self._from(sk, s, self.portals[sk])):
+            if cells is not None:
+                src[p] = (d, cells)
+        dst = {}
+        ct = self._cost(t)
+        for p, (cells, d) in zip(self.portals[gk], self._from(gk, t, self.portals[gk])):
+            if cells is not None:
+                dst[p] = (d + ct - self._cost(p), cells[::-1])
+
+        # 起终点在同一块或相邻块时，另在两块合并的窗口内直接求解，避免绕行过渡格
+        best = INF; direct = None
+        skr, skc = divmod(sk, self.cols); gkr, gkc = divmod(gk, self.cols)
+        if abs(skr - gkr) <= 1 and abs(skc - gkc) <= 1:
+            a0, a1, b0, b1 = self._bounds(sk)
+            e0, e1, f0, f1 = self._bounds(gk)
+            win = self._extract(min(a0, e0), max(a1, e1), min(b0, f0), max(b1, f1))
+            wg, wcosts, r0, c0 = win
+            cells, d = grid_search(wg, (sr - r0, sc - c0), (gr - r0, gc - c0), costs=wcosts, heuristic=True)
+            if cells is not None:
+                best = d; direct = self._unmap(win, cells)
+
+        # 抽象图 A*：节点为过渡格；-1 / -2 表示起点 / 终点
+        heappush = heapq.heappush; heappop = heapq.heappop
+        g = {-1: 0.0}
+        parent = {-1: None}
+        closed = set()
+        heap = [(abs(sr - gr) + abs(sc - gc), 0.0, -1)]
+        expanded = 0
+        while heap:
+            f, _, u = heappop(heap)
+            if f >= best:
+                break
+            if u in closed:
+                continue
+            closed.add(u)
+            expanded += 1
+            if u == -2:
+                break
+            gu = g[u]
+            if u == -1:
+                nbrs = [(p, d) for p, (d, _) in src.items()]
+            else:
+                nbrs = self._intra(self.cluster_of(u)).get(u, []) + self._inter(u)
+                if u in dst:
+                    nbrs.append((-2, dst[u][0]))
+            for v, d in nbrs:
+                nd = gu + d
+                if nd < g.get(v, INF):
+                    g[v] = nd
+                    parent[v] = u
+                    if v == -2:
+                        h = 0
+                    else:
+                        vr, vc = divmod(v, m)
+                        h = abs(vr - gr) + abs(vc - gc)
+                    heappush(heap, (nd + h, -nd, v))
+        if stats is not None:
+            stats['expanded'] = expanded
+            stats['clusters'] = self.built
+
+        if g.get(-2, INF) < best:
+            nodes = []
+            u = -2
+            while u is not None:
+                nodes.append(u)
+                u = parent[u]
+            nodes.reverse()
+            return self._refine(nodes, src, dst, sk), g[-2]
+        if direct is None:
+            return None, None
+        return direct, best
+
+    def _refine(self, nodes: List[int], src, dst, sk: int) -> List[int]:
+        """把抽象路径逐段细化为格子路径：跨边界的一步直接相连，块内的一段在子栅格上求解。"""
+        out = self._to_global(sk, src[nodes[1]][1])
+        for a, b in zip(nodes[1:-2], nodes[2:-1]):
+            k = self.cluster_of(a)
+            if k != self.cluster_of(b):
+                out.append(b)
+                continue
+            sub, costs, _, _ = self._sub(k)
+            cells, _ = grid_search(sub, self._local(k, a), self._local(k, b), costs=costs, heuristic=True)
+            out.extend(self._to_global(k, cells)[1:])
+        last = nodes[-2]
+        out.extend(self._to_global(self.cluster_of(last), dst[last][1])[1:])
+        return out
+
+    def path(self, start, goal, stats: Optional[dict] = None):
+        """plan 的三元组版本：返回 (triplets, cost) 或 (None, None)。"""
+        cells, cost = self.plan(start, goal, stats=stats)
+        if cells is None:
+            return None, None
+        m = self.m
+        W = m + 2
+        padded = [(i // m + 1) * W + i % m + 1 for i in cells]
+        return cells_to_triplets(padded, W), cost
+
+
+# 抽象图缓存：按 (栅格哈希, 块大小, 半径, 权重) 共享；带会话 id 的图独占，局部修改时增量修补
+_cache = LRUCache(maxsize=8)
+_sessions = LRUCache(maxsize=16)
+
+
+def parse_cluster(value) -> int:
+    try:
+        k = DEFAULT_CLUSTER if value is None else int(value)
+    except (TypeError, ValueError):
+        raise ValueError('invalid cluster')
+    if not (MIN_CLUSTER <= k <= MAX_CLUSTER):
+        raise ValueError('invalid cluster')
+    return k
+
+
+def get_hpa(grid: Grid, cluster: int = DEFAULT_CLUSTER, radius: Optional[int] = None,
+            alpha: Optional[float] = None, session: Optional[str] = None) -> HPAGraph:
+    """
+    取得 grid 对应的抽象图。
+    - 无会话：按栅格哈希共享，未命中时新建；
+    - 有会话：取出该会话上次的图，形状与参数一致时只按 diff 修补受影响的块。
+    """
+    params = (cluster, radius, alpha)
+    if session is None:
+        key = (grid.digest,) + params
+        hpa = _cache.get(key)
+        if hpa is None:
+            hpa = HPAGraph(grid, cluster, radius, alpha)
+            _cache.put(key, hpa)
+        return hpa
+    hpa = _sessions.pop(session)
+    if hpa is None or hpa.shape != grid.shape or (hpa.cluster, hpa.radius, hpa.alpha) != params:
+        hpa = HPAGraph(grid, cluster, radius, alpha)
+    elif hpa.grid.data != grid.data:
+        hpa.update(hpa.grid.diff(grid), grid)
+    _sessions.put(session, hpa)
+    return hpa
+
+
+def hpa_cache_stats() -> dict:
+    return {'shared': _cache.stats(), 'sessions': _sessions.stats()}
@@ -0,0 +1,58 @@
+from typing import List, Tuple, Optional
+
+from backend.grid import Grid
+from backend.costmap import safety_field, repair_safety_field, SAFE_RADIUS, SAFE_WEIGHT
+from backend.search import grid_search, cells_to_points
+from backend.lru import LRUCache
+
+# a_star_jps 的跳点判定（与障碍相邻或自由度不为 2）在四连通网格上会选中全部空格：
+# 非跳点要求四个邻居都可走且自由度为 2，二者不可能同时成立。
+# 因此“跳点图”就是“空格 + 四邻接边，边权为进入格的安全代价”。
+# 这里以带外圈的通行掩码 + 安全代价数组保存这张图，余震每个 tick 只修补 changed 附近的格。
+
+
+class JumpPointGraph:
+    """可增量修补的跳点图（通行掩码 + 安全代价场）。"""
+
+    def __init__(self, grid: Grid, radius: int = SAFE_RADIUS, alpha: float = SAFE_WEIGHT):
+        self.grid = grid.copy()
+        self.radius = radius
+        self.alpha = alpha
+        self.dist, self.costs = safety_field(self.grid, radius, alpha)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.grid.shape
+
+    def matches(self, grid: Grid) -> bool:
+        return self.grid.shape == grid.shape and self.grid.data == grid.data
+
+    def update(self, changed: List[Tuple[int, int]], grid_now: Grid) -> List[int]:
+        """应用 changed 中的格到图上，返回代价发生变化的带外圈下标。"""
+        g = self.grid
+        for r, c in changed:
+            g.set(r, c, grid_now.get(r, c))
+        return repair_safety_field(g, self.dist, self.costs, changed, self.radius, self.alpha)
+
+    def plan(self, start, goal, stats: Optional[dict] = None):
+        """在缓存的图上做带权 A*，返回 (points, cost)；不可达返回 (None, None)。"""
+        sr, sc = start; gr, gc = goal
+        if self.grid.get(sr, sc) or self.grid.get(gr, gc):
+            return None, None
+        cells, cost = grid_search(self.grid, start, goal, costs=self.costs, heuristic=True, stats=stats)
+        if cells is None:
+            return None, None
+        return cells_to_points(cells, self.grid.m + 2), cost
+
+
+# 缓存：键为会话 id 或该图当前对应栅格的哈希（客户端下一 tick 回传的正是这张栅格）
+_cache = LRUCache(maxsize=16)
+
+
+def take_cached(key: str):
+    """取出并移除缓存项（同一会话同一时刻只会被一个请求使用）。"""
+    return _cache.pop(key)
+
+
+def put_cached(key: str, value):
+    _cache.put(key, value)
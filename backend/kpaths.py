@@ -0,0 +1,221 @@
+import heapq
+import time
+from array import array
+from typing import Iterator, List, Optional, Tuple
+
+from backend.grid import Grid
+from backend.search import acquire_workspace, release_workspace, pad_costs, trace_cells, grid_search
+
+# 流式 k 条最短简单路径（Yen 算法 + Lawler 改进）：
+# - 每次只从上一条路径的“偏离点”之后取支点（更早的支点在生成其父路径时已经处理过）；
+# - 支点前的根路径格在掩码中临时置为障碍，已知路径在支点处的下一步作为禁止的首步；
+# - 先做一次反向 Dijkstra 得到各格到终点的精确距离，作为所有支点搜索的启发值
+#   （封锁只会让距离变大，仍可采纳），支点搜索基本沿最短路树直达，只在被封锁处绕行；
+# - 候选放在堆中，按代价从小到大逐条产出；可选的 max_overlap 过滤与已产出路径重合过多的结果。
+# 栅格上代价相同或相近的路径极多，前若干条往往只差一两格；需要“彼此不同”的备选时用 diverse_paths：
+# 每得到一条路径就把其经过格的代价乘以 penalty 再搜索（惩罚法），按真实代价报告。
+# 代价模型与 search.grid_search 相同：每步代价为进入格的代价（costs 为 None 时为 1）。
+
+INF = float('inf')
+
+
+def _distance_to(blocked, costs, w: int, t: int) -> array:
+    """反向 Dijkstra：各格到 t 的最短代价（进入格代价之和，不含出发格），不可达为 INF。"""
+    dist = array('d', [INF]) * len(blocked)
+    dist[t] = 0.0
+    heappush = heapq.heappush; heappop = heapq.heappop
+    heap = [(0.0, t)]
+    while heap:
+        d, v = heappop(heap)
+        if d > dist[v]:
+            continue
+        # 前驱 u 经 v 到达 t 的代价为 d + cost(v)
+        nd = d + (1.0 if costs is None else costs[v])
+        for u in (v + 1, v + w, v - 1, v - w):
+            if not blocked[u] and nd < dist[u]:
+                dist[u] = nd
+                heappush(heap, (nd, u))
+    return dist
+
+
+def _spur_search(blocked, costs, w: int, s: int, t: int, banned, h: array, ws) -> Tuple[Optional[List[int]], float]:
+    """从支点 s 出发、首步不能进入 banned 的 A*（启发值 h）；s 视为已关闭，后续不会回到 s。"""
+    gen = ws.gen
+    g = ws.g; seen = ws.seen; closed = ws.closed; parent = ws.parent
+    heappush = heapq.heappush; heappop = heapq.heappop
+    closed[s] = gen
+    heap = []
+    k = 0
+    for v in (s + 1, s + w, s - 1, s - w):
+        k += 1
+        if blocked[v] or v in banned:
+            continue
+        nd = 1.0 if costs is None else costs[v]
+        if nd + h[v] < INF:
+            seen[v] = gen; g[v] = nd; parent[v] = k
+            heappush(heap, (nd + h[v], -nd, v))
+    while heap:
+        _, _, u = heappop(heap)
+        if closed[u] == gen:
+            continue
+        closed[u] = gen
+        if u == t:
+            return trace_cells(parent, w, s, t), g[t]
+        gu = g[u]
+        k = 0
+        for v in (u + 1, u + w, u - 1, u - w):
+            k += 1
+            if blocked[v] or closed[v] == gen:
+                continue
+            nd = gu + (1.0 if costs is None else costs[v])
+            if nd + h[v] < INF and (seen[v] != gen or nd < g[v]):
+                seen[v] = gen; g[v] = nd; parent[v] = k
+                heappush(heap, (nd + h[v], -nd, v))
+    return None, INF
+
+
+def k_shortest_paths(grid: Grid, start, end, costs=None, k: Optional[int] = None,
+                     time_limit: Optional[float] = None, max_overlap: Optional[float] = None,
+                     stats: Optional[dict] = None) -> Iterator[Tuple[List[int], float]]:
+    """
+    按代价从小到大惰性产出 start -> end 的简单路径 (cells, cost)，cells 为带外圈的扁平下标。
+    - k：最多产出的条数（None 为不限）；time_limit：秒，超时后停止并置 stats['timed_out']；
+    - max_overlap：0~1，只产出与每条已产出路径的共有格比例不超过该值的路径（k-diverse）。
+    """
+    if stats is not None:
+        stats['timed_out'] = False
+        stats['searches'] = 0
+    if k is not None and k <= 0:
+        return
+    n, m = grid.shape
+    w = m + 2
+    sr, sc = start; er, ec = end
+    if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m):
+        return
+    mask = bytearray(grid.padded_mask())  # 私有副本：根路径格会被临时置为障碍
+    if costs is not None and not (isinstance(costs, array) and len(costs) == len(mask)):
+        costs = pad_costs(costs, n, m)
+    s = (sr + 1) * w + sc + 1
+    t = (er + 1) * w + ec + 1
+    if mask[s] or mask[t]:
+        return
+    if s == t:
+        yield [s], 0.0
+        return
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    h = _distance_to(mask, costs, w, t)
+    if h[s] == INF:
+        return
+
+    found: List[List[int]] = []   # 已确定的路径（含被 max_overlap 过滤掉的，Yen 需要它们来生成后续候选）
+    kept: List[set] = []
+    seen = set()
+    heap = []
+    seq = 0
+    produced = 0
+    ws = acquire_workspace(len(mask))
+    try:
+        first, cost = _spur_search(mask, costs, w, s, t, (), h, ws)
+        seen.add(tuple(first))
+        heap.append((cost, seq, first, 0))
+        seq += 1
+        while heap:
+            cost, _, path, dev = heapq.heappop(heap)
+            found.append(path)
+            if max_overlap is None or all(len(c.intersection(path)) <= max_overlap * len(path) for c in kept):
+                if max_overlap is not None:
+                    kept.append(set(path))
+                produced += 1
+                yield path, cost
+                if k is not None and produced >= k:
+                    return
+
+            # 各已知路径与当前路径的公共前缀长度：支点 i 处需要禁止的首步为前缀长度 > i 的路径的第 i+1 格
+            lcp = []
+            for p in found:
+                j = 0
+                lim = min(len(p), len(path))
+                while j < lim and p[j] == path[j]:
+                    j += 1
+                lcp.append(j)
+            prefix = 0.0
+            for i in range(dev):
+                prefix += 1.0 if costs is None else costs[path[i + 1]]
+            blocked_root = []
+            try:
+                for u in path[:dev]:
+                    mask[u] = 1
+                    blocked_root.append(u)
+                for i in range(dev, len(path) - 1):
+                    spur = path[i]
+                    banned = {p[i + 1] for p, j in zip(found, lcp) if j > i and len(p) > i + 1}
+                    ws.next_gen()
+                    cells, spur_cost = _spur_search(mask, costs, w, spur, t, banned, h, ws)
+                    if stats is not None:
+                        stats['searches'] += 1
+                    if cells is not None:
+                        cand = path[:i] + cells
+                        key = tuple(cand)
+                        if key not in seen:
+                            seen.add(key)
+                            heapq.heappush(heap, (prefix + spur_cost, seq, cand, i))
+                            seq += 1
+                    if deadline is not None and time.monotonic() >= deadline:
+                        if stats is not None:
+                            stats['timed_out'] = True
+                        return
+                    # 下一个支点：当前支点并入根路径
+                    mask[spur] = 1
+                    blocked_root.append(spur)
+                    prefix += 1.0 if costs is None else costs[path[i + 1]]
+            finally:
+                for u in blocked_root:
+                    mask[u] = 0
+    finally:
+        release_workspace(ws)
+
+
+def diverse_paths(grid: Grid, start, end, costs=None, k: int = 5, max_overlap: float = 0.5,
+                  penalty: float = 2.0, time_limit: Optional[float] = None,
+                  stats: Optional[dict] = None) -> Iterator[Tuple[List[int], float]]:
+    """
+    惩罚法 k-diverse：逐条产出与每条已产出路径共有格比例不超过 max_overlap 的路径 (cells, cost)。
+    不保证代价有序；cost 为原代价模型下的真实代价。最多尝试 4k 次搜索。
+    """
+    if stats is not None:
+        stats['timed_out'] = False
+        stats['searches'] = 0
+    n, m = grid.shape
+    sr, sc = start; er, ec = end
+    if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m) or grid.get(sr, sc) or grid.get(er, ec):
+        return
+    w = m + 2
+    size = (n + 2) * w
+    if costs is None:
+        base = array('d', [1.0]) * size
+    elif isinstance(costs, array) and len(costs) == size:
+        base = costs
+    else:
+        base = pad_costs(costs, n, m)
+    work = array('d', base)  # 惩罚只作用于私有副本
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    kept: List[set] = []
+    produced = 0
+    for _ in range(4 * k):
+        cells, _ = grid_search(grid, start, end, costs=work, heuristic=True)
+        if stats is not None:
+            stats['searches'] += 1
+        if cells is None:
+            return
+        if all(len(c.intersection(cells)) <= max_overlap * len(cells) for c in kept):
+            kept.append(set(cells))
+            produced += 1
+            yield cells, sum(1.0 if costs is None else base[u] for u in cells[1:])
+            if produced >= k:
+                return
+        for u in cells[1:-1]:
+            work[u] *= penalty
+        if deadline is not None and time.monotonic() >= deadline:
+            if stats is not None:
+                stats['timed_out'] = True
+            return
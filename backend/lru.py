@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+class LRUCache:
+    """
+    线程安全的 LRU 缓存：
+    - maxsize 限制条目数，maxbytes（可选）配合 sizeof 限制总占用；
+    - hits / misses 计数，stats() 返回当前统计；
+    - on_evict（可选）在条目因超出容量被淘汰时以 (key, value) 调用（锁外执行），用于释放外部资源。
+    """
+
+    def __init__(self, maxsize: int = 32, maxbytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None,
+                 on_evict: Optional[Callable[[Any, Any], None]] = None):
+        self.maxsize = max(1, int(maxsize))
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._data: 'OrderedDict[Any, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def pop(self, key, default=None):
+        """取出并移除（用于同一时刻只允许一个使用者的可变状态）。"""
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return default
+            self._bytes -= item[1]
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.sizeof else 0
+        evicted = []
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if self.maxbytes is not None and size > self.maxbytes:
+                evicted.append((key, value))
+            else:
+                self._data[key] = (value, size)
+                self._bytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self._bytes > self.maxbytes):
+                k, (v, sz) = self._data.popitem(last=False)
+                self._bytes -= sz
+                evicted.append((k, v))
+        if self.on_evict is not None:
+            for k, v in evicted:
+                self.on_evict(k, v)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._data), 'bytes': self._bytes,
+                    'hits': self.hits, 'misses': self.misses}
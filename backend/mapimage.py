@@ -0,0 +1,207 @@
+import hashlib
+import os
+import threading
+import time
+from io import BytesIO
+from typing import Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.lru import LRUCache
+
+# 静态底图的获取与磁盘缓存：
+# - 图源可替换：HTTPImageProvider 请求百度静态图 API 或任何兼容的本地 HTTP 替身，
+#   DirectoryProvider 从本地目录读取预置图片（测试与离线使用）；
+# - DiskImageCache 按 (图源, 中心, zoom, 宽, 高) 的哈希命名文件，容量按字节数 LRU 淘汰，可设 TTL；
+#   重启时扫描目录恢复索引（按修改时间排 LRU 顺序）。
+
+BAIDU_STATIC_URL = 'https://api.map.baidu.com/staticimage/v2'
+
+
+class ImageFetchError(Exception):
+    """图源返回非图片或请求失败；url / body 便于排查。"""
+
+    def __init__(self, msg: str, url: Optional[str] = None, body: Optional[str] = None):
+        super().__init__(msg)
+        self.url = url
+        self.body = body
+
+
+def image_key(lng: float, lat: float, zoom: int, width: int, height: int) -> Tuple:
+    """缓存键：经纬度取 6 位小数（约 0.1 米），避免浮点表示差异导致重复拉取。"""
+    return (round(float(lng), 6), round(float(lat), 6), int(zoom), int(width), int(height))
+
+
+class HTTPImageProvider:
+    """
+    HTTP 图源：GET base_url?center=lng,lat&zoom&width&height[&ak]&copyright=1。
+    同一实例复用一个带连接池的 requests.Session，避免每次重新握手。
+    """
+
+    def __init__(self, base_url: str = BAIDU_STATIC_URL, ak: Optional[str] = None,
+                 timeout: float = 10, pool_size: int = 8):
+        self.base_url = base_url
+        self.ak = ak
+        self.timeout = timeout
+        self.name = 'http:' + base_url
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def url(self, lng, lat, zoom, width, height) -> str:
+        params = {'zoom': int(zoom), 'width': int(width), 'height': int(height), 'copyright': '1'}
+        if self.ak:
+            params = {'ak': self.ak, **params}
+        return f"{self.base_url}?center={lng},{lat}&{urlencode(params)}"
+
+    def fetch(self, lng, lat, zoom, width, height) -> bytes:
+        url = self.url(lng, lat, zoom, width, height)
+        r = self._session.get(url, timeout=self.timeout)
+        r.raise_for_status()
+        ctype = r.headers.get('Content-Type', '')
+        if 'image' not in ctype.lower():
+            raise ImageFetchError(f'static image not image: {ctype}', url, r.text[:200])
+        return r.content
+
+
+class DirectoryProvider:
+    """
+    本地目录图源：依次查找 {lng}_{lat}_{zoom}_{width}x{height}.png、{zoom}_{width}x{height}.png、default.png；
+    只找到 default.png 时缩放到请求的宽高，便于用一张图覆盖任意请求。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.name = 'dir:' + os.path.abspath(root)
+
+    def fetch(self, lng, lat, zoom, width, height) -> bytes:
+        for fname in (f'{lng}_{lat}_{zoom}_{width}x{height}.png', f'{zoom}_{width}x{height}.png'):
+            path = os.path.join(self.root, fname)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+        path = os.path.join(self.root, 'default.png')
+        if not os.path.isfile(path):
+            raise ImageFetchError(f'no fixture image for {lng},{lat} z{zoom} {width}x{height}', self.root)
+        from PIL import Image
+        with Image.open(path) as img:
+            if img.size == (width, height):
+                with open(path, 'rb') as f:
+                    return f.read()
+            buf = BytesIO()
+            img.convert('RGB').resize((width, height)).save(buf, format='PNG')
+            return buf.getvalue()
+
+
+def make_provider(kind: str, ak: Optional[str] = None, url: Optional[str] = None,
+                  root: Optional[str] = None, timeout: float = 10):
+    """按名称构造图源：baidu（默认）、http（本地替身，url 必填）、dir（本地目录，root 必填）。"""
+    if kind == 'dir':
+        if not root:
+            raise ValueError('dir provider needs root')
+        return DirectoryProvider(root)
+    if kind == 'http':
+        if not url:
+            raise ValueError('http provider needs url')
+        return HTTPImageProvider(url, ak=None, timeout=timeout)
+    if kind == 'baidu':
+        return HTTPImageProvider(BAIDU_STATIC_URL, ak=ak, timeout=timeout)
+    raise ValueError(f'unknown map provider: {kind}')
+
+
+class DiskImageCache:
+    """
+    磁盘图片缓存：文件名为 sha1(图源名 + 键)，内容为图源返回的原始字节。
+    - max_bytes：总字节上限，超出时按最近使用顺序淘汰并删除文件；
+    - ttl：秒，None 为永不过期；过期条目在读取时删除并视为未命中。
+    """
+
+    def __init__(self, root: str, max_bytes: int = 256 * 1024 * 1024, ttl: Optional[float] = None):
+        self.root = root
+        self.ttl = ttl
+        self._index = LRUCache(maxsize=1 << 20, maxbytes=max_bytes, sizeof=lambda v: v[0],
+                               on_evict=lambda name, v: self._remove(name))
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name + '.img')
+
+    def _remove(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def _load(self):
+        """首次使用时扫描目录，按修改时间从旧到新放入索引（最新的最后淘汰）。"""
+        with self._lock:
+            if self._loaded:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            entries = []
+            for fname in os.listdir(self.root):
+                if not fname.endswith('.img'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.root, fname))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, fname[:-4], st.st_size))
+            entries.sort()
+            for mtime, name, size in entries:
+                self._index.put(name, (size, mtime))
+            self._loaded = True
+
+    @staticmethod
+    def name_for(provider_name: str, key: Tuple) -> str:
+        return hashlib.sha1(repr((provider_name,) + tuple(key)).encode('utf-8')).hexdigest()
+
+    def get(self, name: str) -> Optional[bytes]:
+        self._load()
+        meta = self._index.get(name)
+        if meta is None:
+            return None
+        if self.ttl is not None and time.time() - meta[1] > self.ttl:
+            self._index.pop(name)
+            self._remove(name)
+            return None
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except OSError:
+            self._index.pop(name)
+            return None
+
+    def put(self, name: str, content: bytes):
+        self._load()
+        path = self._path(name)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)  # 原子替换，并发写同一键时读者总能看到完整文件
+        self._index.put(name, (len(content), time.time()))
+
+    def stats(self) -> dict:
+        self._load()
+        return self._index.stats()
+
+
+def fetch_static_image(provider, cache: Optional[DiskImageCache], lng, lat, zoom, width, height) -> Tuple[bytes, str, bool]:
+    """
+    先查缓存再请求图源，返回 (图片字节, 缓存名, 是否命中)。
+    缓存名同时作为该图的内容标识（同一图源同一键的图片视为相同）。
+    """
+    key = image_key(lng, lat, zoom, width, height)
+    name = DiskImageCache.name_for(provider.name, key)
+    if cache is not None:
+        content = cache.get(name)
+        if content is not None:
+            return content, name, True
+    content = provider.fetch(lng, lat, zoom, width, height)
+    if cache is not None:
+        cache.put(name, content)
+    return content, name, False
@@ -0,0 +1,148 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+# 请求耗时分解与 Prometheus 指标：
+# - Timings 记录一次请求内各阶段（读取、JSON 解析、栅格归一化、代价场、搜索、序列化……）的累计耗时，
+#   serve 把它写入 Server-Timing 响应头，并在响应写完后计入直方图；
+# - 后端入口用 stage(name) 包住各阶段；当前线程没有在收集时为空操作，直接调用（基准、脚本）不受影响；
+# - 进程池 worker 中的阶段耗时随结果带回服务进程合并（见 workers.py），直方图只保存在服务进程中；
+# - render() 输出 Prometheus 文本格式（GET /api/metrics）。
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = tuple(256 * 4 ** i for i in range(10))  # 256 B ~ 64 MB
+
+
+class Timings:
+    """一次请求的阶段耗时（秒）；同名阶段累加，按首次出现的顺序输出。"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def merge(self, stages: Dict[str, float]):
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+    def header(self, total: Optional[float] = None) -> str:
+        """Server-Timing 头的取值：name;dur=毫秒, ...；total 为整个请求的耗时。"""
+        items = list(self.stages.items())
+        if total is not None:
+            items.append(('total', total))
+        return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in items)
+
+
+_local = threading.local()
+
+
+def current() -> Optional[Timings]:
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def collect(timings: Optional[Timings] = None):
+    """在当前线程收集阶段耗时（yield 收集器），结束后恢复之前的收集器。"""
+    t = Timings() if timings is None else timings
+    prev = current()
+    _local.timings = t
+    try:
+        yield t
+    finally:
+        _local.timings = prev
+
+
+@contextmanager
+def stage(name: str):
+    t = current()
+    if t is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        t.add(name, time.perf_counter() - t0)
+
+
+def _label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Histogram:
+    """带标签的直方图，按 Prometheus 语义输出累计桶（le）、_sum 与 _count。"""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # 标签取值 -> [各桶计数..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0] * len(self.buckets) + [0, 0]
+            i = bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        for key, s in series:
+            base = ','.join(f'{l}="{_label(v)}"' for l, v in zip(self.labels, key))
+            sep = ',' if base else ''
+            acc = 0
+            for b, c in zip(self.buckets, s):
+                acc += c
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{_num(b)}"}} {acc}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {s[-1]}')
+            lines.append(f'{self.name}_sum{{{base}}} {_num(s[-2])}')
+            lines.append(f'{self.name}_count{{{base}}} {s[-1]}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('flyway_request_seconds', 'Total time spent handling an API request.',
+                            ('route', 'code'), SECONDS_BUCKETS)
+STAGE_SECONDS = Histogram('flyway_stage_seconds', 'Time spent in each stage of an API request.',
+                          ('route', 'stage'), SECONDS_BUCKETS)
+REQUEST_BYTES = Histogram('flyway_request_bytes', 'Size of API request bodies.', ('route',), BYTES_BUCKETS)
+RESPONSE_BYTES = Histogram('flyway_response_bytes', 'Size of API response bodies.', ('route',), BYTES_BUCKETS)
+
+
+def observe_request(route: str, code: int, timings: Timings, seconds: float, request_bytes: int, response_bytes: int):
+    REQUEST_SECONDS.observe(seconds, route, str(code))
+    for name, s in timings.stages.items():
+        STAGE_SECONDS.observe(s, route, name)
+    REQUEST_BYTES.observe(request_bytes, route)
+    RESPONSE_BYTES.observe(response_bytes, route)
+
+
+def samples(name: str, doc: str, kind: str, values: Dict[tuple, float], labels: Sequence[str] = ()) -> List[str]:
+    """输出一组现成的取值（kind 为 gauge 或 counter，如缓存条目数 / 命中次数），values 的键为标签取值元组。"""
+    lines = [f'# HELP {name} {doc}', f'# TYPE {name} {kind}']
+    for key, v in sorted(values.items()):
+        base = ','.join(f'{l}="{_label(x)}"' for l, x in zip(labels, key))
+        lines.append(f'{name}{{{base}}} {_num(v)}' if base else f'{name} {_num(v)}')
+    return lines
+
+
+def render(extra: Sequence[str] = ()) -> str:
+    lines: List[str] = []
+    for h in (REQUEST_SECONDS, STAGE_SECONDS, REQUEST_BYTES, RESPONSE_BYTES):
+        lines += h.render()
+    lines += extra
+    return '\n'.join(lines) + '\n'
\ No newline at end of file
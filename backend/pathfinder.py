@@ -1,50 +1,27 @@
-import heapq
-from typing import List, Tuple, Dict, Any
-from collections import deque
+from typing import List, Tuple, Dict, Any, Optional
+from backend.grid import as_grid, is_grid_like
+from backend.search import shortest_path, jps_path, bidirectional_path, one_to_many, cells_to_triplets, cells_to_points
+from backend.costmap import safety_costs, parse_safety_params, SAFE_RADIUS, SAFE_WEIGHT
+from backend.hpa import get_hpa, parse_cluster
+from backend.kpaths import k_shortest_paths, diverse_paths
+from backend.lru import LRUCache
+from backend.metrics import stage
+from backend.pathformat import parse_path_format, format_triplets, encode_points
 
 # 东南西北
 DIRS = [(0,1),(1,0),(0,-1),(-1,0)]  
 DIR_CODE = {(0,1):1,(1,0):2,(0,-1):3,(-1,0):4}
 
-def find_all_paths(grid, start, end):
+def find_all_paths(grid, start, end, k=None, time_limit=None):
     """
-    递归形式的算法，求得楼内部所有可能的通路
+    求得楼内部的通路：按长度从短到长逐条生成简单路径（k 条最短路，见 backend.kpaths），
+    不再递归枚举；k / time_limit 为空时枚举全部（数量随栅格规模指数增长，大图请务必限制）。
     """
-    n = len(grid)
-    m = len(grid[0]) if n > 0 else 0
+    grid = as_grid(grid)
+    w = grid.m + 2
     all_paths = []
-    
-    def dfs(current, path, visited):
-        r, c = current
-        
-        # 到达终点，保存路径
-        if current == end:
-            all_paths.append(path.copy())
-            return
-        
-        # 四个方向：东、南、西、北
-        for dr, dc in DIRS:
-            nr, nc = r + dr, c + dc
-            next_pos = (nr, nc)
-            
-            # 检查新位置是否有效且未被访问
-            if (0 <= nr < n and 0 <= nc < m and 
-                grid[nr][nc] == 0 and next_pos not in visited):
-                
-                visited.add(next_pos)
-                path.append(next_pos)
-                
-                # 递归搜索
-                dfs(next_pos, path, visited)
-                
-                # 回溯
-                path.pop()
-                visited.remove(next_pos)
-    
-    # 初始化搜索
-    visited = set()
-    visited.add(start)
-    dfs(start, [start], visited)
+    for cells, _ in k_shortest_paths(grid, tuple(start), tuple(end), k=k, time_limit=time_limit):
+        all_paths.append(cells_to_points(cells, w))
     return all_paths
 def path_to_triplets(path):
     trips = []
@@ -93,364 +70,108 @@ def format_all_paths_as_matrices(grid, all_paths):
         matrices.append(mat)
     
     return matrices
-def dijkstra(grid, start, end):
-    n = len(grid)
-    m = len(grid[0]) if n>0 else 0
-    sr, sc = start
-    er, ec = end
-    dist = [[float('inf')]*m for _ in range(n)]
-    prev = [[None]*m for _ in range(n)]
-    dist[sr][sc] = 0.0
-    pq = [(0.0, sr, sc)]
-
-    def step():
-        if not pq:
-            return
-        d, r, c = heapq.heappop(pq)
-        # 过期条目跳过
-        if d != dist[r][c]:
-            return step()
-        # 提前终止条件
-        if (r, c) == (er, ec):
-            return
-        for dr, dc in DIRS:
-            nr, nc = r + dr, c + dc
-            if 0 <= nr < n and 0 <= nc < m and grid[nr][nc] == 0:
-                nd = d + 1.0
-                if nd < dist[nr][nc]:
-                    dist[nr][nc] = nd
-                    prev[nr][nc] = (r, c)
-                    heapq.heappush(pq, (nd, nr, nc))
-        # 递归处理下一个队列元素
-        return step()
-    step()
-
-    if dist[er][ec] == float('inf'):
-        return None, None
-    path = []
-    cur = (er, ec)
-    while cur:
-        path.append(cur)
-        pr = prev[cur[0]][cur[1]]
-        cur = pr
-    path.reverse()
-    return path_to_triplets(path), dist[er][ec]
-
-def a_star(grid, start, end):
-    n = len(grid)
-    m = len(grid[0]) if n > 0 else 0
-    sr, sc = start
-    er, ec = end
-
-    def h(r, c):
-        return abs(r - er) + abs(c - ec)
-
-    INF = float('inf')
-    g = [[INF] * m for _ in range(n)]
-    f = [[INF] * m for _ in range(n)]
-    prev = [[None] * m for _ in range(n)]
-
-    open_set = []  # 优先队列
-    open_dict = {}  # Open 表，用于快速查找
-    close_set = set()  # Close 表
-
-    g[sr][sc] = 0.0
-    f[sr][sc] = h(sr, sc)
-    heapq.heappush(open_set, (f[sr][sc], sr, sc))
-    open_dict[(sr, sc)] = f[sr][sc]
-
-    while open_set:
-        _, r, c = heapq.heappop(open_set)
-        open_dict.pop((r, c), None)
-
-        if (r, c) == (er, ec):
-            break
-
-        if (r, c) in close_set:
-            continue
-        close_set.add((r, c))
-
-        for dr, dc in DIRS:
-            nr, nc = r + dr, c + dc
-            if 0 <= nr < n and 0 <= nc < m and grid[nr][nc] == 0:
-                tentative_g = g[r][c] + 1.0
-                if tentative_g < g[nr][nc]:
-                    g[nr][nc] = tentative_g
-                    f[nr][nc] = tentative_g + h(nr, nc)
-                    prev[nr][nc] = (r, c)
-                    if (nr, nc) not in close_set and (nr, nc) not in open_dict:
-                        heapq.heappush(open_set, (f[nr][nc], nr, nc))
-                        open_dict[(nr, nc)] = f[nr][nc]
-
-    if g[er][ec] == INF:
+# 以下各求解函数的 stats（可选 dict）由搜索填入 expanded 等计数，供基准测试使用
+
+def dijkstra(grid, start, end, stats: Optional[dict] = None):
+    grid = as_grid(grid)
+    return shortest_path(grid, tuple(start), tuple(end), heuristic=False, stats=stats)
+
+def a_star(grid, start, end, stats: Optional[dict] = None):
+    grid = as_grid(grid)
+    return shortest_path(grid, tuple(start), tuple(end), heuristic=True, stats=stats)
+
+def bidirectional(grid, start, end, costs=None, heuristic=True, stats: Optional[dict] = None):
+    # 双向 A*（heuristic=True）/ 双向 Dijkstra；costs 为 None 时为单位代价
+    grid = as_grid(grid)
+    sr, sc = start; er, ec = end
+    if costs is not None and (grid[sr][sc]==1 or grid[er][ec]==1):
         return None, None
-    path = []
-    cur = (er, ec)
-    while cur:
-        path.append(cur)
-        cur = prev[cur[0]][cur[1]]
-    path.reverse()
-    return path_to_triplets(path), g[er][ec]
+    return bidirectional_path(grid, (sr, sc), (er, ec), costs=costs, heuristic=heuristic, stats=stats)
+
+def jump_point_search(grid, start, end, stats: Optional[dict] = None):
+    # 在线 JPS（仅适用于单位代价），结果与 a_star 等价
+    grid = as_grid(grid)
+    return jps_path(grid, tuple(start), tuple(end), stats=stats)
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 
-def _compute_safety_cost(grid):
-    radius = 3   # 安全半径
-    alpha = 1.25 # 安全权重
-    n = len(grid); m = len(grid[0]) if n>0 else 0
-    INF = float('inf')
-    dist = [[INF]*m for _ in range(n)]
-    q = deque()
-    # 多源 BFS：障碍为源，距离=0
-    for r in range(n):
-        for c in range(m):
-            if grid[r][c] == 1:
-                dist[r][c] = 0
-                q.append((r,c))
-    while q:
-        r,c = q.popleft()
-        d0 = dist[r][c]
-        for dr,dc in DIRS:
-            nr, nc = r+dr, c+dc
-            if 0<=nr<n and 0<=nc<m and dist[nr][nc] == INF:
-                if grid[nr][nc] == 0:
-                    dist[nr][nc] = d0 + 1
-                    q.append((nr,nc))
-    # 生成代价
-    costs: List[List[float]] = [[INF]*m for _ in range(n)]
-    for r in range(n):
-        for c in range(m):
-            if grid[r][c] == 1:
-                costs[r][c] = INF
-            else:
-                d = dist[r][c]
-                if d == INF:
-                    penalty = 0.0
-                else:
-                    penalty = max(0.0, (radius - float(d)) / max(1.0, float(radius)))
-                costs[r][c] = 1.0 + alpha * penalty
-    return costs
+def _compute_safety_cost(grid, radius=SAFE_RADIUS, alpha=SAFE_WEIGHT):
+    """
+    安全代价场：到最近障碍的距离 d < radius 时，进入代价为 1 + alpha * (radius - d) / radius，障碍为 INF。
+    返回与 Grid.padded_mask() 同布局的扁平 array('d')（按栅格哈希与参数缓存，只读）。
+    """
+    with stage('safety'):
+        return safety_costs(as_grid(grid), radius, alpha)
 
-def dijkstra_weighted(grid, costs, start, end):
-    n = len(grid); m = len(grid[0]) if n>0 else 0
+def dijkstra_weighted(grid, costs, start, end, stats: Optional[dict] = None):
+    grid = as_grid(grid)
     sr, sc = start; er, ec = end
-    INF = float('inf')
     if grid[sr][sc]==1 or grid[er][ec]==1:
         return None, None
-    dist = [[INF]*m for _ in range(n)]
-    prev = [[None]*m for _ in range(n)]
-    dist[sr][sc] = 0.0
-    pq = [(0.0, sr, sc)]
-    while pq:
-        d, r, c = heapq.heappop(pq)
-        if d!=dist[r][c]:
-            continue
-        if (r,c)==(er,ec):
-            break
-        for dr,dc in DIRS:
-            nr, nc = r+dr, c+dc
-            if 0<=nr<n and 0<=nc<m and grid[nr][nc]==0:
-                step = costs[nr][nc]
-                if step == INF:
-                    continue
-                nd = d + step
-                if nd < dist[nr][nc]:
-                    dist[nr][nc] = nd
-                    prev[nr][nc] = (r,c)
-                    heapq.heappush(pq, (nd, nr, nc))
-    if dist[er][ec] == INF:
-        return None, None
-    path = []
-    cur = (er,ec)
-    while cur:
-        path.append(cur)
-        pr = prev[cur[0]][cur[1]]
-        cur = pr
-    path.reverse()
-    return path_to_triplets(path), dist[er][ec]
-
-def a_star_weighted(grid, costs, start, end):
-    n = len(grid); m = len(grid[0]) if n>0 else 0
+    return shortest_path(grid, (sr, sc), (er, ec), costs=costs, heuristic=False, stats=stats)
+
+def a_star_weighted(grid, costs, start, end, stats: Optional[dict] = None):
+    # 下界启发：每步至少 1（曼哈顿距离）
+    grid = as_grid(grid)
     sr, sc = start; er, ec = end
-    INF = float('inf')
     if grid[sr][sc]==1 or grid[er][ec]==1:
         return None, None
-
-    def h(r:int,c:int)->float:
-        # 下界启发：每步至少 1
-        return abs(r-er) + abs(c-ec)
-
-    g = [[INF]*m for _ in range(n)]
-    f = [[INF]*m for _ in range(n)]
-    prev = [[None]*m for _ in range(n)]
-    g[sr][sc] = 0.0
-    f[sr][sc] = h(sr,sc)
-    pq = [(f[sr][sc], sr, sc)]
-    while pq:
-        fv, r, c = heapq.heappop(pq)
-        if fv!=f[r][c]:
-            continue
-        if (r,c)==(er,ec):
-            break
-        for dr,dc in DIRS:
-            nr, nc = r+dr, c+dc
-            if 0<=nr<n and 0<=nc<m and grid[nr][nc]==0:
-                step = costs[nr][nc]
-                if step == INF:
-                    continue
-                tg = g[r][c] + step
-                if tg < g[nr][nc]:
-                    g[nr][nc] = tg
-                    f[nr][nc] = tg + h(nr,nc)
-                    prev[nr][nc] = (r,c)
-                    heapq.heappush(pq, (f[nr][nc], nr, nc))
-    if g[er][ec] == INF:
-        return None, None
-    path = []
-    cur = (er,ec)
-    while cur:
-        path.append(cur)
-        pr = prev[cur[0]][cur[1]]
-        cur = pr
-    path.reverse()
-    return path_to_triplets(path), g[er][ec]
+    return shortest_path(grid, (sr, sc), (er, ec), costs=costs, heuristic=True, stats=stats)
 
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------------
 
-def a_star_jps(grid, start, end, costs):
-    n = len(grid); m = len(grid[0]) if n>0 else 0
+def a_star_jps(grid, start, end, costs, stats: Optional[dict] = None):
+    """
+    跳点图上的 A*。原实现的跳点判定（与障碍相邻或自由度不为 2）在四连通网格上会选中所有空格，
+    跳点图即“空格 + 四邻接边、边权为进入格代价”，因此直接在扁平核心上搜索，省去每次 O(n·m) 的建图。
+    需要跨 tick 复用与增量修补时使用 backend.jump_graph.JumpPointGraph。
+    """
+    grid = as_grid(grid)
+    n, m = grid.shape
     sr, sc = start; er, ec = end
     # 边界/障碍检查
     if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m):
         return None, None
     if grid[sr][sc] == 1 or grid[er][ec] == 1:
         return None, None
-
-    def in_bounds(r,c):
-        return 0<=r<n and 0<=c<m
-
-    def is_free(r,c):
-        if not in_bounds(r,c):
-            return False
-        if grid[r][c] != 0:
-            return False
-        if costs is not None:
-            try:
-                if costs[r][c] == float('inf'):
-                    return False
-            except Exception:
-                pass
-        return True
-
-    # 选取跳点：起点、终点，和与障碍相邻的空格，以及自由度不是2的格（交叉或死胡同）
-    jump_points = set()
-    jump_points.add((sr,sc)); jump_points.add((er,ec))
-    for r in range(n):
-        for c in range(m):
-            if not is_free(r,c):
-                continue
-            free_nei = 0
-            nei_block = 0
-            for dr,dc in DIRS:
-                nr, nc = r+dr, c+dc
-                if is_free(nr,nc):
-                    free_nei += 1
-                else:
-                    nei_block += 1
-            if nei_block > 0 or free_nei != 2:
-                jump_points.add((r,c))
-
-    # 若跳点集合过小（例如全空地图），退化回普通 A*
-    if len(jump_points) < 3:
-        return a_star(grid, start, end)
-
-    # 为每个跳点按四方向建立可见性边（直到遇到障碍或下一个跳点或边界）
-    # 边权：如果提供了 costs，则为沿直线所有单步 costs 之和；否则为步数(dist)
-    # adj maps each jump-point to a list of (neighbor_jump_point, weight)
-    adj = { jp: [] for jp in jump_points }
-    for (r,c) in list(jump_points):
-        for dr,dc in DIRS:
-            nr, nc = r+dr, c+dc
-            dist = 1
-            weight_sum = 0.0
-            while is_free(nr,nc):
-                if costs is not None:
-                    # 加上进入该格的代价（与 a_star_weighted 语义一致）
-                    step_cost = costs[nr][nc]
-                    if step_cost == float('inf'):
-                        break
-                    weight_sum += float(step_cost)
-                if (nr,nc) in jump_points:
-                    adj[(r,c)].append(((nr,nc), weight_sum if costs is not None else float(dist)))
-                    break
-                if (nr,nc) == (er,ec):
-                    adj[(r,c)].append(((nr,nc), weight_sum if costs is not None else float(dist)))
-                    break
-                nr += dr; nc += dc; dist += 1
-
-    # 在跳点图上运行 A*
-    import math
-    open_set = []
-    heapq.heappush(open_set, (abs(sr-er)+abs(sc-ec), 0.0, (sr,sc)))
-    gscore = { (sr,sc): 0.0 }
-    prev = { }
-    closed = set()
-
-    while open_set:
-        _, cur_g, cur = heapq.heappop(open_set)
-        if cur in closed:
-            continue
-        if cur == (er,ec):
-            break
-        closed.add(cur)
-        for nb, w in adj.get(cur, []):
-            if nb in closed:
-                continue
-            tentative = gscore.get(cur, math.inf) + w
-            if tentative < gscore.get(nb, math.inf):
-                gscore[nb] = tentative
-                prev[nb] = cur
-                priority = tentative + abs(nb[0]-er)+abs(nb[1]-ec)
-                heapq.heappush(open_set, (priority, tentative, nb))
-
-    if (er,ec) not in prev and (er,ec) != (sr,sc):
-        return None, None
-
-    # 重建跳点序列
-    seq = []
-    cur = (er,ec)
-    seq.append(cur)
-    while cur != (sr,sc):
-        cur = prev.get(cur)
-        if cur is None:
-            return a_star(grid, start, end)
-        seq.append(cur)
-    seq.reverse()
-
-    # 将跳点序列展开为网格路径（直线段），并计算总代价
-    full_path: List[Tuple[int,int]] = []
-    total_cost = 0.0
-    for i in range(len(seq)-1):
-        r0,c0 = seq[i]; r1,c1 = seq[i+1]
-        dr = 0 if r1==r0 else (1 if r1>r0 else -1)
-        dc = 0 if c1==c0 else (1 if c1>c0 else -1)
-        cr, cc = r0, c0
-        full_path.append((cr,cc))
-        while (cr,cc) != (r1,c1):
-            cr += dr; cc += dc
-            full_path.append((cr,cc))
-            if costs is not None:
-                total_cost += float(costs[cr][cc])
-    if not full_path:
-        full_path = [(sr,sc)]
     if costs is None:
-        cost = float(len(full_path)-1)
-    else:
-        cost = total_cost
-    return path_to_triplets(full_path), cost
-
-
+        return a_star(grid, start, end, stats=stats)
+    return shortest_path(grid, (sr, sc), (er, ec), costs=costs, heuristic=True, stats=stats)
+
+
+
+# 求解结果缓存：键为 (栅格哈希, algo, 起点, 终点, safe, safeRadius, safeWeight, cluster)，
+# 值为 (triplets, cost)（无路径时为 (None, None)）；按条目数与估算内存淘汰，stats() 给出命中统计。
+_result_cache = LRUCache(maxsize=256, maxbytes=64 * 1024 * 1024,
+                         sizeof=lambda v: 64 + 96 * len(v[0] or ()))
+
+def result_cache_stats() -> dict:
+    return _result_cache.stats()
+
+def _run_algo(algo, grid, start, end, safe, radius, alpha, cluster, session=None):
+    if algo=='hpa':
+        # 分层寻路（近似最优）：抽象图按栅格缓存，带 sessionId 时局部修改只修补受影响的块
+        with stage('hpa-graph'):
+            hpa = get_hpa(grid, cluster, radius, alpha, session=session)
+        with stage('search'):
+            return hpa.path(start, end)
+    costs = _compute_safety_cost(grid, radius, alpha) if safe else None
+    with stage('search'):
+        if safe:
+            # JPS 依赖单位代价，安全模式下退化为带权 A*
+            if algo=='astar' or algo=='jps':
+                return a_star_weighted(grid, costs, start, end)
+            if algo=='biastar' or algo=='bidijkstra':
+                return bidirectional(grid, start, end, costs=costs, heuristic=(algo=='biastar'))
+            return dijkstra_weighted(grid, costs, start, end)
+        if algo=='astar':
+            return a_star(grid, start, end)
+        if algo=='jps':
+            return jump_point_search(grid, start, end)
+        if algo=='biastar' or algo=='bidijkstra':
+            return bidirectional(grid, start, end, heuristic=(algo=='biastar'))
+        return dijkstra(grid, start, end)
 
 def solve(payload):
     algo = payload.get('algo')
@@ -459,22 +180,28 @@ def solve(payload):
     end = payload.get('end')
     safe = bool(payload.get('safe') or False)
 
-    if not isinstance(grid, list) or not grid or not isinstance(grid[0], list):
+    if not is_grid_like(grid):
         return {'ok': False, 'error': 'invalid grid'}
     if len(start)!=2 or len(end)!=2:
         return {'ok': False, 'error': 'invalid start/end'}
+    grid = as_grid(grid)
+    start = (start[0], start[1]); end = (end[0], end[1])
 
-    if safe:
-        costs = _compute_safety_cost(grid)
-        if algo=='astar':
-            trips, cost = a_star_weighted(grid, costs, (start[0],start[1]), (end[0],end[1]))
-        else:
-            trips, cost = dijkstra_weighted(grid, costs, (start[0],start[1]), (end[0],end[1]))
-    else:
-        if algo=='astar':
-            trips, cost = a_star(grid, (start[0],start[1]), (end[0],end[1]))
-        else:
-            trips, cost = dijkstra(grid, (start[0],start[1]), (end[0],end[1]))
+    try:
+        cluster = parse_cluster(payload.get('cluster')) if algo=='hpa' else None
+        radius = alpha = None
+        if safe:
+            radius, alpha = parse_safety_params(payload.get('safeRadius'), payload.get('safeWeight'))
+    except ValueError as e:
+        return {'ok': False, 'error': str(e)}
+
+    # 同一栅格上重复的查询（如前端切换算法后再切回）直接返回缓存结果
+    key = (grid.digest, algo, start, end, safe, radius, alpha, cluster)
+    hit = _result_cache.get(key)
+    if hit is None:
+        hit = _run_algo(algo, grid, start, end, safe, radius, alpha, cluster, payload.get('sessionId'))
+        _result_cache.put(key, hit)
+    trips, cost = hit
 
     if trips is None:
         return {'ok': False, 'error': 'no path'}
@@ -502,23 +229,202 @@ def handle_solve(data: Dict[str, Any]) -> Dict[str, Any]:
         safe = data.get('safe')
         safe_radius = data.get('safeRadius')
         safe_weight = data.get('safeWeight')
+        try:
+            path_format = parse_path_format(data.get('pathFormat'))
+        except ValueError as e:
+            return {'ok': False, 'error': str(e)}
 
-        if not isinstance(grid, list) or not grid or not isinstance(grid[0], list):
+        if not is_grid_like(grid):
             return {'ok': False, 'error': 'invalid grid'}
-        n = len(grid); m = len(grid[0])
+        try:
+            with stage('normalize'):
+                norm = as_grid(grid)
+        except ValueError:
+            return {'ok': False, 'error': 'invalid grid'}
+        n, m = norm.shape
         if not start or not end:
             return {'ok': False, 'error': 'invalid start/end'}
         sr, sc = start; er, ec = end
         if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m):
             return {'ok': False, 'error': 'start/end out of range'}
 
-        norm = [[1 if int(x) != 0 else 0 for x in row] for row in grid]
         payload = {'algo': algo, 'grid': norm, 'start': (sr, sc), 'end': (er, ec), 'safe': safe}
         if safe_radius is not None:
             payload['safeRadius'] = safe_radius
         if safe_weight is not None:
             payload['safeWeight'] = safe_weight
+        for key in ('cluster', 'sessionId'):
+            if data.get(key) is not None:
+                payload[key] = data.get(key)
         res = solve(payload)
-        return res
+        with stage('format'):
+            return format_triplets(res, (er, ec), path_format)
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+MAX_BATCH_QUERIES = 1000
+
+def _batch_queries(data, n, m):
+    """解析批量查询：queries=[{start,end}...] 或 start + goals=[...]；返回 [(start, end) 或 None]。"""
+    queries = data.get('queries')
+    if queries is None and data.get('goals') is not None:
+        start = data.get('start')
+        queries = [{'start': start, 'end': g} for g in data.get('goals') or []]
+    if not isinstance(queries, list) or not queries:
+        raise ValueError('invalid queries')
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise ValueError(f'too many queries (max {MAX_BATCH_QUERIES})')
+    out = []
+    for q in queries:
+        if not isinstance(q, dict):
+            out.append(None)
+            continue
+        start = _parse_point(q.get('start'))
+        end = _parse_point(q.get('end'))
+        if not start or not end:
+            out.append(None)
+            continue
+        sr, sc = start; er, ec = end
+        if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m):
+            out.append(None)
+            continue
+        out.append((start, end))
+    return out
+
+def handle_solve_batch(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    同一栅格上的多组起终点：栅格只归一化一次、代价场只算一次；
+    同一起点的多个终点合并为一次一对多 Dijkstra（全部终点确定即停止），其余按 algo 单独求解。
+    """
+    try:
+        grid = data.get('grid')
+        algo = data.get('algo')
+        safe = bool(data.get('safe') or False)
+        if not is_grid_like(grid):
+            return {'ok': False, 'error': 'invalid grid'}
+        try:
+            with stage('normalize'):
+                norm = as_grid(grid)
+        except ValueError:
+            return {'ok': False, 'error': 'invalid grid'}
+        n, m = norm.shape
+        try:
+            path_format = parse_path_format(data.get('pathFormat'))
+            queries = _batch_queries(data, n, m)
+            costs = None
+            if safe:
+                radius, alpha = parse_safety_params(data.get('safeRadius'), data.get('safeWeight'))
+                costs = _compute_safety_cost(norm, radius, alpha)
+        except ValueError as e:
+            return {'ok': False, 'error': str(e)}
+
+        results: List[Any] = [None] * len(queries)
+        by_start: Dict[Tuple[int,int], List[int]] = {}
+        for i, q in enumerate(queries):
+            if q is None:
+                results[i] = {'ok': False, 'error': 'invalid start/end'}
+            else:
+                by_start.setdefault(q[0], []).append(i)
+
+        w = m + 2
+        for start, idxs in by_start.items():
+            if len(idxs) >= 2:
+                goals = [queries[i][1] for i in idxs]
+                if safe and norm[start[0]][start[1]] == 1:
+                    found = [(None, None)] * len(goals)
+                else:
+                    with stage('search'):
+                        found = one_to_many(norm, start, goals, costs=costs)
+                with stage('format'):
+                    for i, (cells, cost) in zip(idxs, found):
+                        if cells is None:
+                            results[i] = {'ok': False, 'error': 'no path'}
+                        elif path_format == 'triplets':
+                            results[i] = {'ok': True, 'triplets': cells_to_triplets(cells, w), 'cost': cost}
+                        else:
+                            results[i] = {'ok': True, 'path': encode_points(cells_to_points(cells, w), path_format), 'cost': cost}
+            else:
+                i = idxs[0]
+                res = solve({'algo': algo, 'grid': norm, 'start': start, 'end': queries[i][1], 'safe': safe,
+                             'safeRadius': data.get('safeRadius'), 'safeWeight': data.get('safeWeight')})
+                if res.get('ok'):
+                    with stage('format'):
+                        results[i] = format_triplets({'ok': True, 'triplets': res['triplets'], 'cost': res['cost']},
+                                                 queries[i][1], path_format)
+                else:
+                    results[i] = {'ok': False, 'error': res.get('error')}
+        return {'ok': True, 'algo': algo, 'safe': safe, 'count': len(results), 'results': results}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+DEFAULT_K_PATHS = 5
+MAX_K_PATHS = 100
+DEFAULT_K_TIME = 2.0
+MAX_K_TIME = 30.0
+
+def handle_solve_kpaths(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    k 条备选路径：{ grid, start, end, k, timeLimit, maxOverlap, safe, ... }，
+    返回 { ok, paths: [{ triplets, cost }], truncated }（按代价升序）；truncated 表示因 timeLimit 提前停止。
+    不带 maxOverlap 时为严格的 k 条最短简单路径；带 maxOverlap（0~1）时用惩罚法求彼此重合不超过该比例的路径。
+    """
+    try:
+        grid = data.get('grid')
+        start = _parse_point(data.get('start'))
+        end = _parse_point(data.get('end'))
+        safe = bool(data.get('safe') or False)
+        if not is_grid_like(grid):
+            return {'ok': False, 'error': 'invalid grid'}
+        try:
+            with stage('normalize'):
+                norm = as_grid(grid)
+        except ValueError:
+            return {'ok': False, 'error': 'invalid grid'}
+        n, m = norm.shape
+        if not start or not end:
+            return {'ok': False, 'error': 'invalid start/end'}
+        sr, sc = start; er, ec = end
+        if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m):
+            return {'ok': False, 'error': 'start/end out of range'}
+        try:
+            k = DEFAULT_K_PATHS if data.get('k') is None else int(data.get('k'))
+            time_limit = DEFAULT_K_TIME if data.get('timeLimit') is None else float(data.get('timeLimit'))
+            overlap = data.get('maxOverlap')
+            overlap = None if overlap is None else float(overlap)
+        except (TypeError, ValueError):
+            return {'ok': False, 'error': 'invalid k/timeLimit/maxOverlap'}
+        try:
+            path_format = parse_path_format(data.get('pathFormat'))
+        except ValueError as e:
+            return {'ok': False, 'error': str(e)}
+        if not (1 <= k <= MAX_K_PATHS) or not (0 < time_limit <= MAX_K_TIME) or not (overlap is None or 0 <= overlap <= 1):
+            return {'ok': False, 'error': 'invalid k/timeLimit/maxOverlap'}
+        costs = None
+        if safe:
+            try:
+                radius, alpha = parse_safety_params(data.get('safeRadius'), data.get('safeWeight'))
+            except ValueError as e:
+                return {'ok': False, 'error': str(e)}
+            costs = _compute_safety_cost(norm, radius, alpha)
+
+        stats = {}
+        w = m + 2
+        paths = []
+        with stage('search'):
+            if overlap is None:
+                found = list(k_shortest_paths(norm, start, end, costs=costs, k=k, time_limit=time_limit, stats=stats))
+            else:
+                found = list(diverse_paths(norm, start, end, costs=costs, k=k, max_overlap=overlap,
+                                           time_limit=time_limit, stats=stats))
+        with stage('format'):
+            for cells, cost in found:
+                if path_format == 'triplets':
+                    paths.append({'triplets': cells_to_triplets(cells, w), 'cost': cost})
+                else:
+                    paths.append({'path': encode_points(cells_to_points(cells, w), path_format), 'cost': cost})
+        paths.sort(key=lambda p: p['cost'])
+        if not paths:
+            return {'ok': False, 'error': 'no path'}
+        return {'ok': True, 'paths': paths, 'truncated': stats.get('timed_out', False), 'safe': safe}
     except Exception as e:
         return {'ok': False, 'error': str(e)}
\ No newline at end of file
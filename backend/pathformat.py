@@ -0,0 +1,65 @@
+from typing import Any, Dict, List, Sequence, Tuple
+
+# 路径输出格式（请求字段 pathFormat）：
+# - triplets（默认）：沿用 [[r, c, dir], ...]，每步一项；
+# - runs：{ format: 'runs', start: [r, c], runs: [[dr, dc, len], ...] }，相邻同向的步合并为一段，
+#   (dr, dc) 为单步位移（四邻域为单位向量，24 邻域 / 任意角路径可为更长的位移），len 为该位移重复的次数；
+# - waypoints：{ format: 'waypoints', points: [[r, c], ...] }，只含起点、转折点与终点。
+# 紧凑格式放在响应的 path 字段中，取代 triplets。
+
+PATH_FORMATS = ('triplets', 'runs', 'waypoints')
+
+
+def parse_path_format(value) -> str:
+    """缺省为 triplets；非法取值抛出 ValueError。"""
+    if value is None:
+        return 'triplets'
+    fmt = str(value).strip().lower()
+    if fmt not in PATH_FORMATS:
+        raise ValueError('invalid pathFormat')
+    return fmt
+
+
+def triplets_to_points(trips: Sequence[Sequence[int]], end: Tuple[int, int]) -> List[Tuple[int, int]]:
+    """三元组（每步的出发格）补上终点即为完整的格序列。"""
+    points = [(t[0], t[1]) for t in trips]
+    points.append((end[0], end[1]))
+    return points
+
+
+def _runs(points: Sequence[Sequence[int]]) -> List[List[int]]:
+    runs: List[List[int]] = []
+    pr, pc = points[0]
+    for r, c in points[1:]:
+        dr = r - pr; dc = c - pc
+        if runs and runs[-1][0] == dr and runs[-1][1] == dc:
+            runs[-1][2] += 1
+        else:
+            runs.append([dr, dc, 1])
+        pr, pc = r, c
+    return runs
+
+
+def encode_points(points: Sequence[Sequence[int]], fmt: str) -> Dict[str, Any]:
+    """格序列 -> runs / waypoints 紧凑对象；空序列（无路径）时 start 为 None、runs / points 为空。"""
+    if not points:
+        return {'format': 'runs', 'start': None, 'runs': []} if fmt == 'runs' else {'format': 'waypoints', 'points': []}
+    start = [points[0][0], points[0][1]]
+    runs = _runs(points)
+    if fmt == 'runs':
+        return {'format': 'runs', 'start': start, 'runs': runs}
+    out = [start]
+    r, c = start
+    for dr, dc, k in runs:
+        r += dr * k; c += dc * k
+        out.append([r, c])
+    return {'format': 'waypoints', 'points': out}
+
+
+def format_triplets(res: Dict[str, Any], end: Tuple[int, int], fmt: str) -> Dict[str, Any]:
+    """把含 triplets 的结果按 fmt 改写：triplets 时原样返回，否则去掉 triplets、写入 path（不修改 res）。"""
+    if fmt == 'triplets' or res.get('triplets') is None:
+        return res
+    out = {k: v for k, v in res.items() if k != 'triplets'}
+    out['path'] = encode_points(triplets_to_points(res['triplets'], end), fmt)
+    return out
\ No newline at end of file
@@ -1,12 +1,137 @@
 import os
-from urllib.parse import urlencode
 from io import BytesIO
-from datetime import datetime
 from typing import Dict, Any
 from PIL import Image
-import requests
 
-def rasterize_from_baidu(data: Dict[str, Any], ak: str, workspace_root: str) -> Dict[str, Any]:
+from backend.grid import Grid
+from backend.mapimage import ImageFetchError, fetch_static_image, make_provider
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 NumPy 时逐像素比较
+    np = None
+
+WATER_RGB = (0x91, 0xDF, 0xFA)  # 水域#91dffa
+BUILDING_RGB = (0xF9, 0xF7, 0xF4)  # 建筑#f9f7f4
+ROAD_RGB = (0xFF, 0xFF, 0xFF)  # 道路#ffffff
+MAX_COLOR_TOLERANCE = 64
+
+
+def _cell_bounds(size: int, rw: float, rh: float, width: int, height: int):
+    """每个格对应的像素范围（闭区间），行、列各一组 (lo, hi)。"""
+    def bounds(k, step, limit):
+        lo = int(k * step)
+        hi = int((k + 1) * step) - 1
+        if lo < 0: lo = 0
+        if lo >= limit: lo = limit - 1  # 格数多于像素时末尾的格复用最后一行 / 列像素
+        if hi >= limit: hi = limit - 1
+        if hi < lo: hi = lo
+        return lo, hi
+    ys = [bounds(r, rh, height) for r in range(size)]
+    xs = [bounds(c, rw, width) for c in range(size)]
+    return ys, xs
+
+
+def _classify_np(rgb, size, rw, rh, area_ratio, road_ratio, tol) -> Grid:
+    """颜色掩码 + 积分图：每格的道路 / 障碍像素数由四个角相减得到。"""
+    arr = np.asarray(rgb, dtype=np.uint8)
+    height, width = arr.shape[:2]
+    if tol == 0:
+        # 精确匹配：RGB 拼成一个整数逐像素比较
+        key = (arr[..., 0].astype(np.uint32) << 16) | (arr[..., 1].astype(np.uint32) << 8) | arr[..., 2]
+
+        def match(color):
+            return key == ((color[0] << 16) | (color[1] << 8) | color[2])
+    else:
+        wide = arr.astype(np.int16)
+
+        def match(color):
+            return (np.abs(wide - np.array(color, dtype=np.int16)) <= tol).all(axis=2)
+
+    road = match(ROAD_RGB)
+    obs = ~road & (match(WATER_RGB) | match(BUILDING_RGB))
+
+    def integral(mask):
+        s = np.zeros((height + 1, width + 1), dtype=np.int32)
+        np.cumsum(mask, axis=0, dtype=np.int32, out=s[1:, 1:])
+        np.cumsum(s[1:, 1:], axis=1, out=s[1:, 1:])
+        return s
+
+    ys, xs = _cell_bounds(size, rw, rh, width, height)
+    y0 = np.array([lo for lo, _ in ys])[:, None]; y1 = np.array([hi for _, hi in ys])[:, None] + 1
+    x0 = np.array([lo for lo, _ in xs])[None, :]; x1 = np.array([hi for _, hi in xs])[None, :] + 1
+
+    def block_sum(s):
+        return s[y1, x1] - s[y0, x1] - s[y1, x0] + s[y0, x0]
+
+    total = np.maximum(1, (x1 - x0) * (y1 - y0))
+    road_count = block_sum(integral(road))
+    obs_count = block_sum(integral(obs))
+    # 道路占比超过阈值为通路，否则障碍占比严格大于阈值才为障碍
+    cells = ~(road_count > total * road_ratio) & (obs_count > total * area_ratio)
+    return Grid(size, size, bytearray(cells.astype(np.uint8).tobytes()))
+
+
+def _classify_py(rgb, size, rw, rh, area_ratio, road_ratio, tol) -> Grid:
+    px = rgb.load()
+    ys, xs = _cell_bounds(size, rw, rh, rgb.width, rgb.height)
+
+    def near(p, color):
+        return abs(p[0] - color[0]) <= tol and abs(p[1] - color[1]) <= tol and abs(p[2] - color[2]) <= tol
+
+    data = bytearray(size * size)
+    for r, (y0, y1) in enumerate(ys):
+        for c, (x0, x1) in enumerate(xs):
+            total = max(1, (x1 - x0 + 1) * (y1 - y0 + 1))
+            obs_count = 0
+            road_count = 0
+            for yy in range(y0, y1 + 1):
+                for xx in range(x0, x1 + 1):
+                    p = px[xx, yy]
+                    if tol == 0:
+                        if p == ROAD_RGB:
+                            road_count += 1
+                        elif p == WATER_RGB or p == BUILDING_RGB:
+                            obs_count += 1
+                    elif near(p, ROAD_RGB):
+                        road_count += 1
+                    elif near(p, WATER_RGB) or near(p, BUILDING_RGB):
+                        obs_count += 1
+
+            if road_count > total * road_ratio:
+                data[r * size + c] = 0
+            else:
+                # 否则按障碍比例判定（严格大于阈值才为障碍）
+                data[r * size + c] = 1 if (obs_count > total * area_ratio) else 0
+    return Grid(size, size, data)
+
+
+def classify_image(img, size: int, area_ratio: float = 0.20, road_ratio: float = 0.25, tolerance: int = 0) -> Grid:
+    """
+    把图像划分为 size×size 个格，按道路 / 水域 / 建筑像素占比判定障碍：
+    道路占比 > road_ratio 为通路，否则障碍（水域 + 建筑）占比 > area_ratio 为障碍。
+    tolerance 为逐通道的颜色容差（0 为精确匹配）；同时接近道路色与障碍色的像素按道路计。
+    """
+    rgb = img.convert('RGB')
+    rw = max(1.0, rgb.width / float(size))
+    rh = max(1.0, rgb.height / float(size))
+    classify = _classify_np if np is not None else _classify_py
+    return classify(rgb, size, rw, rh, area_ratio, road_ratio, int(tolerance))
+
+
+_default_providers: Dict[str, Any] = {}
+
+
+def rasterize_from_baidu(data: Dict[str, Any], ak: str, workspace_root: str,
+                         provider=None, cache=None) -> Dict[str, Any]:
+    """
+    拉取静态底图、裁剪选区并栅格化。
+    provider 为图源（缺省按 ak 复用一个百度图源），cache 为 DiskImageCache（None 时不缓存）。
+    """
+    if provider is None:
+        provider = _default_providers.get(ak)
+        if provider is None:
+            provider = _default_providers.setdefault(ak, make_provider('baidu', ak=ak))
     center = data.get('center') or {}
     zoom = int(data.get('zoom') or 19)
     canvas_w = int(data.get('canvasWidth') or 640)
@@ -37,28 +162,22 @@ def rasterize_from_baidu(data: Dict[str, Any], ak: str, workspace_root: str) ->
             except Exception:
                 use_direct = False
 
-        # 获取静态图
-        base = "https://api.map.baidu.com/staticimage/v2"
+        # 获取静态图（先查磁盘缓存）
         max_wh = 1024
         min_wh = 50
         ww = max(min_wh, min(req_w, max_wh))
         hh = max(min_wh, min(req_h, max_wh))
-        qs = urlencode({'ak': ak,'zoom': int(zoom),'width': ww,'height': hh,'copyright': '1'})
-        url = f"{base}?center={req_center_lng},{req_center_lat}&{qs}"
-
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        ctype = r.headers.get('Content-Type','')
-        if 'image' not in ctype.lower():
-            text_snippet = r.text[:200]
-            return {'ok': False, 'error': f'static image not image: {ctype}', 'body': text_snippet, 'url': url}
-        img = Image.open(BytesIO(r.content)).convert('RGB')
+        content, image_name, cached = fetch_static_image(provider, cache, req_center_lng, req_center_lat, zoom, ww, hh)
+        img = Image.open(BytesIO(content)).convert('RGB')
+    except ImageFetchError as e:
+        return {'ok': False, 'error': str(e), 'body': e.body, 'url': e.url}
     except Exception as e:
         return {'ok': False, 'error': f'static image fetch failed: {e}'}
 
     # 若直接按选区大小获取了静态图，则无需裁剪；否则按 selection 像素裁剪
     if use_direct and ww == req_w and hh == req_h:
         crop = img
+        box = (0, 0, img.width, img.height)
     else:
         try:
             kx = (ww / canvas_w) if canvas_w else 1.0
@@ -69,27 +188,19 @@ def rasterize_from_baidu(data: Dict[str, Any], ak: str, workspace_root: str) ->
             h = int(round(sel['h'] * ky))
             x = max(0, min(x, img.width-1)); y = max(0, min(y, img.height-1))
             w = max(1, min(w, img.width - x)); h = max(1, min(h, img.height - y))
-            crop = img.crop((x, y, x+w, y+h))
+            box = (x, y, x+w, y+h)
+            crop = img.crop(box)
         except Exception as e:
             return {'ok': False, 'error': f'crop failed: {e}'}
 
-    # 保存裁切后的原始图到 Project/MapImage，文件名为日期+时间
+    # 保存裁切后的原始图到 Project/MapImage，文件名由底图标识与裁剪框决定，相同请求不重复写入
     project_dir = os.path.dirname(__file__)
     project_dir = os.path.abspath(os.path.join(project_dir, '..'))
     out_dir = os.path.join(project_dir, 'MapImage')
     os.makedirs(out_dir, exist_ok=True)
-    ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    crop_file = os.path.join(out_dir, f"{ts}.png")
-    crop.save(crop_file, format='PNG')
-
-    # 栅格化
-    WATER_RGB = (0x91, 0xDF, 0xFA)  # 水域#91dffa
-    BUILDING_RGB = (0xF9, 0xF7, 0xF4)  # 建筑#f9f7f4
-    ROAD_RGB = (0xFF, 0xFF, 0xFF)  # 道路#ffffff
-    rgb_full = crop.convert('RGB')
-    px = rgb_full.load()
-    rw = max(1.0, crop.width / float(size))
-    rh = max(1.0, crop.height / float(size))
+    crop_file = os.path.join(out_dir, f"{image_name[:16]}_{box[0]}_{box[1]}_{box[2]-box[0]}x{box[3]-box[1]}.png")
+    if not os.path.exists(crop_file):
+        crop.save(crop_file, format='PNG')
 
     # 判定
     try:
@@ -103,37 +214,13 @@ def rasterize_from_baidu(data: Dict[str, Any], ak: str, workspace_root: str) ->
     except Exception:
         road_ratio = 0.25
 
-    grid = []
-    for r in range(size):
-        row = []
-        y0 = int(r * rh)
-        y1 = int((r + 1) * rh) - 1
-        if y0 < 0: y0 = 0
-        if y1 >= crop.height: y1 = crop.height - 1
-        if y1 < y0: y1 = y0
-        for c in range(size):
-            x0 = int(c * rw)
-            x1 = int((c + 1) * rw) - 1
-            if x0 < 0: x0 = 0
-            if x1 >= crop.width: x1 = crop.width - 1
-            if x1 < x0: x1 = x0
-
-            total = max(1, (x1 - x0 + 1) * (y1 - y0 + 1))
-            obs_count = 0
-            road_count = 0
-            for yy in range(y0, y1 + 1):
-                for xx in range(x0, x1 + 1):
-                    r0, g0, b0 = px[xx, yy]
-                    if (r0, g0, b0) == ROAD_RGB:
-                        road_count += 1
-                    elif (r0, g0, b0) == WATER_RGB or (r0, g0, b0) == BUILDING_RGB:
-                        obs_count += 1
+    try:
+        tolerance = int(data.get('colorTolerance') or 0)
+    except Exception:
+        tolerance = 0
+    tolerance = max(0, min(MAX_COLOR_TOLERANCE, tolerance))
 
-            if road_count > total * road_ratio:
-                row.append(0)
-            else:
-                # 否则按障碍比例判定（严格大于阈值才为障碍）
-                row.append(1 if (obs_count > total * area_ratio) else 0)
-        grid.append(row)
+    # 栅格化
+    grid = classify_image(crop, size, area_ratio, road_ratio, tolerance)
 
-    return {'ok': True, 'size': size, 'grid': grid, 'cropFile': crop_file}
\ No newline at end of file
+    return {'ok': True, 'size': size, 'grid': grid, 'cropFile': crop_file, 'imageCached': cached}
\ No newline at end of file
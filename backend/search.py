@@ -0,0 +1,611 @@
+import heapq
+import threading
+from array import array
+from typing import List, Tuple, Optional, Dict
+
+from backend.grid import Grid
+
+# 扁平下标搜索核心：
+# - 在 Grid.padded_mask() 上工作，宽度 W = m + 2，外圈为障碍，邻居无需越界判断；
+# - g 值存放在 array('d')，前驱只存进入方向（1 字节），不再为每格保存 (r, c) 元组；
+# - 工作区按线程池化，用代计数（generation）标记有效性，复用时无需清零。
+
+INF = float('inf')
+
+# 方向码与 pathfinder.DIR_CODE 一致：1=东 2=南 3=西 4=北
+_DIR_ORDER = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+_GEN_LIMIT = 0xFFFFFFFF
+_POOL_LIMIT = 4  # 每个线程最多缓存的工作区数量
+
+
+class Workspace:
+    """一次搜索使用的扁平数组；seen/closed 等于 gen 时对应格的数据才有效。"""
+    __slots__ = ('size', 'g', 'parent', 'seen', 'closed', 'gen')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.g = array('d', bytes(8 * size))
+        self.parent = bytearray(size)
+        self.seen = array('I', bytes(4 * size))
+        self.closed = array('I', bytes(4 * size))
+        self.gen = 0
+
+    def next_gen(self) -> int:
+        self.gen += 1
+        if self.gen >= _GEN_LIMIT:
+            # 代计数溢出时才真正清零一次
+            self.seen = array('I', bytes(4 * self.size))
+            self.closed = array('I', bytes(4 * self.size))
+            self.gen = 1
+        return self.gen
+
+
+_local = threading.local()
+
+
+def acquire_workspace(size: int) -> Workspace:
+    """从当前线程的池中取出（或新建）一个工作区，并推进到新的一代。"""
+    pool: Dict[int, List[Workspace]] = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = {}
+    free = pool.get(size)
+    if free:
+        ws = free.pop()
+    else:
+        ws = Workspace(size)
+    ws.next_gen()
+    return ws
+
+
+def release_workspace(ws: Workspace):
+    pool: Dict[int, List[Workspace]] = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = {}
+    free = pool.pop(ws.size, [])
+    free.append(ws)
+    pool[ws.size] = free  # 重新插入，保持最近使用的尺寸在末尾
+    total = sum(len(v) for v in pool.values())
+    while total > _POOL_LIMIT:
+        oldest = next(iter(pool))
+        lst = pool[oldest]
+        lst.pop(0)
+        total -= 1
+        if not lst:
+            del pool[oldest]
+
+
+def pad_costs(costs, n: int, m: int) -> array:
+    """把代价图（扁平 n*m 序列或二维列表）转为带外圈 INF 的扁平 array('d')。"""
+    w = m + 2
+    out = array('d', [INF]) * ((n + 2) * w)
+    flat = not (len(costs) == n and n > 0 and isinstance(costs[0], (list, tuple, array)))
+    for r in range(n):
+        lo = (r + 1) * w + 1
+        row = costs[r * m:(r + 1) * m] if flat else costs[r]
+        out[lo:lo + m] = row if isinstance(row, array) else array('d', row)
+    return out
+
+
+def trace_cells(parent: bytearray, w: int, s: int, t: int) -> List[int]:
+    """沿进入方向回溯，得到 s -> t 的扁平下标序列。"""
+    back = (0,) + tuple(dr * w + dc for dr, dc in _DIR_ORDER)
+    out = [t]
+    cur = t
+    while cur != s:
+        cur -= back[parent[cur]]
+        out.append(cur)
+    out.reverse()
+    return out
+
+
+def cells_to_triplets(cells: List[int], w: int) -> List[Tuple[int, int, int]]:
+    """扁平下标路径 -> (r, c, dir) 三元组，与 pathfinder.path_to_triplets 相同格式。"""
+    code = {dr * w + dc: k + 1 for k, (dr, dc) in enumerate(_DIR_ORDER)}
+    trips = []
+    for k in range(len(cells) - 1):
+        u = cells[k]
+        r, c = divmod(u, w)
+        trips.append((r - 1, c - 1, code.get(cells[k + 1] - u, 0)))
+    return trips
+
+
+def cells_to_points(cells: List[int], w: int) -> List[Tuple[int, int]]:
+    out = []
+    for u in cells:
+        r, c = divmod(u, w)
+        out.append((r - 1, c - 1))
+    return out
+
+
+def _unit_search(blocked, w: int, s: int, t: int, heuristic: bool, ws: Workspace):
+    """
+    单位代价：f 值均为整数，使用桶队列（Dial）代替二叉堆。
+    曼哈顿启发下每步 f 只会不变或 +2，桶内后进先出以偏向更深的节点。
+    """
+    gen = ws.gen
+    g = ws.g; seen = ws.seen; closed = ws.closed; parent = ws.parent
+    east, south, west, north = 1, w, -1, -w
+    tr, tc = divmod(t, w)
+    g[s] = 0.0
+    seen[s] = gen
+    buckets = [[s]]
+    fcur = 0
+    expanded = 0
+    while fcur < len(buckets):
+        bucket = buckets[fcur]
+        while bucket:
+            u = bucket.pop()
+            if closed[u] == gen:
+                continue
+            closed[u] = gen
+            expanded += 1
+            if u == t:
+                return True, expanded
+            nd = g[u] + 1.0
+            if heuristic:
+                ur, uc = divmod(u, w)
+                # 靠近目标的方向 f 不变，远离则 +2
+                same = (uc < tc, ur < tr, uc > tc, ur > tr)
+                inc = 2
+            else:
+                same = (False, False, False, False)
+                inc = 1
+            k = 0
+            for v in (u + east, u + south, u + west, u + north):
+                k += 1
+                if blocked[v] or (seen[v] == gen and nd >= g[v]):
+                    continue
+                seen[v] = gen
+                g[v] = nd
+                parent[v] = k
+                if same[k - 1]:
+                    bucket.append(v)
+                else:
+                    fi = fcur + inc
+                    while len(buckets) <= fi:
+                        buckets.append([])
+                    buckets[fi].append(v)
+        buckets[fcur] = None
+        fcur += 1
+    return False, expanded
+
+
+def _weighted_search(blocked, costs, w: int, s: int, t: int, heuristic: bool, ws: Workspace):
+    """
+    一般非负代价：二叉堆。四个方向手工展开；启发值由出堆节点坐标增量得到，
+    每次扩展只做一次 divmod。f 相同时优先展开 g 较大（更接近目标）的节点。代价为 INF 的格子视同障碍。
+    """
+    gen = ws.gen
+    g = ws.g; seen = ws.seen; closed = ws.closed; parent = ws.parent
+    heappush = heapq.heappush; heappop = heapq.heappop
+    tr, tc = divmod(t, w)
+    g[s] = 0.0
+    seen[s] = gen
+    heap = [(0.0, 0.0, s)]
+    expanded = 0
+    hu = hr = hc = 0
+    while heap:
+        _, _, u = heappop(heap)
+        if closed[u] == gen:
+            continue
+        closed[u] = gen
+        expanded += 1
+        if u == t:
+            return True, expanded
+        gu = g[u]
+        if heuristic:
+            ur, uc = divmod(u, w)
+            hr = ur - tr; hc = uc - tc
+            hu = (hr if hr > 0 else -hr) + (hc if hc > 0 else -hc)
+        # 东
+        v = u + 1
+        if not blocked[v]:
+            nd = gu + costs[v]
+            if nd < INF and (seen[v] != gen or nd < g[v]):
+                seen[v] = gen; g[v] = nd; parent[v] = 1
+                heappush(heap, ((nd + (hu - 1 if hc < 0 else hu + 1)) if heuristic else nd, -nd, v))
+        # 南
+        v = u + w
+        if not blocked[v]:
+            nd = gu + costs[v]
+            if nd < INF and (seen[v] != gen or nd < g[v]):
+                seen[v] = gen; g[v] = nd; parent[v] = 2
+                heappush(heap, ((nd + (hu - 1 if hr < 0 else hu + 1)) if heuristic else nd, -nd, v))
+        # 西
+        v = u - 1
+        if not blocked[v]:
+            nd = gu + costs[v]
+            if nd < INF and (seen[v] != gen or nd < g[v]):
+                seen[v] = gen; g[v] = nd; parent[v] = 3
+                heappush(heap, ((nd + (hu - 1 if hc > 0 else hu + 1)) if heuristic else nd, -nd, v))
+        # 北
+        v = u - w
+        if not blocked[v]:
+            nd = gu + costs[v]
+            if nd < INF and (seen[v] != gen or nd < g[v]):
+                seen[v] = gen; g[v] = nd; parent[v] = 4
+                heappush(heap, ((nd + (hu - 1 if hr > 0 else hu + 1)) if heuristic else nd, -nd, v))
+    return False, expanded
+
+
+def grid_search(grid: Grid, start, end, costs=None, heuristic: bool = True,
+                stats: Optional[dict] = None):
+    """
+    四连通最短路（扁平下标版 Dijkstra / A*）。
+    - costs 为 None 时每步代价 1；否则为进入目标格的代价（pad_costs 的结果或原始代价图）；
+    - heuristic=True 时使用曼哈顿距离（每步代价至少为 1，可采纳）；
+    - 返回 (cells, cost)，cells 为带外圈的扁平下标序列；不可达返回 (None, None)。
+    """
+    n, m = grid.shape
+    w = m + 2
+    sr, sc = start; er, ec = end
+    if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m):
+        return None, None
+    blocked = grid.padded_mask()
+    if costs is not None and not (isinstance(costs, array) and len(costs) == len(blocked)):
+        costs = pad_costs(costs, n, m)
+    s = (sr + 1) * w + sc + 1
+    t = (er + 1) * w + ec + 1
+    if blocked[t]:
+        return None, None
+
+    ws = acquire_workspace(len(blocked))
+    try:
+        if costs is None:
+            found, expanded = _unit_search(blocked, w, s, t, heuristic, ws)
+        else:
+            found, expanded = _weighted_search(blocked, costs, w, s, t, heuristic, ws)
+        if stats is not None:
+            stats['expanded'] = expanded
+        if not found:
+            return None, None
+        return trace_cells(ws.parent, w, s, t), ws.g[t]
+    finally:
+        release_workspace(ws)
+
+
+def shortest_path(grid: Grid, start, end, costs=None, heuristic: bool = True,
+                  stats: Optional[dict] = None):
+    """grid_search 的三元组版本：返回 (triplets, cost) 或 (None, None)。"""
+    cells, cost = grid_search(grid, start, end, costs=costs, heuristic=heuristic, stats=stats)
+    if cells is None:
+        return None, None
+    return cells_to_triplets(cells, grid.m + 2), cost
+
+
+def jps_search(grid: Grid, start, end, stats: Optional[dict] = None):
+    """
+    四连通 Jump Point Search（单位代价），在线跳跃、无全图预处理。
+    规范序为“先水平后竖直”：
+    - 水平前进时，前方与上下两个竖直方向都是自然邻居，因此每走一格都向上下试跳，
+      任一方向跳到跳点则当前格即为跳点；
+    - 竖直前进时只有前方是自然邻居；若侧面格可走而其“身后侧面”格被挡，侧面为强迫邻居。
+    返回 (cells, cost)，cells 为完整的逐格扁平下标路径；不可达返回 (None, None)。
+    """
+    n, m = grid.shape
+    w = m + 2
+    sr, sc = start; er, ec = end
+    if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m):
+        return None, None
+    blocked = grid.padded_mask()
+    s = (sr + 1) * w + sc + 1
+    t = (er + 1) * w + ec + 1
+    if blocked[t]:
+        return None, None
+    if s == t:
+        if stats is not None:
+            stats['expanded'] = 0
+        return [s], 0.0
+
+    east, south, west, north = 1, w, -1, -w
+
+    def jump_v(v, d):
+        while True:
+            v += d
+            if blocked[v]:
+                return -1
+            if v == t:
+                return v
+            b = v - d
+            if (not blocked[v + 1] and blocked[b + 1]) or (not blocked[v - 1] and blocked[b - 1]):
+                return v
+
+    def jump_h(v, d):
+        while True:
+            v += d
+            if blocked[v]:
+                return -1
+            if v == t:
+                return v
+            if jump_v(v, north) >= 0 or jump_v(v, south) >= 0:
+                return v
+
+    heappush = heapq.heappush; heappop = heapq.heappop
+    tr, tc = divmod(t, w)
+    ws = acquire_workspace(len(blocked))
+    try:
+        gen = ws.gen
+        g = ws.g; seen = ws.seen; closed = ws.closed; arrive = ws.parent
+        came: Dict[int, int] = {}
+        g[s] = 0.0
+        seen[s] = gen
+        arrive[s] = 0
+        heap = [(0.0, s)]
+        expanded = 0
+        found = False
+        while heap:
+            _, u = heappop(heap)
+            if closed[u] == gen:
+                continue
+            closed[u] = gen
+            expanded += 1
+            if u == t:
+                found = True
+                break
+            a = arrive[u]
+            if a == 0:
+                succ = ((jump_h(u, east), east), (jump_v(u, south), south),
+                        (jump_h(u, west), west), (jump_v(u, north), north))
+            elif a == 1 or a == 3:
+                d = east if a == 1 else west
+                succ = ((jump_h(u, d), d), (jump_v(u, south), south), (jump_v(u, north), north))
+            else:
+                d = south if a == 2 else north
+                lst = [(jump_v(u, d), d)]
+                b = u - d
+                if not blocked[u + 1] and blocked[b + 1]:
+                    lst.append((jump_h(u, east), east))
+                if not blocked[u - 1] and blocked[b - 1]:
+                    lst.append((jump_h(u, west), west))
+                succ = lst
+            ur, uc = divmod(u, w)
+            gu = g[u]
+            for v, d in succ:
+                if v < 0 or closed[v] == gen:
+                    continue
+                vr, vc = divmod(v, w)
+                nd = gu + abs(vr - ur) + abs(vc - uc)
+                if seen[v] != gen or nd < g[v]:
+                    seen[v] = gen
+                    g[v] = nd
+                    came[v] = u
+                    arrive[v] = 1 if d == east else (2 if d == south else (3 if d == west else 4))
+                    heappush(heap, (nd + abs(vr - tr) + abs(vc - tc), v))
+        if stats is not None:
+            stats['expanded'] = expanded
+        if not found:
+            return None, None
+        # 跳点序列 -> 逐格路径（相邻跳点之间为直线段）
+        jumps = [t]
+        cur = t
+        while cur != s:
+            cur = came[cur]
+            jumps.append(cur)
+        jumps.reverse()
+        cells = [s]
+        for k in range(len(jumps) - 1):
+            u, v = jumps[k], jumps[k + 1]
+            ur, uc = divmod(u, w); vr, vc = divmod(v, w)
+            d = (1 if vc > uc else -1) if vr == ur else (w if vr > ur else -w)
+            while u != v:
+                u += d
+                cells.append(u)
+        return cells, g[t]
+    finally:
+        release_workspace(ws)
+
+
+def jps_path(grid: Grid, start, end, stats: Optional[dict] = None):
+    """jps_search 的三元组版本：返回 (triplets, cost) 或 (None, None)。"""
+    cells, cost = jps_search(grid, start, end, stats=stats)
+    if cells is None:
+        return None, None
+    return cells_to_triplets(cells, grid.m + 2), cost
+
+
+def one_to_many(grid: Grid, start, goals, costs=None, stats: Optional[dict] = None):
+    """
+    一对多 Dijkstra：从 start 出发，所有 goals 都出堆（距离确定）即停止。
+    返回与 goals 等长的列表，每项为 (cells, cost) 或 (None, None)。
+    """
+    n, m = grid.shape
+    w = m + 2
+    sr, sc = start
+    blocked = grid.padded_mask()
+    if costs is not None and not (isinstance(costs, array) and len(costs) == len(blocked)):
+        costs = pad_costs(costs, n, m)
+    s = (sr + 1) * w + sc + 1
+    targets = []
+    remaining = set()
+    for er, ec in goals:
+        if 0 <= er < n and 0 <= ec < m and not blocked[(er + 1) * w + ec + 1]:
+            t = (er + 1) * w + ec + 1
+            targets.append(t)
+            remaining.add(t)
+        else:
+            targets.append(-1)
+
+    heappush = heapq.heappush; heappop = heapq.heappop
+    ws = acquire_workspace(len(blocked))
+    try:
+        gen = ws.gen
+        g = ws.g; seen = ws.seen; closed = ws.closed; parent = ws.parent
+        g[s] = 0.0
+        seen[s] = gen
+        expanded = 0
+        if costs is None:
+            # 单位代价：逐层 BFS，首次到达即确定距离
+            remaining.discard(s)
+            closed[s] = gen
+            layer = [s]
+            d = 0.0
+            while layer and remaining:
+                d += 1.0
+                nxt = []
+                for u in layer:
+                    expanded += 1
+                    k = 0
+                    for v in (u + 1, u + w, u - 1, u - w):
+                        k += 1
+                        if blocked[v] or closed[v] == gen:
+                            continue
+                        closed[v] = gen
+                        g[v] = d
+                        parent[v] = k
+                        nxt.append(v)
+                        remaining.discard(v)
+                layer = nxt
+        heap = [(0.0, s)] if costs is not None else []
+        while heap and remaining:
+            d, u = heappop(heap)
+            if closed[u] == gen:
+                continue
+            closed[u] = gen
+            expanded += 1
+            remaining.discard(u)
+            k = 0
+            for v in (u + 1, u + w, u - 1, u - w):
+                k += 1
+                if blocked[v]:
+                    continue
+                nd = d + (1.0 if costs is None else costs[v])
+                if nd < INF and (seen[v] != gen or nd < g[v]):
+                    seen[v] = gen
+                    g[v] = nd
+                    parent[v] = k
+                    heappush(heap, (nd, v))
+        if stats is not None:
+            stats['expanded'] = expanded
+        out = []
+        for t in targets:
+            if t < 0 or closed[t] != gen:
+                out.append((None, None))
+            else:
+                out.append((trace_cells(parent, w, s, t), g[t]))
+        return out
+    finally:
+        release_workspace(ws)
+
+
+def bidirectional_search(grid: Grid, start, end, costs=None, heuristic: bool = True,
+                         stats: Optional[dict] = None):
+    """
+    双向 Dijkstra / A*。边 u->v 的代价为进入 v 的代价（costs 为 None 时为 1），
+    反向搜索展开 v 时前驱 u 的距离为 gb(v) + cost(v)。
+    heuristic=True 时使用平均势函数 pf(v) = (h_t(v) - h_s(v)) / 2、pb = -pf（两侧一致），
+    正向键 gf + pf、反向键 gb - pf；当两侧堆顶键之和 >= 当前最优相遇代价 mu 时停止。
+    返回 (cells, cost)；不可达返回 (None, None)。
+    """
+    n, m = grid.shape
+    w = m + 2
+    sr, sc = start; er, ec = end
+    if not (0 <= sr < n and 0 <= sc < m and 0 <= er < n and 0 <= ec < m):
+        return None, None
+    blocked = grid.padded_mask()
+    if costs is not None and not (isinstance(costs, array) and len(costs) == len(blocked)):
+        costs = pad_costs(costs, n, m)
+    s = (sr + 1) * w + sc + 1
+    t = (er + 1) * w + ec + 1
+    if blocked[t]:
+        return None, None
+    if s == t:
+        if stats is not None:
+            stats['expanded'] = 0
+        return [s], 0.0
+
+    heappush = heapq.heappush; heappop = heapq.heappop
+    offs = (1, w, -1, -w)
+
+    if heuristic:
+        def pot(v):
+            vr, vc = divmod(v, w)
+            return ((abs(vr - er - 1) + abs(vc - ec - 1)) - (abs(vr - sr - 1) + abs(vc - sc - 1))) * 0.5
+    else:
+        def pot(v):
+            return 0.0
+
+    wf = acquire_workspace(len(blocked))
+    wb = acquire_workspace(len(blocked))
+    try:
+        genf = wf.gen; genb = wb.gen
+        gf = wf.g; seenf = wf.seen; closedf = wf.closed; parf = wf.parent
+        gb = wb.g; seenb = wb.seen; closedb = wb.closed; parb = wb.parent
+        gf[s] = 0.0; seenf[s] = genf
+        gb[t] = 0.0; seenb[t] = genb
+        heapf = [(pot(s), s)]
+        heapb = [(-pot(t), t)]
+        mu = INF
+        meet = (-1, -1)
+        expanded = 0
+        while heapf and heapb:
+            while heapf and closedf[heapf[0][1]] == genf:
+                heappop(heapf)
+            while heapb and closedb[heapb[0][1]] == genb:
+                heappop(heapb)
+            if not heapf or not heapb:
+                break
+            if heapf[0][0] + heapb[0][0] >= mu:
+                break
+            expanded += 1
+            if len(heapf) <= len(heapb):
+                _, u = heappop(heapf)
+                closedf[u] = genf
+                gu = gf[u]
+                k = 0
+                for off in offs:
+                    k += 1
+                    v = u + off
+                    if blocked[v]:
+                        continue
+                    nd = gu + (1.0 if costs is None else costs[v])
+                    if nd >= INF:
+                        continue
+                    if seenf[v] != genf or nd < gf[v]:
+                        seenf[v] = genf; gf[v] = nd; parf[v] = k
+                        heappush(heapf, (nd + pot(v), v))
+                    if seenb[v] == genb and nd + gb[v] < mu:
+                        mu = nd + gb[v]; meet = (u, v)
+            else:
+                _, v = heappop(heapb)
+                closedb[v] = genb
+                step = 1.0 if costs is None else costs[v]
+                nb = gb[v] + step
+                if nb >= INF:
+                    continue
+                k = 0
+                for off in offs:
+                    k += 1
+                    u = v - off
+                    if blocked[u]:
+                        continue
+                    # parb 记录从 u 出发前往 v 的方向
+                    if seenb[u] != genb or nb < gb[u]:
+                        seenb[u] = genb; gb[u] = nb; parb[u] = k
+                        heappush(heapb, (nb - pot(u), u))
+                    if seenf[u] == genf and gf[u] + nb < mu:
+                        mu = gf[u] + nb; meet = (u, v)
+        if stats is not None:
+            stats['expanded'] = expanded
+        if mu == INF:
+            return None, None
+        u, v = meet
+        cells = trace_cells(parf, w, s, u)
+        cur = v
+        cells.append(cur)
+        while cur != t:
+            cur += offs[parb[cur] - 1]
+            cells.append(cur)
+        return cells, mu
+    finally:
+        release_workspace(wb)
+        release_workspace(wf)
+
+
+def bidirectional_path(grid: Grid, start, end, costs=None, heuristic: bool = True,
+                       stats: Optional[dict] = None):
+    """bidirectional_search 的三元组版本：返回 (triplets, cost) 或 (None, None)。"""
+    cells, cost = bidirectional_search(grid, start, end, costs=costs, heuristic=heuristic, stats=stats)
+    if cells is None:
+        return None, None
+    return cells_to_triplets(cells, grid.m + 2), cost
@@ -0,0 +1,142 @@
+import base64
+from typing import Any, Dict, Optional
+
+from backend.grid import Grid, as_grid, is_grid_like
+
+# 紧凑栅格传输格式：{ "grid_b64": ..., "shape": [n, m], "enc": "bits" | "rle" }
+# - bits：行主序逐格 1 bit（高位在前），末字节不足 8 位补 0，再做 base64；
+# - rle：行主序游程长度序列，从值 0 的游程开始交替（首个游程可为 0），每个长度为 LEB128 变长整数，再做 base64。
+# 请求中 grid 字段可为上述对象（也可把三个键直接放在请求顶层）；
+# 响应中的 grid 仅在客户端通过 gridFormat 字段或 X-Grid-Format 请求头选择 bits / rle 时才按此编码。
+
+ENCODINGS = ('bits', 'rle')
+MAX_CELLS = 4096 * 4096
+
+_TO_CHARS = bytes.maketrans(b'\x00\x01', b'01')
+_FROM_CHARS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def _pack_bits(data: bytearray) -> bytes:
+    """0/1 字节序列 -> 位图（经 '01' 字符串与大整数转换，全在 C 层完成）。"""
+    nbytes = (len(data) + 7) // 8
+    if not data:
+        return b''
+    text = bytes(data).translate(_TO_CHARS) + b'0' * (nbytes * 8 - len(data))
+    return int(text, 2).to_bytes(nbytes, 'big')
+
+
+def _unpack_bits(raw: bytes, count: int) -> bytearray:
+    if len(raw) != (count + 7) // 8:
+        raise ValueError('invalid grid encoding')
+    if not raw:
+        return bytearray()
+    text = format(int.from_bytes(raw, 'big'), '0%db' % (len(raw) * 8))
+    return bytearray(text.encode('ascii')[:count].translate(_FROM_CHARS))
+
+
+def _rle_encode(data: bytearray) -> bytes:
+    out = bytearray()
+    i = 0
+    val = 0
+    total = len(data)
+    while i < total:
+        # 下一个与当前值不同的位置（bytearray.find 在 C 层查找）
+        j = data.find(b'\x01' if val == 0 else b'\x00', i)
+        if j < 0:
+            j = total
+        run = j - i
+        while True:
+            byte = run & 0x7F
+            run >>= 7
+            if run:
+                out.append(byte | 0x80)
+            else:
+                out.append(byte)
+                break
+        i = j
+        val ^= 1
+    return bytes(out)
+
+
+def _rle_decode(raw: bytes, count: int) -> bytearray:
+    out = bytearray()
+    val = 0
+    run = 0
+    shift = 0
+    for byte in raw:
+        run |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            if shift > 35:
+                raise ValueError('invalid grid encoding')
+            continue
+        if len(out) + run > count:
+            raise ValueError('invalid grid encoding')
+        out += (b'\x01' if val else b'\x00') * run
+        val ^= 1
+        run = 0
+        shift = 0
+    if shift or len(out) != count:
+        raise ValueError('invalid grid encoding')
+    return out
+
+
+def encode_grid(grid, enc: str = 'bits') -> Dict[str, Any]:
+    """Grid（或二维列表）-> 紧凑编码对象。"""
+    if enc not in ENCODINGS:
+        raise ValueError('invalid grid encoding')
+    g = as_grid(grid)
+    raw = _pack_bits(g.data) if enc == 'bits' else _rle_encode(g.data)
+    return {'grid_b64': base64.b64encode(raw).decode('ascii'), 'shape': [g.n, g.m], 'enc': enc}
+
+
+def is_wire_grid(obj) -> bool:
+    return isinstance(obj, dict) and 'grid_b64' in obj
+
+
+def decode_grid(obj: Dict[str, Any]) -> Grid:
+    """紧凑编码对象 -> Grid（直接得到扁平 bytearray，不经过二维列表）。非法时抛出 ValueError。"""
+    shape = obj.get('shape')
+    enc = obj.get('enc') or 'bits'
+    if enc not in ENCODINGS:
+        raise ValueError('invalid grid encoding')
+    try:
+        n, m = int(shape[0]), int(shape[1])
+        raw = base64.b64decode(obj.get('grid_b64') or '', validate=True)
+    except (TypeError, ValueError, IndexError):
+        raise ValueError('invalid grid encoding')
+    if n <= 0 or m <= 0 or n * m > MAX_CELLS:
+        raise ValueError('invalid grid shape')
+    data = _unpack_bits(raw, n * m) if enc == 'bits' else _rle_decode(raw, n * m)
+    return Grid(n, m, data)
+
+
+def decode_request(data):
+    """请求中的紧凑栅格（grid 字段或顶层 grid_b64/shape/enc）解码为 Grid，放回 data['grid']。"""
+    if not isinstance(data, dict):
+        return data
+    if is_wire_grid(data.get('grid')):
+        data['grid'] = decode_grid(data['grid'])
+    elif 'grid_b64' in data:
+        data['grid'] = decode_grid(data)
+        for key in ('grid_b64', 'shape', 'enc'):
+            data.pop(key, None)
+    return data
+
+
+def response_format(data, header: Optional[str] = None) -> Optional[str]:
+    """客户端选择的响应栅格编码：请求字段 gridFormat 优先，其次 X-Grid-Format 请求头；json 或缺省为 None。"""
+    fmt = data.get('gridFormat') if isinstance(data, dict) else None
+    fmt = (fmt or header or '').strip().lower()
+    return fmt if fmt in ENCODINGS else None
+
+
+def encode_response(resp, fmt: Optional[str]):
+    """按 fmt 把响应中的 grid（二维列表或 Grid）换成紧凑编码；fmt 为 None 时二维列表原样返回，Grid 转为二维列表。"""
+    if not isinstance(resp, dict) or 'grid' not in resp or not is_grid_like(resp['grid']):
+        return resp
+    if fmt is not None:
+        resp['grid'] = encode_grid(resp['grid'], fmt)
+    elif isinstance(resp['grid'], Grid):
+        resp['grid'] = resp['grid'].to_rows()
+    return resp
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Optional
+
+from backend.grid import Grid, as_grid, is_grid_like
+from backend.pathfinder import handle_solve, handle_solve_batch, handle_solve_kpaths
+from backend.extended_neighbors import handle_solve_extended
+from backend.afteshock_solve import dynamic_step_service, dynamic_step_key
+from backend.aftershock_engine import advance_service
+from backend.earthquake import simulate_collapse_service
+from backend.metrics import collect, current, stage
+
+# 求解进程池：CPU 密集的寻路 / 余震步进 / 余震快进 / 坍塌生成在独立进程中执行，HTTP 线程只等待结果（不占 GIL）。
+# - 每个 worker 是一个单进程执行器；带 sessionId 的请求按其哈希固定到同一 worker，
+#   使 HPA 抽象图、跳点图等进程内缓存在后续请求中继续命中；单次寻路（AFFINE_TASKS）按栅格哈希固定 worker，
+#   同一地图上的重复查询命中该进程的结果缓存与代价场缓存；余震步进按跨 tick 不变的运行键（dynamic_step_key）
+#   固定 worker，使相邻 tick 复用该进程中的跳点图与 D* Lite 状态；其余请求交给在途任务最少的 worker；
+# - 栅格不少于 SHM_MIN_CELLS 格时放入 multiprocessing.shared_memory，只传块名与形状，
+#   worker 一次拷贝为 Grid，不再逐格序列化二维列表；
+# - 结果照常经 pickle 返回（Grid 只传扁平字节），worker 内各阶段耗时随结果一并带回，合并到调用线程的收集器。
+
+SHM_MIN_CELLS = 64 * 1024
+
+AFFINE_TASKS = ('solve', 'solve-extended')
+
+TASKS = {
+    'solve': handle_solve,
+    'solve-batch': handle_solve_batch,
+    'solve-kpaths': handle_solve_kpaths,
+    'solve-extended': handle_solve_extended,
+    'dynamic-step': dynamic_step_service,
+    'aftershock-advance': advance_service,
+    'simulate-collapse': simulate_collapse_service,
+}
+
+
+def _watch_parent(ppid: int):
+    """worker 初始化：父进程退出（如被 kill）后自行结束，不留下孤儿进程。"""
+    def watch():
+        while os.getppid() == ppid:
+            time.sleep(1.0)
+        os._exit(0)
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _run_task(task: str, data: Dict[str, Any], shm_desc=None):
+    """worker 进程入口：从共享内存取回栅格后调用对应的处理函数，返回 (结果, 阶段耗时)。"""
+    with collect() as timings:
+        if shm_desc is not None:
+            with stage('shm'):
+                name, n, m = shm_desc
+                shm = shared_memory.SharedMemory(name=name)
+                try:
+                    data['grid'] = Grid(n, m, bytearray(shm.buf[:n * m]))
+                finally:
+                    shm.close()
+        res = TASKS[task](data)
+    return res, timings.stages
+
+
+class SolverPool:
+    """
+    固定数量的求解 worker；run() 在调用线程中阻塞等待结果，异常原样抛出。
+    worker 在构造时即启动，应在监听套接字创建之前构造，避免子进程继承监听端口。
+    """
+
+    def __init__(self, workers: int, shm_min_cells: int = SHM_MIN_CELLS):
+        self.workers = max(1, int(workers))
+        self.shm_min_cells = shm_min_cells
+        if os.name == 'posix':
+            resource_tracker.ensure_running()  # worker 与本进程共用一个跟踪器，共享内存块只由本进程登记与回收
+        self._executors = [self._new_executor() for _ in range(self.workers)]
+        self._inflight = [0] * self.workers
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_executor() -> ProcessPoolExecutor:
+        ex = ProcessPoolExecutor(max_workers=1, initializer=_watch_parent, initargs=(os.getpid(),))
+        ex.submit(_ping).result()  # 进程按需创建：提交一次空任务使其立即启动
+        return ex
+
+    def _pick(self, session) -> int:
+        with self._lock:
+            if session is not None:
+                i = zlib.crc32(str(session).encode('utf-8')) % self.workers
+            else:
+                i = min(range(self.workers), key=self._inflight.__getitem__)
+            self._inflight[i] += 1
+            return i
+
+    def run(self, task: str, data: Dict[str, Any]):
+        if task not in TASKS:
+            raise ValueError(f'unknown task: {task}')
+        shm = None
+        shm_desc = None
+        grid = data.get('grid') if isinstance(data, dict) else None
+        try:
+            with stage('normalize'):
+                g = as_grid(grid) if is_grid_like(grid) else None
+        except ValueError:
+            g = None  # 非法栅格原样交给处理函数，由其返回错误
+        if g is not None:
+            data = dict(data)
+            if g.n * g.m >= self.shm_min_cells:
+                with stage('shm'):
+                    shm = shared_memory.SharedMemory(create=True, size=g.n * g.m)
+                    shm.buf[:g.n * g.m] = g.data
+                shm_desc = (shm.name, g.n, g.m)
+                data.pop('grid')
+            else:
+                data['grid'] = g  # 小图直接随任务发送：Grid 按扁平字节序列化，比嵌套列表小得多
+        affinity = data.get('sessionId') if isinstance(data, dict) else None
+        if affinity is None and g is not None:
+            if task in AFFINE_TASKS:
+                affinity = g.digest
+            elif task == 'dynamic-step':
+                try:
+                    affinity = dynamic_step_key(data, g.shape)
+                except (TypeError, ValueError):
+                    affinity = None  # 参数非法，由处理函数返回错误
+        i = self._pick(affinity)
+        ex = self._executors[i]
+        try:
+            res, stages = ex.submit(_run_task, task, data, shm_desc).result()
+            timings = current()
+            if timings is not None:
+                timings.merge(stages)
+            return res
+        except BrokenProcessPool:
+            # worker 异常退出：换一个新的执行器，本次请求按失败处理；
+            # 同一执行器上的并发请求会一起失败，只有第一个发现者替换，其余看到已替换则跳过
+            with self._lock:
+                if self._executors[i] is ex:
+                    self._executors[i] = self._new_executor()
+                    ex.shutdown(wait=False)
+            raise RuntimeError('solver worker crashed')
+        finally:
+            with self._lock:
+                self._inflight[i] -= 1
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    def shutdown(self):
+        for ex in self._executors:
+            ex.shutdown(wait=False)
+
+
+def run_solver(pool: Optional[SolverPool], task: str, data: Dict[str, Any]):
+    """有进程池时交给池执行，否则在当前线程直接调用。"""
+    if pool is None:
+        return TASKS[task](data)
+    return pool.run(task, data)
\ No newline at end of file
@@ -2,12 +2,15 @@ import http.server
 import socketserver
 import os
 import json
+import time
 from urllib.parse import urlparse
-from backend.earthquake import simulate_collapse
 from backend.rasterisation import rasterize_from_baidu
-from backend.pathfinder import handle_solve
-from backend.extended_neighbors import handle_solve_extended
-from backend.afteshock_solve import dynamic_step_service
+from backend.mapimage import DiskImageCache, make_provider
+from backend.afteshock_solve import create_session_service, session_step_service, close_session_service
+from backend.workers import SolverPool, run_solver
+from backend.aioserver import AsyncHTTPServer
+from backend.wire import decode_request, encode_response, response_format
+from backend.metrics import Timings, collect, current, stage, observe_request, samples, render as render_metrics
 
 # 服务器配置
 PORT = 9999
@@ -17,20 +20,85 @@ WORKSPACE_ROOT = os.path.dirname(ROOT)
 Baidu_AK_Server = "服务器端AK"
 Baidu_AK_Client = "客户端AK"
 
+# 静态底图来源：baidu（默认）、http（本地 HTTP 替身，需 MAP_PROVIDER_URL）、dir（本地图片目录，需 MAP_FIXTURE_DIR）
+MAP_PROVIDER = 'baidu'
+MAP_PROVIDER_URL = None
+MAP_FIXTURE_DIR = os.path.join(ROOT, 'MapImage', 'fixtures')
+# 静态底图磁盘缓存：总容量上限（字节）与有效期（秒，None 为不过期）
+MAP_CACHE_DIR = os.path.join(ROOT, 'MapImage', 'cache')
+MAP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+MAP_CACHE_TTL = 7 * 24 * 3600
+
+MAP_SOURCE = make_provider(MAP_PROVIDER, ak=Baidu_AK_Server, url=MAP_PROVIDER_URL, root=MAP_FIXTURE_DIR)
+MAP_CACHE = DiskImageCache(MAP_CACHE_DIR, max_bytes=MAP_CACHE_MAX_BYTES, ttl=MAP_CACHE_TTL)
+
+# 求解进程数：寻路与余震步进在进程池中执行以利用多核；0 为在请求线程内直接计算
+SOLVER_WORKERS = os.cpu_count() or 1
+SOLVER_POOL = None  # 启动时按 SOLVER_WORKERS 创建
+
+# 服务器模式：threading（每连接一个线程）或 asyncio（事件循环管理连接，支持 keep-alive 与求解排队）
+SERVER_MODE = 'threading'
+MAX_BODY_BYTES = 64 * 1024 * 1024   # 请求体上限，超过返回 413
+# 以下仅 asyncio 模式：同时执行的求解数、排队上限（队满返回 503 + Retry-After）、keep-alive 空闲超时（秒）
+MAX_SOLVER_JOBS = max(1, SOLVER_WORKERS)
+MAX_SOLVER_QUEUE = 32
+KEEPALIVE_TIMEOUT = 15
+SOLVER_PATHS = ('/api/solve', '/api/solve-batch', '/api/solve-kpaths', '/api/solve-extended',
+                '/api/dynamic-step', '/api/aftershock-advance', '/api/aftershock-step', '/api/simulate-collapse')
+# 计入 /api/metrics 的接口（其余路径统一记为 other，避免标签无限增长）
+API_ROUTES = SOLVER_PATHS + ('/api/rasterize', '/api/aftershock-session', '/api/aftershock-close')
+
 class Handler(http.server.SimpleHTTPRequestHandler):
+    queue_seconds = 0.0  # asyncio 模式下由前端写入本请求的排队等待时间
     # 处理跨域请求
     def do_OPTIONS(self):
         self.send_response(204)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Grid-Format')
         self.end_headers()
-    # 设置JSON响应头
-    def _set_json(self, code=200):
+    # 解析请求 JSON；紧凑栅格（grid_b64）在此直接解码为 Grid。失败时已写出 400 并返回 None
+    def _read_json(self, body):
+        try:
+            with stage('parse'):
+                data = json.loads(body.decode('utf-8') or '{}')
+        except Exception:
+            self._send_json(400, {'ok': False, 'error': 'invalid json'})
+            return None
+        try:
+            with stage('decode'):
+                return decode_request(data)
+        except ValueError as e:
+            self._send_json(400, {'ok': False, 'error': str(e)})
+            return None
+    # 写出 JSON 响应；客户端通过 gridFormat 字段或 X-Grid-Format 头选择响应中 grid 的编码。
+    # 阶段耗时写入 Server-Timing 头（total 不含写出响应体），写完后计入直方图
+    def _send_json(self, code, resp, data=None):
+        with stage('serialize'):
+            resp = encode_response(resp, response_format(data, self.headers.get('X-Grid-Format')))
+            out = json.dumps(resp).encode('utf-8')
+        timings = current()
         self.send_response(code)
         self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(out)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        if timings is not None:
+            self.send_header('Server-Timing', timings.header(time.perf_counter() - self._t0))
+            self.send_header('Timing-Allow-Origin', '*')
         self.end_headers()
+        with stage('write'):
+            self.wfile.write(out)
+        if timings is not None:
+            observe_request(self._route, code, timings, time.perf_counter() - self._t0, self._request_bytes, len(out))
+    # 求解类接口：交给进程池执行（未启用时在当前线程执行）
+    def _send_solve(self, task, data):
+        try:
+            with stage('compute'):
+                res = run_solver(SOLVER_POOL, task, data)
+        except RuntimeError as e:
+            self._send_json(500, {'ok': False, 'error': str(e)}, data)
+            return
+        self._send_json(200 if res.get('ok') else 400, res, data)
     # 重写路径解析
     def translate_path(self, path):
         if path == '/' or path == '/index.html':
@@ -41,87 +109,168 @@ class Handler(http.server.SimpleHTTPRequestHandler):
             return p
         return os.path.join(ROOT, rel)
 
-    # 处理路径求解请求
+    # Prometheus 指标；其余 GET 照常作为静态文件处理
+    def do_GET(self):
+        if urlparse(self.path).path != '/api/metrics':
+            return super().do_GET()
+        cache = MAP_CACHE.stats()
+        extra = samples('flyway_map_cache_entries', 'Static map images in the disk cache.', 'gauge', {(): cache['size']})
+        extra += samples('flyway_map_cache_bytes', 'Bytes held by the static map disk cache.', 'gauge', {(): cache['bytes']})
+        extra += samples('flyway_map_cache_lookups_total', 'Static map cache lookups.', 'counter',
+                         {('hit',): cache['hits'], ('miss',): cache['misses']}, ('result',))
+        out = render_metrics(extra).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(out)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(out)
+
+    # 处理 POST：按阶段记录耗时（排队、读取、解析、计算、序列化……）
     def do_POST(self):
+        self._t0 = time.perf_counter()
+        timings = Timings()
+        if self.queue_seconds:
+            timings.add('queue', self.queue_seconds)
+        with collect(timings):
+            self._post()
+
+    def _post(self):
         parsed = urlparse(self.path)
+        self._route = parsed.path if parsed.path in API_ROUTES else 'other'
         length = int(self.headers.get('Content-Length','0'))
-        body = self.rfile.read(length) if length>0 else b''
+        self._request_bytes = length
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {'ok': False, 'error': 'request too large'})
+            return
+        with stage('read'):
+            body = self.rfile.read(length) if length>0 else b''
 
         # 地图栅格化
         if parsed.path == '/api/rasterize':
-            try:
-                data = json.loads(body.decode('utf-8') or '{}')
-            except Exception:
-                self._set_json(400)
-                self.wfile.write(json.dumps({'ok': False, 'error': 'invalid json'}).encode('utf-8'))
+            data = self._read_json(body)
+            if data is None:
                 return
 
-            resp = rasterize_from_baidu(data, Baidu_AK_Server, WORKSPACE_ROOT)
+            with stage('compute'):
+                resp = rasterize_from_baidu(data, Baidu_AK_Server, WORKSPACE_ROOT, provider=MAP_SOURCE, cache=MAP_CACHE)
             code = 200 if resp.get('ok') else 500
-            self._set_json(code)
-            self.wfile.write(json.dumps(resp).encode('utf-8'))
+            self._send_json(code, resp, data)
             return
 
         # 室内坍塌模拟
         if parsed.path == '/api/simulate-collapse':
-            try:
-                data = json.loads(body.decode('utf-8') or '{}')
-            except Exception:
-                self._set_json(400)
-                self.wfile.write(json.dumps({'ok': False, 'error': 'invalid json'}).encode('utf-8'))
+            data = self._read_json(body)
+            if data is None:
                 return
             try:
-                n = int(data.get('size'))
-                n = max(5, min(200, n))
-                grid = simulate_collapse(n)
-                self._set_json(200)
-                self.wfile.write(json.dumps({'ok': True, 'size': n, 'grid': grid}).encode('utf-8'))
+                with stage('compute'):
+                    result = run_solver(SOLVER_POOL, 'simulate-collapse', data)
+                self._send_json(200, {'ok': True, **result}, data)
+            except (TypeError, ValueError) as e:
+                self._send_json(400, {'ok': False, 'error': f'invalid request: {e}'}, data)
             except Exception as e:
-                self._set_json(500)
-                self.wfile.write(json.dumps({'ok': False, 'error': f'simulate failed: {e}'}).encode('utf-8'))
+                self._send_json(500, {'ok': False, 'error': f'simulate failed: {e}'}, data)
             return
 
         # 余震
         if parsed.path == '/api/dynamic-step':
+            data = self._read_json(body)
+            if data is None:
+                return
             try:
-                data = json.loads(body.decode('utf-8') or '{}')
-            except Exception:
-                self._set_json(400)
-                self.wfile.write(json.dumps({'ok': False, 'error': 'invalid json'}).encode('utf-8'))
+                with stage('compute'):
+                    result = run_solver(SOLVER_POOL, 'dynamic-step', data)
+                self._send_json(200, {'ok': True, **result}, data)
+            except ValueError as e:
+                self._send_json(400, {'ok': False, 'error': str(e)}, data)
+            except Exception as e:
+                self._send_json(500, {'ok': False, 'error': f'dynamic-step failed: {e}'}, data)
+            return
+
+        # 余震快进：一次推进多个 tick
+        if parsed.path == '/api/aftershock-advance':
+            data = self._read_json(body)
+            if data is None:
                 return
             try:
-                result = dynamic_step_service(data)
-                self._set_json(200)
-                self.wfile.write(json.dumps({'ok': True, **result}).encode('utf-8'))
+                with stage('compute'):
+                    result = run_solver(SOLVER_POOL, 'aftershock-advance', data)
+                self._send_json(200, {'ok': True, **result}, data)
+            except ValueError as e:
+                self._send_json(400, {'ok': False, 'error': str(e)}, data)
             except Exception as e:
-                self._set_json(500)
-                self.wfile.write(json.dumps({'ok': False, 'error': f'dynamic-step failed: {e}'}).encode('utf-8'))
+                self._send_json(500, {'ok': False, 'error': f'aftershock-advance failed: {e}'}, data)
+            return
+
+        # 服务端余震会话：创建一次，之后每个 tick 只发送 sessionId
+        if parsed.path == '/api/aftershock-session':
+            data = self._read_json(body)
+            if data is None:
+                return
+            try:
+                with stage('compute'):
+                    result = create_session_service(data)
+                self._send_json(200, {'ok': True, **result}, data)
+            except ValueError as e:
+                self._send_json(400, {'ok': False, 'error': str(e)}, data)
+            return
+
+        if parsed.path == '/api/aftershock-step':
+            data = self._read_json(body)
+            if data is None:
+                return
+            try:
+                with stage('compute'):
+                    result = session_step_service(data)
+                if result is None:
+                    self._send_json(404, {'ok': False, 'error': 'unknown session'}, data)
+                else:
+                    self._send_json(200, {'ok': True, **result}, data)
+            except ValueError as e:
+                self._send_json(400, {'ok': False, 'error': str(e)}, data)
+            except Exception as e:
+                self._send_json(500, {'ok': False, 'error': f'aftershock-step failed: {e}'}, data)
+            return
+
+        if parsed.path == '/api/aftershock-close':
+            data = self._read_json(body)
+            if data is None:
+                return
+            self._send_json(200, {'ok': close_session_service(data)}, data)
             return
 
         # 寻路
         if parsed.path == '/api/solve':
-            try:
-                data = json.loads(body.decode('utf-8') or '{}')
-            except Exception:
-                self._set_json(400)
-                self.wfile.write(json.dumps({'ok': False, 'error': 'invalid json'}).encode('utf-8'))
+            data = self._read_json(body)
+            if data is None:
+                return
+            self._send_solve('solve', data)
+            return
+
+        # 批量寻路：同一栅格上的多组起终点
+        if parsed.path == '/api/solve-batch':
+            data = self._read_json(body)
+            if data is None:
                 return
-            res = handle_solve(data)
-            self._set_json(200 if res.get('ok') else 400)
-            self.wfile.write(json.dumps(res).encode('utf-8'))
+            self._send_solve('solve-batch', data)
+            return
+
+        # k 条最短路：按代价升序的多条备选路径
+        if parsed.path == '/api/solve-kpaths':
+            data = self._read_json(body)
+            if data is None:
+                return
+            self._send_solve('solve-kpaths', data)
             return
 
         # 扩展邻域搜索
         if parsed.path == '/api/solve-extended':
-            try:
-                data = json.loads(body.decode('utf-8') or '{}')
-            except Exception:
-                self._set_json(400)
-                self.wfile.write(json.dumps({'ok': False, 'error': 'invalid json'}).encode('utf-8'))
+            data = self._read_json(body)
+            if data is None:
                 return
-            res = handle_solve_extended(data)
-            self._set_json(200 if res.get('ok') else 400)
-            self.wfile.write(json.dumps(res).encode('utf-8'))
+            self._send_solve('solve-extended', data)
             return
 
         self.send_response(404)
@@ -134,9 +283,21 @@ if __name__ == '__main__':
         daemon_threads = True
         allow_reuse_address = True
 
-    with ThreadingHTTPServer(('', PORT), Handler) as httpd:
-        print(f'http://localhost:{PORT}')
-        try:
-            httpd.serve_forever()
-        except KeyboardInterrupt:
-            print('\nServer stopped.')
\ No newline at end of file
+    if SOLVER_WORKERS > 0:
+        SOLVER_POOL = SolverPool(SOLVER_WORKERS)
+
+    try:
+        if SERVER_MODE == 'asyncio':
+            server = AsyncHTTPServer(Handler, SOLVER_PATHS, max_jobs=MAX_SOLVER_JOBS, max_queue=MAX_SOLVER_QUEUE,
+                                     max_body=MAX_BODY_BYTES, keepalive_timeout=KEEPALIVE_TIMEOUT)
+            print(f'http://localhost:{PORT} (asyncio)')
+            server.serve_forever('', PORT)
+        else:
+            with ThreadingHTTPServer(('', PORT), Handler) as httpd:
+                print(f'http://localhost:{PORT}')
+                httpd.serve_forever()
+    except KeyboardInterrupt:
+        print('\nServer stopped.')
+    finally:
+        if SOLVER_POOL is not None:
+            SOLVER_POOL.shutdown()
\ No newline at end of file
@@ -0,0 +1,24 @@
+import pytest
+
+from backend.aftershock_generate import AftershockState
+
+
+def _compact(cells):
+    st = AftershockState(10)
+    for r, c in cells:
+        st.active.add(r, c, 5, 0)
+    return st.to_dict(compact=True)
+
+
+def test_compact_state_out_of_range_is_rejected():
+    assert len(AftershockState.from_dict(_compact([(1, 2), (3, 9)]), 4, 10).active) == 2
+    for cell in [(4, 0), (0, 10), (-1, 0)]:
+        with pytest.raises(ValueError):
+            AftershockState.from_dict(_compact([(1, 2), cell]), 4, 10)
+
+
+def test_list_state_skips_out_of_range_records():
+    s = {'active': [{'r': 1, 'c': 2, 'untilTick': 5}, {'r': 4, 'c': 0, 'untilTick': 5},
+                    {'r': 0, 'c': -1, 'untilTick': 5}, {'r': 3, 'c': 9, 'untilTick': 5}]}
+    st = AftershockState.from_dict(s, 4, 10)
+    assert sorted(zip(st.active.r, st.active.c)) == [(1, 2), (3, 9)]
\ No newline at end of file
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from backend import extended_neighbors
+from backend.extended_neighbors import (DIRS_24, _PAD, extended_astar, is_line_clear, lazy_theta_star,
+                                        line_blocked_tables)
+from backend.grid import Grid
+
+
+def _random_grid(n, m, density, seed):
+    rng = random.Random(seed)
+    return Grid.from_rows([[1 if rng.random() < density else 0 for _ in range(m)] for _ in range(n)])
+
+
+@pytest.mark.parametrize('lazy', [False, True], ids=['tables', 'per-move'])
+def test_blocked_matches_is_line_clear(monkeypatch, lazy):
+    if lazy:
+        monkeypatch.setattr(extended_neighbors, 'LINE_TABLE_MAX_CELLS', 0)
+    grid = _random_grid(9, 11, 0.3, 3)
+    blocked, W = line_blocked_tables(grid)
+    n, m = grid.shape
+    for r in range(n):
+        for c in range(m):
+            if grid[r][c]:
+                continue
+            u = (r + _PAD) * W + c + _PAD
+            for k, (dr, dc) in enumerate(DIRS_24):
+                assert (not blocked[k][u]) == is_line_clear(grid, r, c, r + dr, c + dc), (r, c, dr, dc)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_per_move_checks_match_tables(monkeypatch, seed):
+    grid = _random_grid(40, 40, 0.25, seed)
+    grid.set(0, 0, 0); grid.set(39, 39, 0)
+    expected = [extended_astar(grid, (0, 0), (39, 39))[1], lazy_theta_star(grid, (0, 0), (39, 39))[1]]
+    monkeypatch.setattr(extended_neighbors, 'LINE_TABLE_MAX_CELLS', 0)
+    assert [extended_astar(grid, (0, 0), (39, 39))[1], lazy_theta_star(grid, (0, 0), (39, 39))[1]] == expected
\ No newline at end of file
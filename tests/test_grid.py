@@ -0,0 +1,20 @@
+import pytest
+
+from backend.grid import Grid
+from backend.pathfinder import handle_solve
+
+
+def test_rows_are_read_only():
+    g = Grid(3, 3)
+    with pytest.raises(TypeError):
+        g[0][1] = 1
+
+
+def test_set_invalidates_digest_and_result_cache():
+    g = Grid(3, 3)
+    query = {'grid': g, 'start': [0, 0], 'end': [0, 2], 'algo': 'astar'}
+    before = g.digest
+    assert handle_solve(query)['cost'] == 2.0
+    g.set(0, 1, 1)
+    assert g.digest != before
+    assert handle_solve(query)['cost'] == 4.0
\ No newline at end of file
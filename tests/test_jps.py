@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from backend.grid import Grid
+from backend.pathfinder import a_star, dijkstra, jump_point_search, solve
+
+# JPS 与 A* / Dijkstra 在同一随机栅格、同一起终点上的最短代价须一致（安全模式下 JPS 退化为带权 A*）。
+
+
+def _cases(seed, count=20):
+    rng = random.Random(seed)
+    for _ in range(count):
+        n = rng.randint(1, 30); m = rng.randint(1, 30)
+        density = rng.choice([0.0, 0.1, 0.25, 0.4])
+        grid = Grid.from_rows([[1 if rng.random() < density else 0 for _ in range(m)] for _ in range(n)])
+        start = (rng.randrange(n), rng.randrange(m))
+        end = (rng.randrange(n), rng.randrange(m))
+        grid.set(*start, 0); grid.set(*end, 0)
+        yield grid, start, end
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_jps_cost_matches_astar_and_dijkstra(seed):
+    for grid, start, end in _cases(seed):
+        costs = {algo(grid, start, end)[1] for algo in (jump_point_search, a_star, dijkstra)}
+        assert len(costs) == 1, (grid.to_rows(), start, end, costs)
+
+
+@pytest.mark.parametrize('safe', [False, True])
+@pytest.mark.parametrize('seed', range(5))
+def test_solve_jps_cost_matches(seed, safe):
+    for grid, start, end in _cases(100 + seed):
+        res = [solve({'algo': algo, 'grid': grid, 'start': start, 'end': end, 'safe': safe})
+               for algo in ('jps', 'astar', 'dijkstra')]
+        assert len({r['ok'] for r in res}) == 1, (grid.to_rows(), start, end)
+        if res[0]['ok']:
+            assert res[0]['cost'] == pytest.approx(res[1]['cost'])
+            assert res[0]['cost'] == pytest.approx(res[2]['cost'])
\ No newline at end of file
@@ -13,6 +13,7 @@
   const pauseBtn = document.getElementById('pauseBtn');
   const resetBtn = document.getElementById('resetBtn');
   const statusLine = document.getElementById('statusLine');
+  const algoSel = document.getElementById('algoSel');
 
   // 仓库：读取地图处理页给的 grid/start/end
   function loadFromProcess(){
@@ -41,6 +42,8 @@
   let agent = { r: start.r, c: start.c };
   let trail = [ { r: start.r, c: start.c } ]; // 从起点到当前点的实时轨迹
   let aftershockState = null; // 后端返回的 state
+  let sessionId = null; // 服务端余震会话：栅格与状态留在后端，每个 tick 只发送 id
+  let plannedPath = []; // 按 pathDiff 增量维护的规划路径
   let timer = null; // 主循环计时器
   let running = false;
   let inflight = null; // 当前在飞中的请求
@@ -103,8 +106,10 @@
     const intervalTicks = Math.max(1, Math.round(10 / Math.max(1, Math.min(5, N))));
     const severity = Math.max(0, Math.min(1, (parseInt(severityInput?.value||'20')||0)/100));
     const delay = parseInt(stepDelayInput?.value||'200');
-    const algo = 'astar';
-    return { intervalTicks, severity, delay, algo, N };
+    const algo = algoSel?.value || 'dstar';
+    // 后端规划模式：dstar 为增量重规划，full 为每 tick 全图重算
+    const planner = algo === 'astar' ? 'full' : 'dstar';
+    return { intervalTicks, severity, delay, algo, planner, N };
   }
 
   function syncIndicators(){
@@ -115,45 +120,66 @@
     if(stepDelayVal) stepDelayVal.textContent = String(delay);
   }
 
+  async function postJSON(url, payload, signal){
+    const resp = await fetch(`${API_BASE}${url}`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(payload), signal });
+    return resp.json();
+  }
+
+  // 创建服务端会话：只在开始或会话失效时上传一次栅格
+  async function openSession(params, signal){
+    const data = await postJSON('/api/aftershock-session', {
+      grid: window.GridWire ? GridWire.encode(grid, 'bits') : grid,
+      start,
+      goal,
+      agent,
+      intervalTicks: params.intervalTicks,
+      severity: params.severity,
+      planner: params.planner
+    }, signal);
+    if(!data?.ok) throw new Error(data?.error || '创建会话失败');
+    sessionId = data.sessionId;
+    plannedPath = [];
+  }
+
+  function closeSession(){
+    if(!sessionId) return;
+    postJSON('/api/aftershock-close', { sessionId }).catch(()=>{});
+    sessionId = null;
+  }
+
+  // new = old[skip:skip+keep] + insert + old[len-tail:]
+  function applyPathDiff(d){
+    if(!d) return;
+    const old = plannedPath;
+    plannedPath = old.slice(d.skip, d.skip + d.keep).concat(d.insert || [], d.tail ? old.slice(old.length - d.tail) : []);
+  }
+
   // 一步
   async function stepOnce(){
-    const { intervalTicks, severity, algo, N } = getParams();
+    const { intervalTicks, severity, planner } = getParams();
     try{
-      const payload = {
-        grid,
-        start,
-        goal,
-        agent,
-        intervalTicks,
-        // 新语义参数，后端优先使用 freqPer10
-        freqPer10: N,
-        severity,
-        algo,
-        aftershockState,
-        returnDelta: true
-      };
       // 单飞中请求：如果上一个未完成，取消它
       if (aborter) { aborter.abort(); }
       aborter = new AbortController();
-      inflight = fetch(`${API_BASE}/api/dynamic-step`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(payload), signal: aborter.signal });
-      const resp = await inflight;
-      const data = await resp.json();
+      const signal = aborter.signal;
+      if(!sessionId) await openSession({ intervalTicks, severity, planner }, signal);
+      inflight = postJSON('/api/aftershock-step', { sessionId, intervalTicks, severity, planner }, signal);
+      let data = await inflight;
+      if(!data?.ok && data?.error === 'unknown session'){
+        // 会话过期或被淘汰：用当前本地栅格重新创建
+        await openSession({ intervalTicks, severity, planner }, signal);
+        data = await postJSON('/api/aftershock-step', { sessionId, intervalTicks, severity, planner }, signal);
+      }
       if(!data?.ok){ setStatus('后端返回错误'); return { done: true }; }
-      if (data.changed && Array.isArray(data.changed)){
-        // 增量更新本地网格
-        for (const ch of data.changed){
-          const r = ch.r|0, c = ch.c|0, v = ch.val|0;
-          if (grid[r] && typeof grid[r][c] !== 'undefined') grid[r][c] = v;
-        }
-      } else if (data.grid) {
-        // 兼容：服务端未开启增量时仍支持
-        grid = data.grid;
+      // 增量更新本地网格
+      for (const ch of (data.changed || [])){
+        const r = ch.r|0, c = ch.c|0, v = ch.val|0;
+        if (grid[r] && typeof grid[r][c] !== 'undefined') grid[r][c] = v;
       }
-  aftershockState = data.aftershockState || aftershockState;
-      if(data.start) start = data.start;
-      if(data.goal) goal = data.goal;
+      applyPathDiff(data.pathDiff);
+      aftershockState = { tick: data.tick };
       if(data.agent){
-        const prev = agent; agent = data.agent;
+        agent = data.agent;
         const last = trail[trail.length-1];
         if(!last || last.r !== agent.r || last.c !== agent.c){
           trail.push({ r: agent.r, c: agent.c });
@@ -163,7 +189,7 @@
       if(data.done){ setStatus('到达终点'); return { done: true }; }
       if(data.reason){ setStatus('继续（'+data.reason+'）'); } else { setStatus('运行中'); }
       return { done: false };
-    }catch(e){ console.error('dynamic-step request failed', e); setStatus('请求失败：'+(e?.message||e)); return { done: true }; }
+    }catch(e){ console.error('aftershock-step request failed', e); setStatus('请求失败：'+(e?.message||e)); return { done: true }; }
   }
 
   function loop(){
@@ -182,6 +208,8 @@
     agent = { r: start.r, c: start.c };
     trail = [ { r: start.r, c: start.c } ];
     aftershockState = null;
+    closeSession();
+    plannedPath = [];
     draw(); setStatus('已重置');
   }
 
@@ -194,10 +222,14 @@
     if(running) return; running = true; setStatus('运行中'); loop();
   });
   pauseBtn?.addEventListener('click', ()=>{
+    // 不取消在飞请求：服务端会话已推进该 tick，丢弃响应会使本地栅格失步
     running = false; if(timer){ clearTimeout(timer); timer=null; } setStatus('已暂停');
+  });
+  resetBtn?.addEventListener('click', ()=>{
+    running=false; if(timer){ clearTimeout(timer); timer=null; }
     if (aborter) { try { aborter.abort(); } catch{} finally { aborter = null; inflight = null; } }
+    reset();
   });
-  resetBtn?.addEventListener('click', ()=>{ running=false; if(timer){ clearTimeout(timer); timer=null; } reset(); });
 
   // 首次初始化
   syncIndicators();
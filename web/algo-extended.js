@@ -4,6 +4,7 @@
   const runBtn = document.getElementById('runBtn');
   const clearBtn = document.getElementById('clearBtn');
   const exportBtn = document.getElementById('exportBtn');
+  const algoSel = document.getElementById('algoSel');
 
   let grid = null; let start=null; let end=null; let size=20;
   let path = null; 
@@ -61,12 +62,17 @@
       grid,
       start: { r:start.r, c:start.c },
       end: { r:end.r, c:end.c },
-      radius: 2
+      radius: 2,
+      algo: algoSel?.value || 'extended'
     };
     try{
       const resp = await fetch('/api/solve-extended', { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(payload) });
       const data = await resp.json();
       if(!data?.ok || !Array.isArray(data.triplets)) return null;
+      // 优先使用后端给出的拐点坐标（任意角线段没有对应的方向码）
+      if(Array.isArray(data.waypoints) && data.waypoints.length>0){
+        return data.waypoints.map(p=>({ r:p[0], c:p[1] }));
+      }
       // Decode triplets to path
       const DIRS_24 = [];
       for (let dr = -2; dr <= 2; dr++) {
@@ -55,7 +55,7 @@
     if(start){ ctx.strokeStyle='#22c55e'; ctx.lineWidth=2; ctx.strokeRect(start.c*cell+1,start.r*cell+1,cell-2,cell-2); }
     if(end){ ctx.strokeStyle='#ef4444'; ctx.lineWidth=2; ctx.strokeRect(end.c*cell+1,end.r*cell+1,cell-2,cell-2); }
     // paths
-  const colors = { dijkstra:'#2563eb', astar:'#ff7f0e' };
+  const colors = { dijkstra:'#2563eb', astar:'#ff7f0e', jps:'#9333ea', biastar:'#059669', hpa:'#d97706' };
     Object.entries(paths).forEach(([algo, p])=>{
       if(!p||p.length===0) return; ctx.strokeStyle=colors[algo]||'#e2276fff'; ctx.lineWidth=3; ctx.lineJoin='round'; ctx.lineCap='round';
       ctx.beginPath(); p.forEach((pt,i)=>{ const x=(pt.c+0.5)*cell; const y=(pt.r+0.5)*cell; if(i===0) ctx.moveTo(x,y); else ctx.lineTo(x,y); }); ctx.stroke();
@@ -99,7 +99,8 @@
   async function solveBackend(algo){
     const payload={
       algo,
-      grid,
+      // 紧凑位图编码，后端直接解码为内部栅格
+      grid: window.GridWire ? GridWire.encode(grid, 'bits') : grid,
       start: { r:start.r, c:start.c },
       end: { r:end.r, c:end.c },
       safe: !!(enableSafe && enableSafe.checked)
@@ -154,7 +155,7 @@
       else { alert('未找到任何算法选项'); return; }
     }
     for(const algo of selected){
-      if(algo==='dijkstra' || algo==='astar'){
+      if(algo==='dijkstra' || algo==='astar' || algo==='jps' || algo==='biastar' || algo==='hpa'){
         const p = await solveBackend(algo);
         if(p) paths[algo]=p;
       }
@@ -0,0 +1,50 @@
+// 紧凑栅格传输格式（与 backend/wire.py 对应）：{ grid_b64, shape:[n,m], enc:'bits'|'rle' }
+// bits：行主序逐格 1 bit（高位在前）；rle：从 0 开始交替的游程长度，LEB128 变长整数
+(function(){
+  function toB64(bytes){
+    let s = '';
+    for(let i=0;i<bytes.length;i+=0x8000){ s += String.fromCharCode.apply(null, bytes.subarray(i, i+0x8000)); }
+    return btoa(s);
+  }
+  function fromB64(b64){
+    const s = atob(b64||''); const out = new Uint8Array(s.length);
+    for(let i=0;i<s.length;i++) out[i] = s.charCodeAt(i);
+    return out;
+  }
+
+  function encode(grid, enc){
+    enc = enc || 'bits';
+    const n = grid.length, m = grid[0].length, total = n*m;
+    if(enc === 'rle'){
+      const out = []; let val = 0, run = 0;
+      const push = (x)=>{ while(x >= 0x80){ out.push((x & 0x7f) | 0x80); x = Math.floor(x / 128); } out.push(x); };
+      for(let r=0;r<n;r++){ const row = grid[r]; for(let c=0;c<m;c++){ const v = row[c] ? 1 : 0; if(v===val){ run++; } else { push(run); val = v; run = 1; } } }
+      push(run);
+      return { grid_b64: toB64(Uint8Array.from(out)), shape:[n,m], enc:'rle' };
+    }
+    const bytes = new Uint8Array((total+7)>>3);
+    let i = 0;
+    for(let r=0;r<n;r++){ const row = grid[r]; for(let c=0;c<m;c++,i++){ if(row[c]) bytes[i>>3] |= 0x80 >> (i&7); } }
+    return { grid_b64: toB64(bytes), shape:[n,m], enc:'bits' };
+  }
+
+  function decode(obj){
+    if(!obj || typeof obj.grid_b64 !== 'string') return obj;
+    const n = obj.shape[0]|0, m = obj.shape[1]|0; const raw = fromB64(obj.grid_b64);
+    const grid = Array.from({length:n}, ()=>new Array(m).fill(0));
+    if(obj.enc === 'rle'){
+      let i = 0, val = 0, run = 0, shift = 0;
+      for(const b of raw){
+        run += (b & 0x7f) * Math.pow(2, shift);
+        if(b & 0x80){ shift += 7; continue; }
+        if(val){ for(let k=i;k<i+run;k++) grid[(k/m)|0][k%m] = 1; }
+        i += run; val ^= 1; run = 0; shift = 0;
+      }
+      return grid;
+    }
+    for(let i=0;i<n*m;i++){ if(raw[i>>3] & (0x80 >> (i&7))) grid[(i/m)|0][i%m] = 1; }
+    return grid;
+  }
+
+  window.GridWire = { encode, decode };
+})();